@@ -51,7 +51,10 @@ servers = [
         "name": "TTS服务端",
         "command": f'call conda activate my-neuro && cd tts-studio && python move_nltk.py && python tts_api.py -p 5000 -s tts-model/merge.pth -dr tts-model/neuro/01.wav -dt "{tts_default_text}" -dl "{tts_Language}"',
         "log_file": "logs/tts.log",
-        "port": 5000
+        "port": 5000,
+        # 端口在模型加载前就已监听, 以 /ready 返回200 作为启动完成
+        "ready_path": "/ready",
+        "ready_timeout": 600
     },
     {
         "name": "bert服务端",
@@ -128,10 +131,36 @@ def check_port_available(port):
     except OSError:
         return False
 
-def wait_for_service_start(port, service_name, timeout=30):
-    """等待服务启动"""
+def wait_for_service_ready(port, service_name, ready_path, timeout):
+    """等待服务的就绪检查接口返回200"""
+    import urllib.request
+    import urllib.error
+
+    url = f"http://localhost:{port}{ready_path}"
+    start_time = time.time()
+    while time.time() - start_time < timeout:
+        try:
+            with urllib.request.urlopen(url, timeout=2) as resp:
+                if resp.status == 200:
+                    logger.info(f"{service_name} 已就绪 ({time.time() - start_time:.1f}s)")
+                    return True
+        except urllib.error.HTTPError as e:
+            if e.code != 503:
+                logger.warning(f"{service_name} 就绪检查返回 {e.code}")
+        except Exception:
+            pass
+        time.sleep(0.5)
+
+    logger.warning(f"{service_name} 就绪超时，{url} 未返回200")
+    return False
+
+def wait_for_service_start(port, service_name, timeout=30, ready_path=None):
+    """等待服务启动; 有 ready_path 时等待就绪检查通过, 否则等待端口可连接"""
     import socket
     import time
+
+    if ready_path:
+        return wait_for_service_ready(port, service_name, ready_path, timeout)
     
     start_time = time.time()
     while time.time() - start_time < timeout:
@@ -214,7 +243,8 @@ def start_servers():
                     threading.Thread(target=tail_file, args=(log_path, server["name"]), daemon=True).start()
                     
                     # 等待服务启动
-                    if not wait_for_service_start(server["port"], server["name"]):
+                    if not wait_for_service_start(server["port"], server["name"],
+                                                  server.get("ready_timeout", 30), server.get("ready_path")):
                         logger.warning(f"{server['name']} 可能未完全启动")
 
         except Exception as e:
@@ -0,0 +1,93 @@
+"""
+T2S 解码的批量采样: 与 AR.models.utils.sample 逐行调用的结果分布一致, 整个 batch 一次完成
+
+    sampler = BatchedSampler(y, vocab_size, top_k, top_p, temperature, repetition_penalty=1.35)
+    samples, argmax = sampler(logits)  # [B, 1] int32, [B] (重复惩罚后的argmax, 用于EOS判断)
+
+计算顺序同 logits_to_probs: 重复惩罚 -> top_p -> temperature -> top_k -> softmax -> 指数噪声采样;
+已出现的token用 [B, V] 的 seen mask 表示 (每步只 scatter 新token), 代替对整个 y 的 gather/scatter,
+指数噪声写入预分配的缓冲区; 核心部分为 TorchScript 函数
+"""
+from typing import Tuple
+
+import torch
+from torch import Tensor
+
+
+@torch.jit.script
+def fused_probs(
+        logits: Tensor,
+        seen: Tensor,
+        top_k: int,
+        top_p: float,
+        temperature: float,
+        repetition_penalty: float,
+) -> Tuple[Tensor, Tensor]:
+    """
+    logits [B, V], seen [B, V] bool, 逐行等价于 logits_to_probs
+    返回 (概率 [B, V], 重复惩罚后 logits 的 argmax [B])
+    """
+    if repetition_penalty != 1.0:
+        penalized = torch.where(logits < 0, logits * repetition_penalty, logits / repetition_penalty)
+        logits = torch.where(seen, penalized, logits)
+    argmax = torch.argmax(logits, dim=-1)
+
+    if top_p < 1.0:
+        sorted_logits, sorted_indices = torch.sort(logits, dim=-1, descending=True)
+        cum_probs = torch.cumsum(torch.softmax(sorted_logits, dim=-1), dim=-1)
+        sorted_indices_to_remove = cum_probs > top_p
+        sorted_indices_to_remove[:, 0] = False  # 至少保留一个
+        indices_to_remove = sorted_indices_to_remove.scatter(1, sorted_indices, sorted_indices_to_remove)
+        logits = logits.masked_fill(indices_to_remove, float("-inf"))
+
+    logits = logits / max(temperature, 1e-5)
+
+    if top_k > 0:
+        pivot = torch.topk(logits, min(top_k, logits.size(-1)), dim=-1)[0][:, -1:]
+        logits = logits.masked_fill(logits < pivot, float("-inf"))
+
+    return torch.softmax(logits, dim=-1), argmax
+
+
+@torch.jit.script
+def fused_sample(
+        logits: Tensor,
+        seen: Tensor,
+        noise: Tensor,
+        top_k: int,
+        top_p: float,
+        temperature: float,
+        repetition_penalty: float,
+) -> Tuple[Tensor, Tensor]:
+    """noise [B, V] 为缓冲区, 原地填充指数噪声; 返回 (采样结果 [B, 1] int32, argmax [B])"""
+    probs, argmax = fused_probs(logits, seen, top_k, top_p, temperature, repetition_penalty)
+    noise.exponential_(1.0)
+    samples = torch.argmax(probs / noise, dim=-1, keepdim=True).to(dtype=torch.int)
+    return samples, argmax
+
+
+class BatchedSampler:
+    """
+    一次解码循环的采样状态: y [B, T] 为已有的token (参考音频token, 无参考时 T=0)
+    seen 与 noise 按 vocab_size 分配, 首步 logits 去掉EOS列时取前 V-1 列的视图
+    """
+
+    def __init__(self, y: Tensor, vocab_size: int, top_k: int, top_p: float, temperature: float,
+                 repetition_penalty: float = 1.35):
+        self.top_k = int(top_k)
+        self.top_p = float(top_p)
+        self.temperature = float(temperature)
+        self.repetition_penalty = float(repetition_penalty)
+        self.seen = torch.zeros((y.shape[0], vocab_size), dtype=torch.bool, device=y.device)
+        if y.shape[1] > 0:
+            self.seen.scatter_(1, y.long(), True)
+        self.noise = None
+
+    def __call__(self, logits: Tensor) -> Tuple[Tensor, Tensor]:
+        width = logits.shape[-1]
+        if self.noise is None or self.noise.dtype != logits.dtype:
+            self.noise = torch.empty(self.seen.shape, dtype=logits.dtype, device=logits.device)
+        samples, argmax = fused_sample(logits, self.seen[:, :width], self.noise[:, :width], self.top_k,
+                                       self.top_p, self.temperature, self.repetition_penalty)
+        self.seen.scatter_(1, samples.long(), True)
+        return samples, argmax
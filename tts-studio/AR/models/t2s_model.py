@@ -5,8 +5,11 @@ import random
 import numpy as np
 
 from tqdm import tqdm
-from typing import List
+from time import perf_counter
+from typing import List, Optional
 from AR.models.utils import make_pad_mask
+from AR.models.sampler import BatchedSampler
+from AR.models.watchdog import DecodeWatchdog
 from AR.models.utils import (
     topk_sampling,
     sample,
@@ -115,7 +118,7 @@ class T2SBlock:
         )
         return x, k_cache, v_cache
 
-    def decode_next_token(self, x, k_cache, v_cache):
+    def decode_next_token(self, x, k_cache, v_cache, attn_mask: Optional[torch.Tensor] = None):
         q, k, v = F.linear(x, self.qkv_w, self.qkv_b).chunk(3, dim=-1)
 
         k_cache = torch.cat([k_cache, k], dim=1)
@@ -129,7 +132,80 @@ class T2SBlock:
         k = k_cache.view(batch_size, kv_len, self.num_heads, -1).transpose(1, 2)
         v = v_cache.view(batch_size, kv_len, self.num_heads, -1).transpose(1, 2)
 
-        attn = F.scaled_dot_product_attention(q, k, v)
+        # attn_mask 与 process_prompt 一致, True 为屏蔽位置 (batch推理时的补零token)
+        if attn_mask is not None:
+            attn = F.scaled_dot_product_attention(q, k, v, ~attn_mask)
+        else:
+            attn = F.scaled_dot_product_attention(q, k, v)
+
+        attn = attn.permute(2, 0, 1, 3).reshape(batch_size, -1, self.hidden_dim)
+        attn = F.linear(attn, self.out_w, self.out_b)
+
+        x = F.layer_norm(
+            x + attn, [self.hidden_dim], self.norm_w1, self.norm_b1, self.norm_eps1
+        )
+        x = F.layer_norm(
+            x + self.mlp.forward(x),
+            [self.hidden_dim],
+            self.norm_w2,
+            self.norm_b2,
+            self.norm_eps2,
+        )
+        return x, k_cache, v_cache
+
+    def process_prompt_static(self, x, attn_mask: torch.Tensor, max_len: int):
+        """与 process_prompt 相同, 但 k/v 写入预分配的 [B, max_len, H] 缓冲区, 之后原地追加"""
+        q, k, v = F.linear(x, self.qkv_w, self.qkv_b).chunk(3, dim=-1)
+
+        batch_size = q.shape[0]
+        q_len = q.shape[1]
+        kv_len = k.shape[1]
+
+        k_cache = torch.empty((batch_size, max_len, k.shape[2]), dtype=k.dtype, device=k.device)
+        v_cache = torch.empty((batch_size, max_len, v.shape[2]), dtype=v.dtype, device=v.device)
+        k_cache[:, :kv_len] = k
+        v_cache[:, :kv_len] = v
+
+        q = q.view(batch_size, q_len, self.num_heads, -1).transpose(1, 2)
+        k = k.view(batch_size, kv_len, self.num_heads, -1).transpose(1, 2)
+        v = v.view(batch_size, kv_len, self.num_heads, -1).transpose(1, 2)
+
+        attn = F.scaled_dot_product_attention(q, k, v, ~attn_mask)
+
+        attn = attn.permute(2, 0, 1, 3).reshape(batch_size, -1, self.hidden_dim)
+        attn = F.linear(attn, self.out_w, self.out_b)
+
+        x = F.layer_norm(
+            x + attn, [self.hidden_dim], self.norm_w1, self.norm_b1, self.norm_eps1
+        )
+        x = F.layer_norm(
+            x + self.mlp.forward(x),
+            [self.hidden_dim],
+            self.norm_w2,
+            self.norm_b2,
+            self.norm_eps2,
+        )
+        return x, k_cache, v_cache
+
+    def decode_next_token_static(self, x, k_cache, v_cache, pos: int, attn_mask: Optional[torch.Tensor] = None):
+        """新token的k/v原地写入缓冲区第pos位, 只在 [:pos+1] 的切片上做attention, 不再每步torch.cat"""
+        q, k, v = F.linear(x, self.qkv_w, self.qkv_b).chunk(3, dim=-1)
+
+        k_cache[:, pos:pos + 1] = k
+        v_cache[:, pos:pos + 1] = v
+        kv_len = pos + 1
+
+        batch_size = q.shape[0]
+        q_len = q.shape[1]
+
+        q = q.view(batch_size, q_len, self.num_heads, -1).transpose(1, 2)
+        k = k_cache[:, :kv_len].view(batch_size, kv_len, self.num_heads, -1).transpose(1, 2)
+        v = v_cache[:, :kv_len].view(batch_size, kv_len, self.num_heads, -1).transpose(1, 2)
+
+        if attn_mask is not None:
+            attn = F.scaled_dot_product_attention(q, k, v, ~attn_mask)
+        else:
+            attn = F.scaled_dot_product_attention(q, k, v)
 
         attn = attn.permute(2, 0, 1, 3).reshape(batch_size, -1, self.hidden_dim)
         attn = F.linear(attn, self.out_w, self.out_b)
@@ -164,10 +240,29 @@ class T2STransformer:
         return x, k_cache, v_cache
 
     def decode_next_token(
-            self, x, k_cache: List[torch.Tensor], v_cache: List[torch.Tensor]
+            self, x, k_cache: List[torch.Tensor], v_cache: List[torch.Tensor],
+            attn_mask: Optional[torch.Tensor] = None
+    ):
+        for i in range(self.num_blocks):
+            x, k_cache[i], v_cache[i] = self.blocks[i].decode_next_token(x, k_cache[i], v_cache[i], attn_mask)
+        return x, k_cache, v_cache
+
+    def process_prompt_static(
+            self, x, attn_mask: torch.Tensor, max_len: int):
+        k_cache: List[torch.Tensor] = []
+        v_cache: List[torch.Tensor] = []
+        for i in range(self.num_blocks):
+            x, k_cache_, v_cache_ = self.blocks[i].process_prompt_static(x, attn_mask, max_len)
+            k_cache.append(k_cache_)
+            v_cache.append(v_cache_)
+        return x, k_cache, v_cache
+
+    def decode_next_token_static(
+            self, x, k_cache: List[torch.Tensor], v_cache: List[torch.Tensor], pos: int,
+            attn_mask: Optional[torch.Tensor] = None
     ):
         for i in range(self.num_blocks):
-            x, k_cache[i], v_cache[i] = self.blocks[i].decode_next_token(x, k_cache[i], v_cache[i])
+            x, k_cache[i], v_cache[i] = self.blocks[i].decode_next_token_static(x, k_cache[i], v_cache[i], pos, attn_mask)
         return x, k_cache, v_cache
 
 
@@ -488,6 +583,38 @@ class Text2SemanticDecoder(nn.Module):
         # 错位
         return targets[:, :-1], targets[:, 1:]
 
+    @staticmethod
+    def _max_decode_steps(early_stop_num: int) -> int:
+        # 解码循环最多1500步, early_stop_num 更小时按其上限预分配kv缓冲区
+        if early_stop_num != -1:
+            return min(1500, early_stop_num + 2)
+        return 1500
+
+    @staticmethod
+    def _fill_decode_info(decode_info: dict, t0: float, t_prompt: Optional[float], stop_idx: List[int],
+                          stop_reasons: List[str], paused: float = 0.0):
+        """
+        解码统计: prompt_seconds 为文本编码+prompt处理+第一步采样, decode_seconds 为其后的逐token解码,
+        tokens 为解码步数 (含结束token), 第一步即结束的句子计入 bad_zeros (同 infer 的 bad zero prediction)
+        """
+        t_end = perf_counter() - paused
+        if t_prompt is None:
+            t_prompt = t_end
+        decode_info["prompt_seconds"] = t_prompt - t0
+        decode_info["decode_seconds"] = t_end - t_prompt
+        decode_info["tokens"] = sum(i + 1 for i in stop_idx)
+        decode_info["stop_reason"] = stop_reasons[0]
+        decode_info["stop_reasons"] = list(stop_reasons)
+        decode_info["early_stops"] = stop_reasons.count("early_stop")
+        decode_info["bad_zeros"] = sum(1 for i in stop_idx if i == 0)
+        decode_info["trimmed_tokens"] = 0
+
+    @staticmethod
+    def _start_watch(watchdog: Optional[DecodeWatchdog], phoneme_len: int):
+        if watchdog is None or not watchdog.enabled:
+            return None
+        return watchdog.watch(phoneme_len)
+
     def infer_panel(
             self,
             x,  #####全部文本token
@@ -498,7 +625,53 @@ class Text2SemanticDecoder(nn.Module):
             top_p: int = 100,
             early_stop_num: int = -1,
             temperature: float = 1.0,
+            static_kv_cache: bool = True,
+            decode_info: Optional[dict] = None,
+            watchdog: Optional[DecodeWatchdog] = None,
+            fused_sampling: bool = True,
     ):
+        """
+        decode_info 不为 None 时写入本次解码的统计 (见 _fill_decode_info):
+        prompt_seconds / decode_seconds / tokens / stop_reason(s) / early_stops / bad_zeros / trimmed_tokens
+        watchdog 按全部音素数 (参考文本+目标文本) 限制token数并检测循环, 触发时提前结束,
+        stop_reason 为 max_tokens / loop; 循环时丢弃重复段只保留一个周期 (trimmed_tokens 为丢弃的token数)
+        fused_sampling 为 True 时用 BatchedSampler 一次完成采样与EOS判断用的argmax, 否则逐步调用 sample
+        解码循环只在 infer_panel_generator 中实现, 这里一次取出全部token; 返回 (参考音频token+生成的语义token, 生成的token数)
+        """
+        pred_semantic = torch.concat([tokens for tokens, is_last in self.infer_panel_generator(
+            x, x_lens, prompts, bert_feature, top_k=top_k, top_p=top_p, early_stop_num=early_stop_num,
+            temperature=temperature, chunk_length=None, static_kv_cache=static_kv_cache,
+            decode_info=decode_info, watchdog=watchdog, fused_sampling=fused_sampling)], dim=1)
+        if prompts is None:
+            return pred_semantic, 0
+        return torch.concat([prompts, pred_semantic], dim=1), pred_semantic.shape[1]
+
+    @torch.no_grad()
+    def infer_panel_generator(
+            self,
+            x,  #####全部文本token
+            x_lens,
+            prompts,  ####参考音频token
+            bert_feature,
+            top_k: int = -100,
+            top_p: int = 100,
+            early_stop_num: int = -1,
+            temperature: float = 1.0,
+            chunk_length: Optional[int] = 24,
+            static_kv_cache: bool = True,
+            decode_info: Optional[dict] = None,
+            watchdog: Optional[DecodeWatchdog] = None,
+            fused_sampling: bool = True,
+    ):
+        """
+        单句解码循环: 每生成 chunk_length 个语义token就 yield 一次 (tokens [1, n], is_last),
+        chunk_length 为 None 时只在结束时 yield 一次 (infer_panel 即如此调用)
+        拼接全部输出即 infer_panel 返回的 y[:, -idx:] (不含首个token与结束token)
+        decode_info 在最后一次 yield 前写入, 计时不含生成器暂停 (下游解码音频) 的时间
+        watchdog / fused_sampling 见 infer_panel; 检测到循环时只能丢弃尚未输出的重复token
+        """
+        t0 = perf_counter()
+        paused = 0.0
         x = self.ar_text_embedding(x)
         x = x + self.bert_proj(bert_feature.transpose(1, 2))
         x = self.ar_text_position(x)
@@ -509,7 +682,9 @@ class Text2SemanticDecoder(nn.Module):
         x_len = x.shape[1]
         x_attn_mask = torch.zeros((x_len, x_len), dtype=torch.bool)
         stop = False
-        # print(1111111,self.num_layers)
+        stop_reason = "max_steps"
+        t_prompt = None
+        watch = self._start_watch(watchdog, x_len)
 
         k_cache = None
         v_cache = None
@@ -522,13 +697,10 @@ class Text2SemanticDecoder(nn.Module):
             xy_pos = torch.concat([x, y_pos], dim=1)
             ref_free = False
         else:
-            y_emb = None
             y_len = 0
             prefix_len = 0
-            y_pos = None
             xy_pos = x
             y = torch.zeros(x.shape[0], 0, dtype=torch.int, device=x.device)
-            prompts = y
             ref_free = True
 
         x_attn_mask_pad = F.pad(
@@ -544,10 +716,20 @@ class Text2SemanticDecoder(nn.Module):
         xy_attn_mask = torch.concat([x_attn_mask_pad, y_attn_mask], dim=0).to(
             x.device
         )
+        kv_capacity = x_len + y_len + self._max_decode_steps(early_stop_num)
+        sampler = BatchedSampler(y, self.vocab_size, top_k, top_p, temperature) if fused_sampling else None
 
+        pending = []
         for idx in tqdm(range(1500)):
             if xy_attn_mask is not None:
-                xy_dec, k_cache, v_cache = self.t2s_transformer.process_prompt(xy_pos, xy_attn_mask)
+                if static_kv_cache:
+                    xy_dec, k_cache, v_cache = self.t2s_transformer.process_prompt_static(xy_pos, xy_attn_mask, kv_capacity)
+                else:
+                    xy_dec, k_cache, v_cache = self.t2s_transformer.process_prompt(xy_pos, xy_attn_mask)
+            elif static_kv_cache:
+                xy_dec, k_cache, v_cache = self.t2s_transformer.decode_next_token_static(
+                    xy_pos, k_cache, v_cache, x_len + y_len + idx - 1
+                )
             else:
                 xy_dec, k_cache, v_cache = self.t2s_transformer.decode_next_token(xy_pos, k_cache, v_cache)
 
@@ -558,29 +740,215 @@ class Text2SemanticDecoder(nn.Module):
             if idx == 0:
                 xy_attn_mask = None
                 logits = logits[:, :-1]
-            samples = sample(
-                logits[0], y, top_k=top_k, top_p=top_p, repetition_penalty=1.35, temperature=temperature
-            )[0].unsqueeze(0)
+            if sampler is not None:
+                samples, argmax = sampler(logits)
+            else:
+                samples = sample(
+                    logits[0], y, top_k=top_k, top_p=top_p, repetition_penalty=1.35, temperature=temperature
+                )[0].unsqueeze(0)
+                # sample 原地对 logits 做了重复惩罚
+                argmax = torch.argmax(logits, dim=-1)
 
             y = torch.concat([y, samples], dim=1)
 
             if early_stop_num != -1 and (y.shape[1] - prefix_len) > early_stop_num:
                 print("use early stop num:", early_stop_num)
                 stop = True
+                stop_reason = "early_stop"
 
-            if torch.argmax(logits, dim=-1)[0] == self.EOS or samples[0, 0] == self.EOS:
+            if argmax[0] == self.EOS or samples[0, 0] == self.EOS:
+                if not stop:
+                    stop_reason = "eos"
                 stop = True
+            if not stop and watch is not None:
+                reason = watch.step(int(samples[0, 0]))
+                if reason is not None:
+                    print(f"T2S decode watchdog: {reason}")
+                    stop = True
+                    stop_reason = reason
             if stop:
-                if y.shape[1] == 0:
-                    y = torch.concat([y, torch.zeros_like(samples)], dim=1)
-                    print("bad zero prediction")
                 print(f"T2S Decoding EOS [{prefix_len} -> {y.shape[1]}]")
                 break
+            if idx == 0:
+                t_prompt = perf_counter()
+
+            # 与 infer_panel 的截取方式一致, 有参考音频时丢弃第一个token
+            if idx > 0 or ref_free:
+                pending.append(samples)
+            if chunk_length is not None and len(pending) >= chunk_length:
+                t_yield = perf_counter()
+                yield torch.concat(pending, dim=1), False
+                paused += perf_counter() - t_yield
+                pending = []
+
+            ####################### update next step ###################################
+            y_emb = self.ar_audio_embedding(y[:, -1:])
+            xy_pos = y_emb * self.ar_audio_position.x_scale + self.ar_audio_position.alpha * self.ar_audio_position.pe[:, y_len + idx].to(dtype=y_emb.dtype,device=y_emb.device)
+
+        if decode_info is not None:
+            self._fill_decode_info(decode_info, t0, t_prompt, [idx], [stop_reason], paused)
+        if stop_reason == "loop":
+            # 触发循环的token本身未加入 pending
+            trim = min(watch.loop_tokens - 1, len(pending))
+            pending = pending[:len(pending) - trim]
+            if decode_info is not None:
+                decode_info["trimmed_tokens"] = trim
+        if pending:
+            yield torch.concat(pending, dim=1), True
+        else:
+            yield y[:, :0], True
+
+    def infer_panel_batched(
+            self,
+            x: List[torch.LongTensor],  #####每句的全部文本token (参考文本+目标文本), 1维
+            x_lens: torch.LongTensor,
+            prompts: torch.LongTensor,  ####参考音频token, 各句共用 [1, T]
+            bert_feature: List[torch.Tensor],  #####每句的bert特征 [1024, L]
+            top_k: int = -100,
+            top_p: int = 100,
+            early_stop_num: int = -1,
+            temperature: float = 1.0,
+            static_kv_cache: bool = True,
+            decode_info: Optional[dict] = None,
+            watchdog: Optional[DecodeWatchdog] = None,
+            fused_sampling: bool = True,
+    ):
+        """
+        多句一起解码: 文本左侧补零对齐, 每行单独的padding mask与EOS判断,
+        所有句子共享一次 KV cache 解码循环
+        返回 (每句的y列表, 每句的idx列表), 与 infer_panel 的返回值逐句对应
+        decode_info 的 tokens 为各句解码步数之和, stop_reasons 为每句的结束原因; watchdog 对每句单独计数
+        fused_sampling 为 True 时整个batch一次采样, 否则逐句调用 sample
+        """
+        t0 = perf_counter()
+        # 每句单独做embedding和位置编码, 再左侧补零对齐, 保证位置编码与单句推理一致
+        x_items = []
+        for x_item, bert_item in zip(x, bert_feature):
+            x_item = self.ar_text_embedding(x_item.unsqueeze(0))
+            x_item = x_item + self.bert_proj(bert_item.transpose(0, 1).unsqueeze(0))
+            x_item = self.ar_text_position(x_item).squeeze(0)
+            x_items.append(x_item)
+        bsz = len(x_items)
+        x_len = max(item.shape[0] for item in x_items)
+        pad_lens = [x_len - item.shape[0] for item in x_items]
+        x = torch.stack([F.pad(item, (0, 0, pad, 0), value=0) for item, pad in zip(x_items, pad_lens)])
+        x_padding_mask = torch.arange(x_len, device=x.device).unsqueeze(0) < torch.tensor(pad_lens, device=x.device).unsqueeze(1)
+
+        # AR Decoder
+        if prompts is not None:
+            y = prompts.expand(bsz, -1)
+            y_emb = self.ar_audio_embedding(y)
+            y_len = y_emb.shape[1]
+            prefix_len = y.shape[1]
+            y_pos = self.ar_audio_position(y_emb)
+            xy_pos = torch.concat([x, y_pos], dim=1)
+            ref_free = False
+        else:
+            y_len = 0
+            prefix_len = 0
+            xy_pos = x
+            y = torch.zeros(bsz, 0, dtype=torch.int, device=x.device)
+            ref_free = True
+
+        x_attn_mask_pad = F.pad(
+            torch.zeros((x_len, x_len), dtype=torch.bool),
+            (0, y_len),  ###xx的纯0扩展到xx纯0+xy纯1，(x,x+y)
+            value=True,
+        )
+        y_attn_mask = F.pad(  ###yy的右上1扩展到左边xy的0,(y,x+y)
+            torch.triu(torch.ones(y_len, y_len, dtype=torch.bool), diagonal=1),
+            (x_len, 0),
+            value=False,
+        )
+        xy_attn_mask = torch.concat([x_attn_mask_pad, y_attn_mask], dim=0).to(x.device)
+        # 补零的文本token对所有query屏蔽, [B, 1, 1, S]
+        key_padding_mask = F.pad(x_padding_mask, (0, y_len), value=False).view(bsz, 1, 1, -1)
+        xy_attn_mask = xy_attn_mask.view(1, 1, x_len + y_len, x_len + y_len).logical_or(key_padding_mask)
+        # 解码阶段的mask, 按当前kv长度切片, 新生成的token都可见
+        decode_attn_mask = F.pad(key_padding_mask, (0, 1500), value=False)
+        kv_capacity = x_len + y_len + self._max_decode_steps(early_stop_num)
+        sampler = BatchedSampler(y, self.vocab_size, top_k, top_p, temperature) if fused_sampling else None
+
+        k_cache = None
+        v_cache = None
+        stop_idx = [None] * bsz
+        stop_reasons = ["max_steps"] * bsz
+        t_prompt = None
+        watches = [self._start_watch(watchdog, x_len - pad) for pad in pad_lens]
+        if all(watch is None for watch in watches):
+            watches = None
+        for idx in tqdm(range(1500)):
+            if idx == 0:
+                if static_kv_cache:
+                    xy_dec, k_cache, v_cache = self.t2s_transformer.process_prompt_static(xy_pos, xy_attn_mask, kv_capacity)
+                else:
+                    xy_dec, k_cache, v_cache = self.t2s_transformer.process_prompt(xy_pos, xy_attn_mask)
+            elif static_kv_cache:
+                xy_dec, k_cache, v_cache = self.t2s_transformer.decode_next_token_static(
+                    xy_pos, k_cache, v_cache, x_len + y_len + idx - 1, decode_attn_mask[:, :, :, :x_len + y_len + idx]
+                )
+            else:
+                xy_dec, k_cache, v_cache = self.t2s_transformer.decode_next_token(
+                    xy_pos, k_cache, v_cache, decode_attn_mask[:, :, :, :x_len + y_len + idx]
+                )
+
+            logits = self.ar_predict_layer(
+                xy_dec[:, -1]
+            )
+
+            if idx == 0:
+                logits = logits[:, :-1]
+            if sampler is not None:
+                samples, argmax = sampler(logits)
+            else:
+                samples = torch.stack([
+                    sample(
+                        logits[i], y[i], top_k=top_k, top_p=top_p, repetition_penalty=1.35, temperature=temperature
+                    )[0]
+                    for i in range(bsz)
+                ])
+                argmax = torch.argmax(logits, dim=-1)
+
+            y = torch.concat([y, samples], dim=1)
+
+            eos = ((argmax == self.EOS) | (samples[:, 0] == self.EOS)).tolist()
+            early_stop = early_stop_num != -1 and (y.shape[1] - prefix_len) > early_stop_num
+            if early_stop:
+                print("use early stop num:", early_stop_num)
+            tokens = samples[:, 0].tolist() if watches is not None else None
+            for i in range(bsz):
+                if stop_idx[i] is None and (eos[i] or early_stop):
+                    stop_idx[i] = idx
+                    stop_reasons[i] = "early_stop" if early_stop else "eos"
+                    print(f"T2S Decoding EOS [batch {i}] [{prefix_len} -> {prefix_len + idx + 1}]")
+                elif stop_idx[i] is None and watches is not None:
+                    reason = watches[i].step(tokens[i])
+                    if reason is not None:
+                        stop_idx[i] = idx
+                        stop_reasons[i] = reason
+                        print(f"T2S decode watchdog [batch {i}]: {reason}")
+            if all(i is not None for i in stop_idx):
+                break
+            if idx == 0:
+                t_prompt = perf_counter()
 
             ####################### update next step ###################################
             y_emb = self.ar_audio_embedding(y[:, -1:])
             xy_pos = y_emb * self.ar_audio_position.x_scale + self.ar_audio_position.alpha * self.ar_audio_position.pe[:, y_len + idx].to(dtype=y_emb.dtype,device=y_emb.device)
 
+        stop_idx = [idx if i is None else i for i in stop_idx]
+        if decode_info is not None:
+            self._fill_decode_info(decode_info, t0, t_prompt, stop_idx, stop_reasons)
+        if watches is not None and not ref_free:
+            # 循环的句子丢弃重复段只保留一个周期; y_list 不含 stop_idx 处的token, 因此少截一个
+            for i in range(bsz):
+                if stop_reasons[i] == "loop":
+                    trim = min(watches[i].loop_tokens, stop_idx[i] - 1)
+                    if trim > 0:
+                        stop_idx[i] -= trim - 1
+                        if decode_info is not None:
+                            decode_info["trimmed_tokens"] += trim
+        y_list = [y[i:i + 1, :prefix_len + stop_idx[i]] for i in range(bsz)]
         if ref_free:
-            return y[:, :-1], 0
-        return y[:, :-1], idx - 1
\ No newline at end of file
+            return y_list, [0] * bsz
+        return y_list, [i - 1 for i in stop_idx]
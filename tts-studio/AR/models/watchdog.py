@@ -0,0 +1,82 @@
+"""
+T2S 解码看门狗: 模型迟迟不输出EOS时提前结束, 限制单句解码的最坏耗时
+
+    watchdog = DecodeWatchdog(tokens_per_phoneme=12, max_period=40)  # tts_api 中默认关闭, 由参数开启
+    watch = watchdog.watch(all_phoneme_len)
+    for ...:
+        reason = watch.step(token)  # None / "max_tokens" / "loop"
+
+max_tokens: 生成的token数超过 max(min_tokens, tokens_per_phoneme * 音素数), 音素数为参考文本+目标文本
+loop: 末尾出现周期不超过 max_period 的重复, 且重复部分至少 loop_repeats 个周期, min_loop_tokens 个token;
+      此时 watch.loop_tokens 为可以丢弃的重复token数 (只保留一个周期);
+      重复段全是同一个token (周期1, 如长停顿/拖长音) 时要连续 min_repeat_tokens 个才算循环
+"""
+from typing import Optional
+
+# 50Hz 语义token: 正常语速约 4~6 token/音素, 音素数含参考文本, 留有较大余量
+DEFAULT_TOKENS_PER_PHONEME = 12.0
+DEFAULT_MIN_TOKENS = 75
+DEFAULT_MAX_PERIOD = 40
+DEFAULT_LOOP_REPEATS = 3
+DEFAULT_MIN_LOOP_TOKENS = 50
+# 同一token连续重复: 50Hz 下 250 个约5秒, 正常的停顿与拖长音远短于此
+DEFAULT_MIN_REPEAT_TOKENS = 250
+
+
+class DecodeWatchdog:
+    """看门狗配置, tokens_per_phoneme / max_period 为0时关闭对应检查"""
+
+    def __init__(self, tokens_per_phoneme: float = DEFAULT_TOKENS_PER_PHONEME, min_tokens: int = DEFAULT_MIN_TOKENS,
+                 max_period: int = DEFAULT_MAX_PERIOD, loop_repeats: int = DEFAULT_LOOP_REPEATS,
+                 min_loop_tokens: int = DEFAULT_MIN_LOOP_TOKENS, min_repeat_tokens: int = DEFAULT_MIN_REPEAT_TOKENS):
+        self.tokens_per_phoneme = tokens_per_phoneme
+        self.min_tokens = min_tokens
+        self.max_period = max_period
+        self.loop_repeats = loop_repeats
+        self.min_loop_tokens = min_loop_tokens
+        self.min_repeat_tokens = min_repeat_tokens
+
+    @property
+    def enabled(self) -> bool:
+        return self.tokens_per_phoneme > 0 or self.max_period > 0
+
+    def max_tokens(self, phoneme_len: int) -> Optional[int]:
+        if self.tokens_per_phoneme <= 0:
+            return None
+        return max(self.min_tokens, int(self.tokens_per_phoneme * phoneme_len))
+
+    def watch(self, phoneme_len: int) -> "DecodeWatch":
+        return DecodeWatch(self, phoneme_len)
+
+
+class DecodeWatch:
+    """
+    单句解码的看门狗状态, 每生成一个token调用一次 step
+    runs[p] 为末尾连续满足 token[i] == token[i - p] 的长度, 末尾周期为 p 的重复段长度即 runs[p] + p,
+    每步只需 O(max_period) 次比较
+    """
+
+    def __init__(self, watchdog: DecodeWatchdog, phoneme_len: int):
+        self.watchdog = watchdog
+        self.limit = watchdog.max_tokens(phoneme_len)
+        self.tokens = []
+        self.runs = [0] * (watchdog.max_period + 1)
+        self.loop_tokens = 0
+
+    def step(self, token: int) -> Optional[str]:
+        tokens = self.tokens
+        tokens.append(token)
+        n = len(tokens)
+        if self.limit is not None and n >= self.limit:
+            return "max_tokens"
+        watchdog = self.watchdog
+        for p in range(1, min(watchdog.max_period, n - 1) + 1):
+            self.runs[p] = self.runs[p] + 1 if token == tokens[n - 1 - p] else 0
+            span = self.runs[p] + p
+            if self.runs[p] and span >= watchdog.loop_repeats * p and span >= watchdog.min_loop_tokens:
+                # runs[1] + 1 为末尾同一token连续出现的次数, 重复段不长于它即整段是同一个token
+                if span <= self.runs[1] + 1 < watchdog.min_repeat_tokens:
+                    continue
+                self.loop_tokens = self.runs[p]
+                return "loop"
+        return None
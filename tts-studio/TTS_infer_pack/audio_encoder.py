@@ -0,0 +1,222 @@
+"""
+按请求创建的流式音频编码器: 一个请求从头到尾只用一个编码器实例,
+ogg 共用同一个 libsndfile 编码状态, aac 共用同一个 ffmpeg 进程, 输出为一条连续的音频流
+
+接口: write(int16 PCM) -> 目前已编码好的字节, close() -> 剩余字节, abort() 中途放弃
+"""
+import subprocess
+import threading
+
+import soundfile as sf
+
+MEDIA_TYPES = ("wav", "ogg", "aac", "pcm_s16le")
+
+# libsndfile 一次写入过多帧时可能栈溢出 (https://github.com/RVC-Boss/GPT-SoVITS/issues/1199,
+# https://github.com/libsndfile/libsndfile/issues/1023), 以前靠开16MB栈的线程规避, 这里改为分块写入
+OGG_BLOCK_FRAMES = 8192
+
+# 流式wav文件头中的长度字段, 表示长度未知
+WAV_UNKNOWN_SIZE = 0xFFFFFFFF
+
+
+def content_type(media_type: str) -> str:
+    if media_type == "pcm_s16le":
+        return "audio/pcm"
+    return "audio/" + media_type
+
+
+def stream_headers(media_type: str, rate: int) -> dict:
+    """裸PCM没有文件头, 采样率等信息放在响应头中"""
+    if media_type == "pcm_s16le":
+        return {"X-Sample-Rate": str(rate), "X-Channels": "1", "X-Sample-Format": "s16le"}
+    return {}
+
+
+class _StreamBuffer:
+    """只追加的文件对象, 供 soundfile 写入; 已写出的数据可随时取走, tell 为累计写出的字节数"""
+
+    def __init__(self):
+        self._chunks = []
+        self._pos = 0
+
+    def write(self, data):
+        data = bytes(data)
+        self._chunks.append(data)
+        self._pos += len(data)
+        return len(data)
+
+    def read(self, size=-1):
+        return b""
+
+    def seek(self, offset, whence=0):
+        # ogg 只顺序写, 不会回头改写; libsndfile 取文件长度时的 seek 均落在当前位置
+        return self._pos
+
+    def tell(self):
+        return self._pos
+
+    def take(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+class PcmEncoder:
+    def __init__(self, rate: int):
+        self.rate = rate
+
+    def write(self, data) -> bytes:
+        return data.tobytes()
+
+    def close(self) -> bytes:
+        return b""
+
+    def abort(self):
+        pass
+
+
+class WavEncoder:
+    """wav 需要在文件头写入总长度, 先缓存全部PCM, close 时一次性输出"""
+
+    def __init__(self, rate: int):
+        self.rate = rate
+        self._chunks = []
+
+    def write(self, data) -> bytes:
+        self._chunks.append(data.tobytes())
+        return b""
+
+    def close(self) -> bytes:
+        pcm = b"".join(self._chunks)
+        self._chunks.clear()
+        return wav_header(self.rate, len(pcm)) + pcm
+
+    def abort(self):
+        self._chunks.clear()
+
+
+class WavStreamEncoder:
+    """
+    流式wav: 先发送长度未知的文件头 (RIFF/data 长度填 0xFFFFFFFF), 之后直接输出PCM,
+    客户端收到文件头即可开始播放, 按连接结束判断音频结束
+    """
+
+    def __init__(self, rate: int):
+        self.rate = rate
+        self._header_sent = False
+
+    def _header(self) -> bytes:
+        if self._header_sent:
+            return b""
+        self._header_sent = True
+        return wav_header(self.rate, WAV_UNKNOWN_SIZE)
+
+    def write(self, data) -> bytes:
+        return self._header() + data.tobytes()
+
+    def close(self) -> bytes:
+        # 没有任何音频时也要输出文件头, 保证响应是合法的wav
+        return self._header()
+
+    def abort(self):
+        pass
+
+
+def wav_header(rate: int, data_size: int, channels: int = 1, sample_width: int = 2) -> bytes:
+    """16bit PCM 的 RIFF/WAVE 文件头, data_size 为 WAV_UNKNOWN_SIZE 时表示长度未知 (流式)"""
+    byte_rate = rate * channels * sample_width
+    riff_size = min(36 + data_size, WAV_UNKNOWN_SIZE)
+    return b"".join([
+        b"RIFF", riff_size.to_bytes(4, "little"), b"WAVE",
+        b"fmt ", (16).to_bytes(4, "little"),
+        (1).to_bytes(2, "little"), channels.to_bytes(2, "little"),
+        rate.to_bytes(4, "little"), byte_rate.to_bytes(4, "little"),
+        (channels * sample_width).to_bytes(2, "little"), (sample_width * 8).to_bytes(2, "little"),
+        b"data", min(data_size, WAV_UNKNOWN_SIZE).to_bytes(4, "little"),
+    ])
+
+
+class OggEncoder:
+    def __init__(self, rate: int):
+        self.rate = rate
+        self._buffer = _StreamBuffer()
+        self._file = sf.SoundFile(self._buffer, mode="w", samplerate=rate, channels=1, format="ogg")
+
+    def write(self, data) -> bytes:
+        for start in range(0, len(data), OGG_BLOCK_FRAMES):
+            self._file.write(data[start:start + OGG_BLOCK_FRAMES])
+        return self._buffer.take()
+
+    def close(self) -> bytes:
+        self._file.close()
+        return self._buffer.take()
+
+    def abort(self):
+        if not self._file.closed:
+            self._file.close()
+
+
+class AacEncoder:
+    """一个请求一个 ffmpeg 进程, PCM 从 stdin 持续写入, 读取线程收集 stdout 上的 ADTS 数据"""
+
+    def __init__(self, rate: int, bitrate: str = "192k"):
+        self.rate = rate
+        self.process = subprocess.Popen([
+            'ffmpeg',
+            '-f', 's16le',  # 输入16位有符号小端整数PCM
+            '-ar', str(rate),  # 设置采样率
+            '-ac', '1',  # 单声道
+            '-i', 'pipe:0',  # 从管道读取输入
+            '-c:a', 'aac',  # 音频编码器为AAC
+            '-b:a', bitrate,  # 比特率
+            '-vn',  # 不包含视频
+            '-f', 'adts',  # 输出AAC数据流格式
+            'pipe:1'  # 将输出写入管道
+        ], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        self._chunks = []
+        self._lock = threading.Lock()
+        self._reader = threading.Thread(target=self._read, name="aac-encoder-reader", daemon=True)
+        self._reader.start()
+
+    def _read(self):
+        while True:
+            data = self.process.stdout.read1(65536)
+            if not data:
+                return
+            with self._lock:
+                self._chunks.append(data)
+
+    def _take(self) -> bytes:
+        with self._lock:
+            data = b"".join(self._chunks)
+            self._chunks.clear()
+        return data
+
+    def write(self, data) -> bytes:
+        self.process.stdin.write(data.tobytes())
+        self.process.stdin.flush()
+        return self._take()
+
+    def close(self) -> bytes:
+        self.process.stdin.close()
+        self._reader.join()
+        self.process.wait()
+        return self._take()
+
+    def abort(self):
+        if self.process.poll() is None:
+            self.process.kill()
+            self.process.wait()
+
+
+def create_encoder(media_type: str, rate: int, streaming: bool = False):
+    """streaming 为 True 时 wav 先发文件头再逐段输出PCM, 否则整段缓存后一次输出"""
+    if media_type == "ogg":
+        return OggEncoder(rate)
+    if media_type == "aac":
+        return AacEncoder(rate)
+    if media_type == "pcm_s16le":
+        return PcmEncoder(rate)
+    if streaming:
+        return WavStreamEncoder(rate)
+    return WavEncoder(rate)
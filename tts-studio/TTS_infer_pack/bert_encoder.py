@@ -0,0 +1,28 @@
+"""
+中文bert特征的 tokenizer + 前向, 全部推理工作线程共用一份
+
+    encoder = BertEncoder(tokenizer, bert_model, device)
+    with torch.no_grad():
+        hidden = encoder.hidden_states(["你好", "今天天气不错"])  # [B, T, 1024], CPU
+
+Hugging Face 的 fast tokenizer 不是线程安全的, 多个线程同时调用会抛出 RuntimeError: Already borrowed;
+分词与前向在同一把锁内串行, -w > 1 时各工作线程的bert前向排队执行 (bert 前向相对T2S解码很短)
+"""
+import threading
+
+
+class BertEncoder:
+    def __init__(self, tokenizer, model, device):
+        self.tokenizer = tokenizer
+        self.model = model
+        self.device = device
+        self._lock = threading.Lock()
+
+    def hidden_states(self, texts, layer=-3):
+        """一批文本 (padding对齐) 第 layer 层的隐状态, 搬回CPU; no_grad 由调用方负责 (按线程生效)"""
+        with self._lock:
+            inputs = self.tokenizer(texts, padding=True, return_tensors="pt")
+            for k in inputs:
+                inputs[k] = inputs[k].to(self.device)  #####输入是long不用管精度问题，精度随bert_model
+            res = self.model(**inputs, output_hidden_states=True)
+            return res["hidden_states"][layer].cpu()
@@ -0,0 +1,99 @@
+"""
+相同请求合并 (single-flight): 参数完全相同的请求在前一个仍在合成时到达, 不再重复推理, 而是订阅同一个输出流
+
+    stream, joined = coalescer.subscribe(key, lambda: scheduler.submit(synthesize))
+    async for chunk in stream:  # 后加入的订阅者先收到已产出的全部音频块, 再与其他订阅者同步接收
+        ...
+
+一个任务的音频块由事件循环中的一个协程取出并保存, 各订阅者按自己的进度读取;
+某个订阅者断开不影响其他订阅者, 全部订阅者都断开后才取消推理任务; 任务结束后从表中移除, 之后的请求重新推理
+所有方法都在事件循环线程中调用, 不需要加锁
+"""
+import asyncio
+
+from TTS_infer_pack.metrics import Counter, Gauge
+
+
+class _Flight:
+    """一个正在进行的推理任务及其全部订阅者共享的输出"""
+
+    def __init__(self, job):
+        self.job = job
+        self.chunks = []  # 已产出的音频块, 供后加入的订阅者补读
+        self.done = False
+        self.error = None
+        self.subscribers = 0
+        self.updated = asyncio.Event()
+        self.task = None
+
+    async def pump(self):
+        try:
+            async for chunk in self.job.stream():
+                self.chunks.append(chunk)
+                self._notify()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
+            self._notify()
+
+    def _notify(self):
+        # 唤醒当前等待的订阅者, 换一个新的 Event 给之后的等待
+        updated, self.updated = self.updated, asyncio.Event()
+        updated.set()
+
+
+class RequestCoalescer:
+    def __init__(self):
+        self.flights = {}  # key -> _Flight
+        self.coalesced = Counter("tts_coalesced_requests_total", "与进行中的相同请求合并, 未单独推理的请求数")
+        Gauge("tts_inflight_flights", "可被合并的进行中推理任务数", function=lambda: len(self.flights))
+
+    def subscribe(self, key, submit):
+        """
+        返回 (音频块异步生成器, 是否合并到已有任务); 没有进行中的相同请求时调用 submit() 提交新任务,
+        submit 抛出的异常 (如 SchedulerFull) 原样抛出
+        """
+        flight = self.flights.get(key)
+        joined = flight is not None
+        if joined:
+            self.coalesced.inc()
+        else:
+            flight = _Flight(submit())
+            flight.task = asyncio.get_running_loop().create_task(self._run(key, flight))
+            self.flights[key] = flight
+        flight.subscribers += 1
+        return self._stream(key, flight), joined
+
+    async def _run(self, key, flight):
+        try:
+            await flight.pump()
+        finally:
+            self._remove(key, flight)
+
+    def _remove(self, key, flight):
+        if self.flights.get(key) is flight:
+            del self.flights[key]
+
+    async def _stream(self, key, flight):
+        index = 0
+        try:
+            while True:
+                if index < len(flight.chunks):
+                    index += 1
+                    yield flight.chunks[index - 1]
+                elif flight.done:
+                    if flight.error is not None:
+                        raise flight.error
+                    return
+                else:
+                    await flight.updated.wait()
+        finally:
+            flight.subscribers -= 1
+            if flight.subscribers == 0 and not flight.done:
+                # 最后一个订阅者断开: 不再接受新的订阅, 取消推理
+                self._remove(key, flight)
+                flight.task.cancel()
+                flight.job.cancel()
@@ -0,0 +1,32 @@
+"""
+chunk 流式解码的音频拼接: 每个窗口的解码结果前部是上下文token对应的音频, 与上一段的尾部交叉淡化后丢弃
+
+    crossfader = ChunkCrossfader()
+    out = crossfader.push(audio, context, keep)  # keep 为留待与下一段混合的尾部长度, 最后一段为0
+    tail = crossfader.flush()                    # 没有新窗口时取出剩余的尾部
+"""
+import numpy as np
+
+
+class ChunkCrossfader:
+    def __init__(self):
+        self.tail = None  # 上一段留待交叉淡化的尾部
+
+    def push(self, audio, context: int, keep: int):
+        """audio 为一个窗口的完整解码结果, 前 context 个采样为上下文; 返回可以输出的音频"""
+        out = []
+        if self.tail is not None:
+            tail = self.tail
+            fade = min(len(tail), context)
+            fade_in = np.linspace(0, 1, fade, dtype=audio.dtype)
+            out.append(tail[:len(tail) - fade])
+            out.append(tail[len(tail) - fade:] * (1 - fade_in) + audio[context - fade:context] * fade_in)
+        body = audio[context:]
+        keep = min(keep, len(body))
+        out.append(body[:len(body) - keep])
+        self.tail = body[len(body) - keep:] if keep > 0 else None
+        return np.concatenate(out, 0)
+
+    def flush(self):
+        tail, self.tail = self.tail, None
+        return tail
@@ -0,0 +1,127 @@
+"""
+文本前端进程池: 文本清洗/g2p (g2pw, jieba, LangSegment 等) 在独立进程中执行, 不占用推理线程的GIL
+
+    pool = FrontendPool(size=2, languages=["zh", "en"])
+    future = pool.submit(text, language, version)  # concurrent.futures.Future
+    segments = future.result()                     # [(phones, word2ph, norm_text, language)]
+
+每个工作进程运行 TTS_infer_pack.frontend_worker, 通过 stdin/stdout 的 JSON 行通信;
+不用 multiprocessing, 避免 spawn 方式在子进程中重新导入 tts_api 并加载模型
+同一进程同一时间只处理一个请求, 请求由 size 个分发线程取出空闲进程执行; 进程异常退出时自动重启
+工作进程先预热 languages 中的语种模块再报告就绪, wait_ready 返回后这些语种的第一个请求不再承担模块初始化
+"""
+import itertools
+import json
+import os
+import queue
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+
+from TTS_infer_pack.metrics import Counter, Histogram
+
+FRONTEND_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0)
+
+
+class FrontendWorkerError(RuntimeError):
+    """工作进程处理失败或异常退出"""
+
+
+class _Worker:
+    def __init__(self, index: int, cwd: str, languages=()):
+        self.index = index
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "TTS_infer_pack.frontend_worker", *languages],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            cwd=cwd, env={**os.environ, "PYTHONIOENCODING": "utf-8"},
+            encoding="utf-8", bufsize=1,
+        )
+        self.ready = False
+
+    def wait_ready(self):
+        if not self.ready:
+            message = self._read()
+            if not message.get("ready"):
+                raise FrontendWorkerError(f"前端进程 {self.index} 启动失败")
+            self.ready = True
+
+    def _read(self) -> dict:
+        line = self.process.stdout.readline()
+        if not line:
+            raise FrontendWorkerError(f"前端进程 {self.index} 已退出")
+        return json.loads(line)
+
+    def call(self, request: dict) -> dict:
+        self.wait_ready()
+        self.process.stdin.write(json.dumps(request, ensure_ascii=False) + "\n")
+        self.process.stdin.flush()
+        return self._read()
+
+    def alive(self) -> bool:
+        return self.process.poll() is None
+
+    def close(self):
+        if self.alive():
+            self.process.stdin.close()
+            try:
+                self.process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+
+
+class FrontendPool:
+    def __init__(self, size: int, cwd: str = None, logger=None, languages=()):
+        self.size = max(int(size), 1)
+        self.cwd = cwd or os.getcwd()
+        self.logger = logger
+        self.languages = list(languages)
+        self._ids = itertools.count()
+        self._idle = queue.Queue()
+        for i in range(self.size):
+            self._idle.put(_Worker(i, self.cwd, self.languages))
+        self._executor = ThreadPoolExecutor(self.size, thread_name_prefix="frontend-pool")
+        self.seconds = Histogram("tts_frontend_pool_seconds", "前端进程处理一段文本的耗时 (含进程间通信)",
+                                 buckets=FRONTEND_BUCKETS)
+        self.failures = Counter("tts_frontend_pool_failures_total", "前端进程处理失败的文本数")
+
+    def wait_ready(self):
+        """等待全部工作进程完成文本模块的加载与语种预热"""
+        workers = [self._idle.get() for _ in range(self.size)]
+        try:
+            for worker in workers:
+                worker.wait_ready()
+        finally:
+            for worker in workers:
+                self._idle.put(worker)
+
+    def submit(self, text: str, language: str, version: str):
+        return self._executor.submit(self._call, {"text": text, "language": language, "version": version})
+
+    def _call(self, request: dict):
+        request["id"] = next(self._ids)
+        worker = self._idle.get()
+        t0 = perf_counter()
+        try:
+            response = worker.call(request)
+        except (FrontendWorkerError, OSError, ValueError) as e:
+            # 进程退出或输出损坏: 换一个新进程, 本次请求失败
+            self.failures.inc()
+            if self.logger is not None:
+                self.logger.warning(f"前端进程 {worker.index} 异常, 已重启: {e}")
+            worker.close()
+            worker = _Worker(worker.index, self.cwd, self.languages)
+            raise FrontendWorkerError(str(e))
+        finally:
+            self._idle.put(worker)
+        self.seconds.observe(perf_counter() - t0)
+        if "error" in response:
+            self.failures.inc()
+            raise FrontendWorkerError(response["error"])
+        return [tuple(segment) for segment in response["segments"]]
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        while not self._idle.empty():
+            self._idle.get().close()
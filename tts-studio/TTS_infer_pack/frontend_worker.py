@@ -0,0 +1,70 @@
+"""
+文本前端工作进程: 由 FrontendPool 以 `python -m TTS_infer_pack.frontend_worker [语种 ...]` 启动, 工作目录与 tts_api 相同
+
+stdin 每行一个请求 {"id", "text", "language", "version"},
+stdout 每行一个结果 {"id", "segments": [[phones, word2ph, norm_text, language], ...]} 或 {"id", "error"}
+启动时先按参数中的语种 (zh/en/ja/ko/yue) 各清洗一句预热, 导入语种模块并完成 g2pw/jieba/cmudict 等的首次初始化,
+之后才输出一行 {"ready": true}; 文本模块打印到 stdout 的日志转到 stderr, 不干扰协议
+"""
+import json
+import os
+import sys
+from time import perf_counter
+
+# 语种 -> (clean_text_segments 的 language, 预热短句); 中文句子需含多音字与分词, 触发 g2pw 与 jieba 的加载
+WARMUP_TEXTS = {
+    "zh": ("all_zh", "你好, 今天的天气还不错。"),
+    "yue": ("all_yue", "你好, 今日天气几好。"),
+    "en": ("en", "Hello, nice to meet you."),
+    "ja": ("all_ja", "こんにちは。"),
+    "ko": ("all_ko", "안녕하세요."),
+}
+# 预热按 v2 的文本模块 (中文为 chinese2, 含 g2pw); v1 模型的中文模块在第一次请求时加载
+WARMUP_VERSION = "v2"
+
+
+def warmup(clean_text_segments, languages):
+    """逐个语种清洗一句; 某个语种失败 (如未安装其依赖) 只记录日志, 该语种在第一次请求时再报错"""
+    for language in languages:
+        if language not in WARMUP_TEXTS:
+            print(f"前端进程: 不支持预热的语种 {language}")
+            continue
+        text_language, text = WARMUP_TEXTS[language]
+        t0 = perf_counter()
+        try:
+            clean_text_segments(text, text_language, WARMUP_VERSION)
+        except Exception as e:
+            print(f"前端进程: 预热 {language} 失败: {type(e).__name__}: {e}")
+            continue
+        print(f"前端进程: 预热 {language} ({(perf_counter() - t0) * 1000:.0f}ms)")
+
+
+def main():
+    protocol = sys.stdout
+    sys.stdout = sys.stderr
+    now_dir = os.getcwd()
+    sys.path.append(now_dir)
+    sys.path.append("%s/GPT_SoVITS" % (now_dir))
+
+    from TTS_infer_pack.text_frontend import clean_text_segments
+
+    def reply(message):
+        protocol.write(json.dumps(message, ensure_ascii=False) + "\n")
+        protocol.flush()
+
+    warmup(clean_text_segments, sys.argv[1:])
+    reply({"ready": True})
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        request = json.loads(line)
+        try:
+            os.environ["version"] = request["version"]
+            segments = clean_text_segments(request["text"], request["language"], request["version"])
+            reply({"id": request["id"], "segments": [list(segment) for segment in segments]})
+        except Exception as e:
+            reply({"id": request["id"], "error": f"{type(e).__name__}: {e}"})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""
+常驻模型池: 以 (sovits_path, gpt_path) 为键保存已加载的模型, 超过组数上限或内存预算时按LRU淘汰
+
+切换模型时新模型在后台线程中加载并预热, 就绪后原子地替换当前模型 (active);
+进行中的请求继续使用开始时拿到的模型, 被淘汰的模型要等这些请求结束(排空)后才释放
+"""
+import threading
+import traceback
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+class ModelSlot:
+    def __init__(self, key, model, size: int = 0):
+        self.key = key
+        self.model = model
+        self.size = size  # 模型占用的字节数, 用于内存预算
+        self.in_flight = 0
+        self._cond = threading.Condition()
+
+    @contextmanager
+    def use(self):
+        """请求期间持有该模型, 结束时计数减一"""
+        with self._cond:
+            self.in_flight += 1
+        try:
+            yield self.model
+        finally:
+            with self._cond:
+                self.in_flight -= 1
+                if self.in_flight == 0:
+                    self._cond.notify_all()
+
+    def wait_drained(self, timeout=None) -> bool:
+        with self._cond:
+            return self._cond.wait_for(lambda: self.in_flight == 0, timeout)
+
+
+class ModelPool:
+    def __init__(self, loader, capacity: int = 2, warmup=None, on_release=None, logger=None,
+                 memory_budget: int = 0, size_fn=None):
+        self.loader = loader  # loader(key) -> model
+        self.warmup = warmup  # warmup(model), 加载后先跑一次合成
+        self.on_release = on_release  # on_release(), 淘汰的模型排空并移出常驻池后调用 (如清理显存缓存)
+        self.capacity = max(int(capacity), 1)
+        self.memory_budget = max(int(memory_budget), 0)  # 常驻模型总字节数上限, 0为不限制
+        self.size_fn = size_fn  # size_fn(model) -> 字节数
+        self.logger = logger
+        self.active = None  # 当前默认模型的 ModelSlot
+        self._slots = OrderedDict()  # key -> ModelSlot, 按最近使用排序
+        self._loading = {}  # key -> threading.Event
+        self._errors = {}  # key -> 最近一次加载失败的信息
+        self._lock = threading.Lock()
+
+    def _log(self, msg):
+        if self.logger is not None:
+            self.logger.info(msg)
+
+    def get(self, key) -> ModelSlot:
+        """取常驻模型, 不在池中时在当前线程加载 (其他线程正在加载同一模型时等待其完成)"""
+        while True:
+            with self._lock:
+                slot = self._slots.get(key)
+                if slot is not None:
+                    self._slots.move_to_end(key)
+                    return slot
+                event = self._loading.get(key)
+                if event is None:
+                    event = self._loading[key] = threading.Event()
+                    break
+            event.wait()
+            with self._lock:
+                if key not in self._slots and key in self._errors:
+                    raise RuntimeError(self._errors[key])
+        return self._load(key, event)
+
+    def _load(self, key, event) -> ModelSlot:
+        try:
+            model = self.loader(key)
+            if self.warmup is not None:
+                self.warmup(model)
+        except Exception as e:
+            with self._lock:
+                self._errors[key] = f"{type(e).__name__}: {e}"
+                del self._loading[key]
+            event.set()
+            raise
+        slot = ModelSlot(key, model, self.size_fn(model) if self.size_fn is not None else 0)
+        with self._lock:
+            self._errors.pop(key, None)
+            self._slots[key] = slot
+            del self._loading[key]
+            evicted = self._evict(keep=key)
+        event.set()
+        for old in evicted:
+            self._retire(old)
+        return slot
+
+    def _over_budget(self) -> bool:
+        if len(self._slots) > self.capacity:
+            return True
+        return self.memory_budget > 0 and self.resident_bytes() > self.memory_budget
+
+    def resident_bytes(self) -> int:
+        return sum(slot.size for slot in self._slots.values())
+
+    def _evict(self, keep=None):
+        """超出组数上限或内存预算时淘汰最久未用的模型 (当前默认模型与 keep 除外), 需在持有 _lock 时调用"""
+        evicted = []
+        for key in list(self._slots):
+            if not self._over_budget():
+                break
+            if key == keep or (self.active is not None and key == self.active.key):
+                continue
+            evicted.append(self._slots.pop(key))
+        return evicted
+
+    def _retire(self, slot: ModelSlot):
+        # 不主动清空 slot.model: 刚拿到该 slot 还未进入 use() 的请求仍可正常使用, 最后一个引用消失时模型自然释放
+        holder = [slot]
+
+        def drain():
+            holder[0].wait_drained()
+            key = holder.pop().key
+            self._log(f"模型已排空并移出常驻池: {key}")
+            if self.on_release is not None:
+                self.on_release()
+
+        threading.Thread(target=drain, name="tts-model-drain", daemon=True).start()
+
+    def activate(self, key, background: bool = True, callback=None):
+        """
+        切换当前默认模型; 已常驻时立即切换, 否则加载预热完成后再切换
+        background 为 True 时在后台线程加载, 返回 threading.Event (就绪或失败时置位)
+        callback(slot) 在切换完成后于加载线程中调用, 加载失败时不调用
+        """
+        def switch():
+            slot = self.get(key)
+            with self._lock:
+                self.active = slot
+                evicted = self._evict(keep=key)
+            for old in evicted:
+                self._retire(old)
+            self._log(f"当前模型: {key}")
+            if callback is not None:
+                callback(slot)
+
+        done = threading.Event()
+        if not background:
+            try:
+                switch()
+            finally:
+                done.set()
+            return done
+
+        def run():
+            try:
+                switch()
+            except Exception:
+                traceback.print_exc()
+            finally:
+                done.set()
+
+        threading.Thread(target=run, name="tts-model-load", daemon=True).start()
+        return done
+
+    def last_error(self, key):
+        with self._lock:
+            return self._errors.get(key)
+
+    def status(self) -> dict:
+        with self._lock:
+            return {
+                "active": list(self.active.key) if self.active is not None else None,
+                "capacity": self.capacity,
+                "memory_budget": self.memory_budget,
+                "resident_bytes": self.resident_bytes(),
+                "resident": [{"key": list(slot.key), "bytes": slot.size, "in_flight": slot.in_flight}
+                             for slot in self._slots.values()],
+                "loading": [list(key) for key in self._loading],
+            }
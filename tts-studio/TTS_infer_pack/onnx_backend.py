@@ -0,0 +1,156 @@
+"""
+onnxruntime CPU 推理后端: 加载 onnx_export.py 导出的 T2S 编码/首步解码/逐步解码与 SoVITS 解码图
+
+图中自带的采样参数是导出时固定的, 这里改为在主机侧按请求的 top_k/top_p/temperature 从 logits 采样,
+与 AR.models.utils.sample 的计算顺序一致 (重复惩罚 -> top_p -> temperature -> top_k -> 指数噪声采样)
+bert/cnhubert 与参考音频特征仍由 PyTorch 计算, 输入输出均为 numpy
+"""
+import json
+import os
+from time import perf_counter
+
+import numpy as np
+import onnxruntime as ort
+
+ONNX_FILES = {
+    "encoder": "t2s_encoder.onnx",
+    "fsdec": "t2s_fsdec.onnx",
+    "sdec": "t2s_sdec.onnx",
+    "vits": "vits.onnx",
+}
+
+MAX_DECODE_STEPS = 1500
+
+
+def make_session_options(intra_threads: int = 0, inter_threads: int = 1) -> ort.SessionOptions:
+    """intra_threads 为单个算子内的线程数 (0 由 onnxruntime 按核数决定), inter_threads > 1 时并行执行图中的独立分支"""
+    sess_options = ort.SessionOptions()
+    sess_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    sess_options.intra_op_num_threads = max(int(intra_threads), 0)
+    sess_options.inter_op_num_threads = max(int(inter_threads), 1)
+    if inter_threads > 1:
+        sess_options.execution_mode = ort.ExecutionMode.ORT_PARALLEL
+    else:
+        sess_options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+    return sess_options
+
+
+def _softmax(logits):
+    logits = logits - np.max(logits)
+    probs = np.exp(logits)
+    return probs / probs.sum()
+
+
+def sample_token(logits, previous_tokens, top_k=15, top_p=1.0, temperature=1.0, repetition_penalty=1.35, rng=None):
+    """
+    logits [vocab], previous_tokens 为已有的语义token, 返回 (采样得到的token id, 重复惩罚后 logits 的 argmax)
+    argmax 用于EOS判断, 与 Text2SemanticDecoder.infer_panel 一致 (sample 原地做重复惩罚后再取 argmax)
+    """
+    logits = np.array(logits, dtype=np.float32)
+    if repetition_penalty != 1.0 and len(previous_tokens):
+        previous_tokens = np.unique(previous_tokens)
+        score = logits[previous_tokens]
+        logits[previous_tokens] = np.where(score < 0, score * repetition_penalty, score / repetition_penalty)
+    argmax = int(np.argmax(logits))
+
+    if top_p is not None and top_p < 1.0:
+        sorted_indices = np.argsort(-logits, kind="stable")
+        cum_probs = np.cumsum(_softmax(logits[sorted_indices]))
+        sorted_indices_to_remove = cum_probs > top_p
+        sorted_indices_to_remove[0] = False  # 至少保留一个
+        logits[sorted_indices[sorted_indices_to_remove]] = -np.inf
+
+    logits = logits / max(temperature, 1e-5)
+
+    if top_k is not None and top_k > 0:
+        top_k = min(int(top_k), logits.shape[-1])
+        pivot = np.partition(logits, -top_k)[-top_k]
+        logits[logits < pivot] = -np.inf
+
+    probs = _softmax(logits)
+    rng = rng if rng is not None else np.random.default_rng()
+    q = rng.exponential(size=probs.shape)
+    return int(np.argmax(probs / q)), argmax
+
+
+class OnnxVoiceModel:
+    def __init__(self, onnx_dir: str, intra_threads: int = 0, inter_threads: int = 1):
+        with open(os.path.join(onnx_dir, "config.json"), "r", encoding="utf-8") as f:
+            self.config = json.load(f)
+        self.onnx_dir = onnx_dir
+        self.eos = self.config["eos"]
+        self.sampling_rate = self.config["sampling_rate"]
+        sess_options = make_session_options(intra_threads, inter_threads)
+        providers = ["CPUExecutionProvider"]
+        self.encoder = ort.InferenceSession(os.path.join(onnx_dir, ONNX_FILES["encoder"]), sess_options=sess_options, providers=providers)
+        self.fsdec = ort.InferenceSession(os.path.join(onnx_dir, ONNX_FILES["fsdec"]), sess_options=sess_options, providers=providers)
+        self.sdec = ort.InferenceSession(os.path.join(onnx_dir, ONNX_FILES["sdec"]), sess_options=sess_options, providers=providers)
+        self.vits = ort.InferenceSession(os.path.join(onnx_dir, ONNX_FILES["vits"]), sess_options=sess_options, providers=providers)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(os.path.getsize(os.path.join(self.onnx_dir, name)) for name in ONNX_FILES.values())
+
+    def infer_panel(self, all_phoneme_ids, bert, prompt, top_k=15, top_p=1.0, temperature=1.0,
+                    early_stop_num=-1, repetition_penalty=1.35, rng=None, decode_info=None,
+                    watchdog=None):
+        """
+        all_phoneme_ids [1, L] int64, bert [1, 1024, L] float32, prompt [1, P] int64
+        返回约定与 Text2SemanticDecoder.infer_panel 相同: (y, idx), 新生成的语义token为 y[:, -idx:]
+        decode_info / watchdog 同 Text2SemanticDecoder.infer_panel
+        """
+        t0 = perf_counter()
+        rng = rng if rng is not None else np.random.default_rng()
+        x = self.encoder.run(None, {"phoneme_ids": all_phoneme_ids, "bert": bert})[0]
+        _, k, v, y_emb, x_example, logits = self.fsdec.run(None, {"x": x, "prompts": prompt})
+        t_prompt = perf_counter()
+        y = prompt
+        prefix_len = prompt.shape[1]
+        stop_reason = "max_steps"
+        watch = watchdog.watch(all_phoneme_ids.shape[1]) if watchdog is not None and watchdog.enabled else None
+        for idx in range(MAX_DECODE_STEPS):
+            if idx == 0:
+                # 首步不允许直接输出EOS
+                logits = logits[:, :-1]
+            else:
+                _, k, v, y_emb, logits, _ = self.sdec.run(
+                    None, {"iy": y, "ik": k, "iv": v, "iy_emb": y_emb, "ix_example": x_example})
+            token, argmax = sample_token(logits[0], y[0], top_k, top_p, temperature, repetition_penalty, rng)
+            y = np.concatenate([y, np.array([[token]], dtype=y.dtype)], axis=1)
+
+            stop = early_stop_num != -1 and (y.shape[1] - prefix_len) > early_stop_num
+            if stop:
+                stop_reason = "early_stop"
+            elif argmax == self.eos or token == self.eos:
+                stop = True
+                stop_reason = "eos"
+            elif watch is not None:
+                reason = watch.step(token)
+                if reason is not None:
+                    stop = True
+                    stop_reason = reason
+            if stop:
+                break
+        if decode_info is not None:
+            decode_info.update(prompt_seconds=t_prompt - t0, decode_seconds=perf_counter() - t_prompt,
+                               tokens=idx + 1, stop_reason=stop_reason, stop_reasons=[stop_reason],
+                               early_stops=int(stop_reason == "early_stop"), bad_zeros=int(idx == 0),
+                               trimmed_tokens=0)
+        if stop_reason == "loop":
+            # 同 Text2SemanticDecoder.infer_panel: 只保留一个周期, 返回时仍截掉最后一个token
+            trim = min(watch.loop_tokens, idx - 1)
+            if trim > 0:
+                y = y[:, :y.shape[1] - trim + 1]
+                idx -= trim - 1
+                if decode_info is not None:
+                    decode_info["trimmed_tokens"] = trim
+        return y[:, :-1], idx - 1
+
+    def decode(self, pred_semantic, text_seq, refer, noise_scale=0.5):
+        """pred_semantic [1, 1, T] int64, text_seq [1, N] int64, refer 频谱 [1, F, T'] float32, 返回音频 [samples]"""
+        return self.vits.run(None, {
+            "text_seq": text_seq,
+            "pred_semantic": pred_semantic,
+            "refer": refer,
+            "noise_scale": np.array([noise_scale], dtype=np.float32),
+        })[0]
@@ -0,0 +1,66 @@
+"""
+两级流水线: 后台线程提前迭代一个生成器 (逐句的T2S解码), 结果经有界队列按顺序交给调用方 (SoVITS解码与音频编码)
+
+    for phones2, pred_semantic in prefetch(get_semantic_tokens(...), depth=2):
+        vq_model.decode(...)  # 同时后台线程在解码下一句的语义token
+
+torch 算子执行时释放GIL, 两个线程的计算可以重叠
+"""
+import queue
+import threading
+
+_DONE = object()
+
+
+class _Error:
+    def __init__(self, exc):
+        self.exc = exc
+
+
+def prefetch(iterable, depth: int = 1, name: str = "prefetch"):
+    """
+    在后台线程中迭代 iterable, 最多提前 depth 项; 按顺序 yield 结果, 后台线程抛出的异常 (如 JobCancelled)
+    在调用方取到该位置时重新抛出
+    调用方提前结束 (close/异常) 时通知后台线程停止并等待其退出, 后台线程最多再跑完当前一项,
+    保证调用方释放模型后不再有线程使用它
+    """
+    items = queue.Queue(maxsize=max(int(depth), 1))
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def run():
+        iterator = iter(iterable)
+        try:
+            for item in iterator:
+                if not put(item):
+                    return
+            put(_DONE)
+        except BaseException as e:
+            put(_Error(e))
+        finally:
+            # 生成器在后台线程中创建的状态 (no_grad 等) 也在该线程中清理
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                close()
+
+    thread = threading.Thread(target=run, name=name, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = items.get()
+            if item is _DONE:
+                return
+            if isinstance(item, _Error):
+                raise item.exc
+            yield item
+    finally:
+        stop.set()
+        thread.join()
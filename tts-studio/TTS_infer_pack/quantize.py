@@ -0,0 +1,230 @@
+"""
+CPU int8 动态量化: T2S 解码器的线性层与 bert_model 的线性层换成 int8 权重, 激活在运行时动态量化
+
+T2SBlock/T2SMLP 是 TorchScript 类, 内部直接 F.linear(x, weight), 无法换成量化权重,
+这里用同接口的 Python 版本 (QuantizedT2STransformer) 替换 Text2SemanticDecoder.t2s_transformer
+
+量化后的 state_dict 缓存在权重文件旁 (<路径>.int8), 以源文件大小/mtime与torch版本校验, 启动时不必重复量化
+"""
+import os
+
+import torch
+from torch import nn
+from torch.nn import functional as F
+
+try:
+    from torch.ao.nn.quantized import dynamic as nnqd
+except ImportError:  # torch < 1.13
+    from torch.nn.quantized import dynamic as nnqd
+
+QUANTIZED_SUFFIX = ".int8"
+
+
+def _float_linear(weight, bias):
+    linear = nn.Linear(weight.shape[1], weight.shape[0], bias=bias is not None)
+    linear.weight = nn.Parameter(weight.detach().float().clone(), requires_grad=False)
+    if bias is not None:
+        linear.bias = nn.Parameter(bias.detach().float().clone(), requires_grad=False)
+    return linear
+
+
+def _float_layer_norm(norm):
+    layer_norm = nn.LayerNorm(norm.weight.shape[0], eps=norm.eps)
+    layer_norm.weight = nn.Parameter(norm.weight.detach().float().clone(), requires_grad=False)
+    layer_norm.bias = nn.Parameter(norm.bias.detach().float().clone(), requires_grad=False)
+    return layer_norm
+
+
+def _quantize_linear(linear):
+    linear.qconfig = torch.ao.quantization.default_dynamic_qconfig
+    return nnqd.Linear.from_float(linear)
+
+
+def _empty_quantized_linear(linear):
+    """结构相同的空量化层, 用于加载缓存的 state_dict"""
+    return nnqd.Linear(linear.in_features, linear.out_features, bias_=linear.bias is not None, dtype=torch.qint8)
+
+
+def replace_linears(module: nn.Module, make):
+    """把 module 下所有 nn.Linear (不含子类, 如 MultiheadAttention 的 out_proj) 原地替换为 make(linear)"""
+    for name, child in module.named_children():
+        if type(child) is nn.Linear:
+            setattr(module, name, make(child))
+        else:
+            replace_linears(child, make)
+    return module
+
+
+class QuantizedT2SBlock(nn.Module):
+    """T2SBlock 的 Python 版本, 计算与其逐行一致, 只是线性层换成了可量化的模块"""
+
+    def __init__(self, num_heads: int, hidden_dim: int, layer):
+        super().__init__()
+        self.num_heads = num_heads
+        self.hidden_dim = hidden_dim
+        self.qkv = _float_linear(layer.self_attn.in_proj_weight, layer.self_attn.in_proj_bias)
+        self.out_proj = _float_linear(layer.self_attn.out_proj.weight, layer.self_attn.out_proj.bias)
+        self.linear1 = _float_linear(layer.linear1.weight, layer.linear1.bias)
+        self.linear2 = _float_linear(layer.linear2.weight, layer.linear2.bias)
+        self.norm1 = _float_layer_norm(layer.norm1)
+        self.norm2 = _float_layer_norm(layer.norm2)
+
+    def _heads(self, t, batch_size: int, length: int):
+        return t.view(batch_size, length, self.num_heads, -1).transpose(1, 2)
+
+    def _output(self, x, q, k, v, attn_mask):
+        batch_size = q.shape[0]
+        if attn_mask is not None:
+            attn = F.scaled_dot_product_attention(q, k, v, ~attn_mask)
+        else:
+            attn = F.scaled_dot_product_attention(q, k, v)
+        attn = attn.permute(2, 0, 1, 3).reshape(batch_size, -1, self.hidden_dim)
+        x = self.norm1(x + self.out_proj(attn))
+        return self.norm2(x + self.linear2(F.relu(self.linear1(x))))
+
+    def process_prompt(self, x, attn_mask):
+        q, k, v = self.qkv(x).chunk(3, dim=-1)
+        batch_size, q_len, kv_len = q.shape[0], q.shape[1], k.shape[1]
+        x = self._output(x, self._heads(q, batch_size, q_len), self._heads(k, batch_size, kv_len),
+                         self._heads(v, batch_size, kv_len), attn_mask)
+        return x, k, v
+
+    def decode_next_token(self, x, k_cache, v_cache, attn_mask=None):
+        q, k, v = self.qkv(x).chunk(3, dim=-1)
+        k_cache = torch.cat([k_cache, k], dim=1)
+        v_cache = torch.cat([v_cache, v], dim=1)
+        batch_size, q_len, kv_len = q.shape[0], q.shape[1], k_cache.shape[1]
+        x = self._output(x, self._heads(q, batch_size, q_len), self._heads(k_cache, batch_size, kv_len),
+                         self._heads(v_cache, batch_size, kv_len), attn_mask)
+        return x, k_cache, v_cache
+
+    def process_prompt_static(self, x, attn_mask, max_len: int):
+        q, k, v = self.qkv(x).chunk(3, dim=-1)
+        batch_size, q_len, kv_len = q.shape[0], q.shape[1], k.shape[1]
+        k_cache = torch.empty((batch_size, max_len, k.shape[2]), dtype=k.dtype, device=k.device)
+        v_cache = torch.empty((batch_size, max_len, v.shape[2]), dtype=v.dtype, device=v.device)
+        k_cache[:, :kv_len] = k
+        v_cache[:, :kv_len] = v
+        x = self._output(x, self._heads(q, batch_size, q_len), self._heads(k, batch_size, kv_len),
+                         self._heads(v, batch_size, kv_len), attn_mask)
+        return x, k_cache, v_cache
+
+    def decode_next_token_static(self, x, k_cache, v_cache, pos: int, attn_mask=None):
+        q, k, v = self.qkv(x).chunk(3, dim=-1)
+        k_cache[:, pos:pos + 1] = k
+        v_cache[:, pos:pos + 1] = v
+        batch_size, q_len, kv_len = q.shape[0], q.shape[1], pos + 1
+        x = self._output(x, self._heads(q, batch_size, q_len), self._heads(k_cache[:, :kv_len], batch_size, kv_len),
+                         self._heads(v_cache[:, :kv_len], batch_size, kv_len), attn_mask)
+        return x, k_cache, v_cache
+
+
+class QuantizedT2STransformer(nn.Module):
+    """与 T2STransformer 接口相同, infer_panel / infer_panel_generator / infer_panel_batched 无需改动"""
+
+    def __init__(self, num_heads: int, hidden_dim: int, layers):
+        super().__init__()
+        self.blocks = nn.ModuleList([QuantizedT2SBlock(num_heads, hidden_dim, layer) for layer in layers])
+        self.num_blocks = len(self.blocks)
+
+    def process_prompt(self, x, attn_mask):
+        k_cache, v_cache = [], []
+        for block in self.blocks:
+            x, k_cache_, v_cache_ = block.process_prompt(x, attn_mask)
+            k_cache.append(k_cache_)
+            v_cache.append(v_cache_)
+        return x, k_cache, v_cache
+
+    def decode_next_token(self, x, k_cache, v_cache, attn_mask=None):
+        for i, block in enumerate(self.blocks):
+            x, k_cache[i], v_cache[i] = block.decode_next_token(x, k_cache[i], v_cache[i], attn_mask)
+        return x, k_cache, v_cache
+
+    def process_prompt_static(self, x, attn_mask, max_len: int):
+        k_cache, v_cache = [], []
+        for block in self.blocks:
+            x, k_cache_, v_cache_ = block.process_prompt_static(x, attn_mask, max_len)
+            k_cache.append(k_cache_)
+            v_cache.append(v_cache_)
+        return x, k_cache, v_cache
+
+    def decode_next_token_static(self, x, k_cache, v_cache, pos: int, attn_mask=None):
+        for i, block in enumerate(self.blocks):
+            x, k_cache[i], v_cache[i] = block.decode_next_token_static(x, k_cache[i], v_cache[i], pos, attn_mask)
+        return x, k_cache, v_cache
+
+
+class QuantizedT2S(nn.Module):
+    """Text2SemanticDecoder 推理时用到的全部线性层: transformer, ar_predict_layer 与 bert_proj"""
+
+    def __init__(self, model):
+        super().__init__()
+        self.transformer = QuantizedT2STransformer(model.num_head, model.model_dim, model.h.layers)
+        self.ar_predict_layer = _float_linear(model.ar_predict_layer.weight, model.ar_predict_layer.bias)
+        self.bert_proj = _float_linear(model.bert_proj.weight, model.bert_proj.bias)
+
+
+def quantized_cache_path(path: str) -> str:
+    """权重文件 (或 bert 目录) 对应的量化缓存路径"""
+    if os.path.isdir(path):
+        return os.path.join(path, "model" + QUANTIZED_SUFFIX)
+    return path + QUANTIZED_SUFFIX
+
+
+def _source_stamp(path: str):
+    """源权重的 (文件名, 大小, mtime) 与torch版本, 任一变化时缓存失效"""
+    if os.path.isdir(path):
+        files = sorted(name for name in os.listdir(path) if not name.endswith(QUANTIZED_SUFFIX))
+        paths = [os.path.join(path, name) for name in files]
+    else:
+        paths = [path]
+    stamp = [str(torch.__version__), torch.backends.quantized.engine]
+    for file in paths:
+        if os.path.isfile(file):
+            stat = os.stat(file)
+            stamp.append([os.path.basename(file), stat.st_size, stat.st_mtime])
+    return stamp
+
+
+def _quantize_cached(module: nn.Module, source_path: str, logger=None):
+    """有有效缓存时按结构建空量化层并加载, 否则量化后写入缓存; 缓存写入失败不影响使用"""
+    cache_path = quantized_cache_path(source_path)
+    stamp = _source_stamp(source_path)
+    if os.path.exists(cache_path):
+        try:
+            # 只含张量/dtype与基本类型, 不允许反序列化任意对象
+            cached = torch.load(cache_path, map_location="cpu", weights_only=True)
+            if cached.get("source") == stamp:
+                replace_linears(module, _empty_quantized_linear)
+                module.load_state_dict(cached["state_dict"])
+                if logger is not None:
+                    logger.info(f"已加载量化缓存: {cache_path}")
+                return module
+        except Exception as e:
+            if logger is not None:
+                logger.warning(f"量化缓存无效, 重新量化: {cache_path} ({e})")
+    replace_linears(module, _quantize_linear)
+    try:
+        tmp_path = cache_path + ".tmp"
+        torch.save({"source": stamp, "state_dict": module.state_dict()}, tmp_path)
+        os.replace(tmp_path, cache_path)
+        if logger is not None:
+            logger.info(f"已写入量化缓存: {cache_path}")
+    except OSError as e:
+        if logger is not None:
+            logger.warning(f"量化缓存写入失败: {cache_path} ({e})")
+    return module
+
+
+def quantize_t2s(model, gpt_path: str, logger=None):
+    """把 Text2SemanticDecoder (fp32, CPU) 的推理路径换成 int8 动态量化版本, 原地修改并返回 model"""
+    quantized = _quantize_cached(QuantizedT2S(model.float().cpu()), gpt_path, logger)
+    model.t2s_transformer = quantized.transformer
+    model.ar_predict_layer = quantized.ar_predict_layer
+    model.bert_proj = quantized.bert_proj
+    return model
+
+
+def quantize_bert(bert_model: nn.Module, bert_path: str, logger=None):
+    """bert_model (fp32, CPU) 的全部 nn.Linear 换成 int8 动态量化版本, 原地修改并返回"""
+    return _quantize_cached(bert_model.float().cpu(), bert_path, logger)
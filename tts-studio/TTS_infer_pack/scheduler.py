@@ -0,0 +1,215 @@
+"""
+推理请求调度: 按优先级分道的有界队列 + 推理工作线程池
+
+HTTP 协程通过 submit 提交任务, 工作线程执行任务的生成器并把音频块送回事件循环;
+客户端断开时任务被取消, 生成器在下一个检查点 (job.checkpoint) 退出
+
+优先级: interactive (面向用户的回复) 先于 background (批量生成/预热) 出队;
+background 任务在检查点 (句子边界) 发现有排队的 interactive 任务时让出: 工作线程就地执行完这些任务,
+再继续原任务, 因此 interactive 任务最多等待一句的解码时间; 流水线 (--pipeline) 的后台解码线程在让出期间
+于自己的检查点暂停, 不与 interactive 任务争抢算力
+"""
+import asyncio
+import threading
+import traceback
+from collections import deque
+from time import perf_counter
+
+from TTS_infer_pack.metrics import Counter, Gauge, Histogram
+
+LATENCY_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+PRIORITIES = (INTERACTIVE, BACKGROUND)  # 从高到低
+
+
+class SchedulerFull(Exception):
+    """队列已满, 请求被拒绝"""
+
+
+class JobCancelled(Exception):
+    """任务已被取消 (客户端断开)"""
+
+
+class InferenceJob:
+    def __init__(self, fn, loop, priority=INTERACTIVE, scheduler=None):
+        self.fn = fn  # fn(job) -> 音频块生成器
+        self.loop = loop
+        self.priority = priority
+        self.scheduler = scheduler
+        self.chunks = asyncio.Queue()
+        self.cancel_event = threading.Event()
+        self.enqueue_time = perf_counter()
+        self.start_time = None
+        self.finish_time = None
+        self.thread = None  # 执行该任务的工作线程
+        self.preempted_seconds = 0.0
+        self.resumed = threading.Event()  # 工作线程让出给更高优先级任务期间清除
+        self.resumed.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self.cancel_event.is_set()
+
+    def cancel(self):
+        self.cancel_event.set()
+        self.resumed.set()  # 唤醒在检查点等待的流水线线程, 使其退出
+
+    def checkpoint(self):
+        """
+        在句子/窗口边界调用, 任务被取消时抛出 JobCancelled;
+        background 任务在此让出工作线程, 先执行排队的 interactive 任务;
+        流水线后台线程中的检查点在工作线程让出期间等待, 让出结束后再继续
+        """
+        if self.cancel_event.is_set():
+            raise JobCancelled()
+        if self.scheduler is None or self.priority == INTERACTIVE:
+            return
+        if threading.current_thread() is self.thread:
+            self.scheduler.preempt(self)
+        else:
+            self.resumed.wait()
+        if self.cancel_event.is_set():
+            raise JobCancelled()
+
+    def _emit(self, kind, payload=None):
+        try:
+            self.loop.call_soon_threadsafe(self.chunks.put_nowait, (kind, payload))
+        except RuntimeError:
+            # 事件循环已关闭, 没有人再接收结果
+            self.cancel()
+
+    async def stream(self):
+        """按顺序产出音频块; 推理出错时抛出原异常; 消费方提前退出(客户端断开)时取消任务"""
+        try:
+            while True:
+                kind, payload = await self.chunks.get()
+                if kind == "chunk":
+                    yield payload
+                elif kind == "error":
+                    raise payload
+                else:
+                    return
+        finally:
+            self.cancel()
+
+
+class InferenceScheduler:
+    def __init__(self, num_workers: int = 1, max_queue: int = 16, preemption: bool = True):
+        self.num_workers = max(int(num_workers), 1)
+        self.max_queue = max(int(max_queue), 1)
+        self.preemption = preemption
+        self.lanes = {priority: deque() for priority in PRIORITIES}
+        self._cond = threading.Condition()
+        self._idle = 0  # 空闲 (等待任务) 的工作线程数
+        self._threads = []
+
+        self.busy_workers = Gauge("tts_busy_workers", "正在执行推理的工作线程数")
+        Gauge("tts_workers", "推理工作线程数", function=lambda: self.num_workers)
+        Gauge("tts_queue_depth", "排队等待的推理请求数", function=self.qsize)
+        self.lane_depth = Gauge("tts_lane_queue_depth", "各优先级排队等待的推理请求数", ["priority"])
+        self.wait_time = Histogram("tts_queue_wait_seconds", "请求从入队到开始推理的等待时间", ["priority"], buckets=LATENCY_BUCKETS)
+        self.service_time = Histogram("tts_service_seconds", "请求的推理耗时 (开始推理到结束, 含被抢占的时间)", ["priority"],
+                                      buckets=LATENCY_BUCKETS)
+        self.jobs = Counter("tts_jobs_total", "推理请求数, 按结果区分", ["status"])
+        self.preemptions = Counter("tts_preemptions_total", "background 任务在句子边界让出给 interactive 任务的次数")
+
+    def qsize(self) -> int:
+        with self._cond:
+            return sum(len(lane) for lane in self.lanes.values())
+
+    def start(self):
+        for i in range(self.num_workers):
+            thread = threading.Thread(target=self._worker_loop, name=f"tts-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, fn, loop=None, priority=INTERACTIVE) -> InferenceJob:
+        if priority not in self.lanes:
+            raise ValueError(f"未知的优先级: {priority}")
+        job = InferenceJob(fn, loop or asyncio.get_running_loop(), priority, self if self.preemption else None)
+        with self._cond:
+            if sum(len(lane) for lane in self.lanes.values()) >= self.max_queue:
+                self.jobs.inc(status="rejected")
+                raise SchedulerFull()
+            self.lanes[priority].append(job)
+            self.lane_depth.inc(priority=priority)
+            self._cond.notify()
+        return job
+
+    def _pop(self, above=None):
+        """取优先级最高的排队任务; above 不为空时只取比它优先级更高的任务, 没有时返回 None"""
+        for priority in PRIORITIES:
+            if priority == above:
+                return None
+            lane = self.lanes[priority]
+            if lane:
+                self.lane_depth.dec(priority=priority)
+                return lane.popleft()
+        return None
+
+    def _worker_loop(self):
+        while True:
+            with self._cond:
+                job = self._pop()
+                while job is None:
+                    self._idle += 1
+                    self._cond.wait()
+                    self._idle -= 1
+                    job = self._pop()
+            self._run(job)
+
+    def preempt(self, job: InferenceJob):
+        """
+        在 job 的工作线程中执行所有排在 job 之前的更高优先级任务;
+        有空闲工作线程时交给它们执行, 不打断 job
+        """
+        t0 = None
+        try:
+            while True:
+                with self._cond:
+                    urgent = None if self._idle else self._pop(above=job.priority)
+                if urgent is None:
+                    break
+                if t0 is None:
+                    t0 = perf_counter()
+                    self.busy_workers.dec()  # 嵌套执行的任务会再计一次
+                    job.resumed.clear()
+                self.preemptions.inc()
+                self._run(urgent)
+        finally:
+            if t0 is not None:
+                job.resumed.set()
+                self.busy_workers.inc()
+                job.preempted_seconds += perf_counter() - t0
+
+    def _run(self, job: InferenceJob):
+        if job.cancelled:
+            self.jobs.inc(status="cancelled")
+            return
+        job.thread = threading.current_thread()
+        job.start_time = perf_counter()
+        self.wait_time.observe(job.start_time - job.enqueue_time, priority=job.priority)
+        self.busy_workers.inc()
+        status = "ok"
+        generator = None
+        try:
+            generator = job.fn(job)
+            for chunk in generator:
+                job.checkpoint()
+                job._emit("chunk", chunk)
+            job._emit("end")
+        except JobCancelled:
+            status = "cancelled"
+        except Exception as e:
+            status = "error"
+            traceback.print_exc()
+            job._emit("error", e)
+        finally:
+            if generator is not None:
+                generator.close()
+            job.finish_time = perf_counter()
+            self.service_time.observe(job.finish_time - job.start_time, priority=job.priority)
+            self.busy_workers.dec()
+            self.jobs.inc(status=status)
@@ -0,0 +1,97 @@
+"""
+请求内的分阶段计时: 每个请求一个 SpanRecorder, 各阶段耗时累加后在请求结束时写入 Prometheus 指标
+
+    spans = SpanRecorder()
+    with spans.span("frontend"):
+        ...
+    spans.add_decode(decode_info)  # infer_panel 填写的 t2s_prompt/t2s_decode 耗时与token数
+    spans.observe()                # 请求结束, 写入 tts_stage_seconds 等指标
+
+阶段: refer (参考音频特征, 其中 cnhubert 为 refer_ssl), frontend (文本清洗/g2p), bert,
+t2s_prompt (T2S prompt 处理), t2s_decode (T2S 逐token解码), sovits (声码器), encode (音频编码)
+GPU 上的耗时以阶段内第一次回到CPU的拷贝为准 (bert/sovits 的 .cpu(), 解码循环中的EOS判断), 不额外同步
+"""
+from collections import defaultdict
+from contextlib import contextmanager
+from time import perf_counter
+
+from TTS_infer_pack.metrics import Counter, Histogram
+
+STAGES = ("refer", "refer_ssl", "frontend", "bert", "t2s_prompt", "t2s_decode", "sovits", "encode")
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0)
+
+STAGE_SECONDS = Histogram("tts_stage_seconds", "每个请求在各阶段的耗时", ["stage"], buckets=STAGE_BUCKETS)
+SEMANTIC_TOKENS = Counter("tts_semantic_tokens_total", "T2S 生成的语义token数")
+EARLY_STOPS = Counter("tts_early_stop_total", "T2S 解码因 early_stop_num 截断的句数")
+BAD_ZERO_PREDICTIONS = Counter("tts_bad_zero_prediction_total", "T2S 第一步即结束 (bad zero prediction) 的句数")
+DECODE_STOPS = Counter("tts_decode_stops_total", "T2S 解码结束的句数, 按原因区分 (eos/early_stop/max_steps/max_tokens/loop)",
+                       ["reason"])
+
+
+class SpanRecorder:
+    """一个请求内各阶段的累计耗时 (秒) 与解码统计; 同一阶段可多次进入, 耗时累加"""
+
+    def __init__(self):
+        self.seconds = defaultdict(float)
+        self.tokens = 0
+        self.early_stops = 0
+        self.bad_zeros = 0
+        self.stop_reasons = []
+        self.observed = False
+
+    @contextmanager
+    def span(self, stage):
+        t0 = perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[stage] += perf_counter() - t0
+
+    def add(self, stage, seconds):
+        self.seconds[stage] += seconds
+
+    def add_decode(self, decode_info):
+        """infer_panel / infer_panel_generator / infer_panel_batched 填写的 decode_info"""
+        self.seconds["t2s_prompt"] += decode_info.get("prompt_seconds", 0.0)
+        self.seconds["t2s_decode"] += decode_info.get("decode_seconds", 0.0)
+        self.tokens += decode_info.get("tokens", 0)
+        self.early_stops += decode_info.get("early_stops", 0)
+        self.bad_zeros += decode_info.get("bad_zeros", 0)
+        self.stop_reasons.extend(decode_info.get("stop_reasons", []))
+
+    def watchdog_stops(self):
+        """被解码看门狗提前结束的句子的结束原因 (max_tokens / loop), 这些句子的音频可能被截断"""
+        return [reason for reason in self.stop_reasons if reason in ("max_tokens", "loop")]
+
+    def tokens_per_sec(self):
+        decode_seconds = self.seconds.get("t2s_decode", 0.0)
+        return self.tokens / decode_seconds if decode_seconds else None
+
+    def as_dict(self):
+        return {stage: round(seconds, 4) for stage, seconds in self.seconds.items()}
+
+    def summary(self) -> str:
+        parts = [f"{stage} {self.seconds[stage] * 1000:.0f}ms" for stage in STAGES if stage in self.seconds]
+        tokens_per_sec = self.tokens_per_sec()
+        if tokens_per_sec is not None:
+            parts.append(f"{self.tokens} tokens ({tokens_per_sec:.1f} tok/s)")
+        watchdog_stops = self.watchdog_stops()
+        if watchdog_stops:
+            parts.append(f"watchdog: {', '.join(watchdog_stops)}")
+        return ", ".join(parts)
+
+    def observe(self):
+        """请求结束时写入指标, 只生效一次 (取消的请求也会记录已完成的阶段)"""
+        if self.observed:
+            return
+        self.observed = True
+        for stage, seconds in self.seconds.items():
+            STAGE_SECONDS.observe(seconds, stage=stage)
+        if self.tokens:
+            SEMANTIC_TOKENS.inc(self.tokens)
+        if self.early_stops:
+            EARLY_STOPS.inc(self.early_stops)
+        if self.bad_zeros:
+            BAD_ZERO_PREDICTIONS.inc(self.bad_zeros)
+        for reason in self.stop_reasons:
+            DECODE_STOPS.inc(reason=reason)
@@ -0,0 +1,86 @@
+"""
+文本前端的纯CPU部分: 按语种切分 (LangSegment), 文本规范化与 g2p (clean_text), 不依赖模型
+tts_api 与前端工作进程 (frontend_worker) 共用
+各语种模块 (text.chinese2 导入时即创建 g2pw 会话, 另有 cmudict/pyopenjtalk 等) 在第一次用到该语种时才导入 (clean_text 按语种 __import__)
+"""
+import re
+import threading
+
+from vendor.LangSegment import LangSegment
+from text import cleaned_text_to_sequence
+from text.cleaner import clean_text
+
+# LangSegment 的语种过滤器与切分过程中的状态都是类属性, 多个推理线程同时切分时需串行
+_langsegment_lock = threading.Lock()
+# g2pw (含其 tokenizer), jieba 词性标注, pyopenjtalk 等 g2p 模块都有进程内共享的状态, 清洗/g2p 同样串行;
+# 需要并行时用前端进程池 (--frontend_workers)
+_g2p_lock = threading.Lock()
+
+
+def split_languages(text, filters):
+    """按语种切分, 返回 LangSegment.getTexts 的结果列表 [{"lang", "text"}]"""
+    with _langsegment_lock:
+        LangSegment.setfilters(filters)
+        return list(LangSegment.getTexts(text))
+
+
+def clean_text_inf(text, language, version):
+    with _g2p_lock:
+        phones, word2ph, norm_text = clean_text(text, language, version)
+    phones = cleaned_text_to_sequence(phones, version)
+    return phones, word2ph, norm_text
+
+
+def clean_text_segments(text,language,version):
+    """
+    按语种切分并完成文本清洗/g2p, 返回 [(phones, word2ph, norm_text, language)]
+    只有 language 为 zh 的片段需要bert特征, 其余片段用全零特征
+    """
+    if language in {"en", "all_zh", "all_ja", "all_ko", "all_yue"}:
+        language = language.replace("all_","")
+        if language == "en":
+            formattext = " ".join(tmp["text"] for tmp in split_languages(text, ["en"]))
+        else:
+            # 因无法区别中日韩文汉字,以用户输入为准
+            formattext = text
+        while "  " in formattext:
+            formattext = formattext.replace("  ", " ")
+        if language == "zh" and re.search(r'[A-Za-z]', formattext):
+            from text import chinese
+            formattext = re.sub(r'[a-z]', lambda x: x.group(0).upper(), formattext)
+            formattext = chinese.text_normalize(formattext)
+            return clean_text_segments(formattext,"zh",version)
+        elif language == "yue" and re.search(r'[A-Za-z]', formattext):
+            from text import chinese
+            formattext = re.sub(r'[a-z]', lambda x: x.group(0).upper(), formattext)
+            formattext = chinese.text_normalize(formattext)
+            return clean_text_segments(formattext,"yue",version)
+        phones, word2ph, norm_text = clean_text_inf(formattext, language, version)
+        return [(phones, word2ph, norm_text, language)]
+
+    textlist=[]
+    langlist=[]
+    lang_texts = split_languages(text, ["zh","ja","en","ko"])
+    if language == "auto":
+        for tmp in lang_texts:
+            langlist.append(tmp["lang"])
+            textlist.append(tmp["text"])
+    elif language == "auto_yue":
+        for tmp in lang_texts:
+            if tmp["lang"] == "zh":
+                tmp["lang"] = "yue"
+            langlist.append(tmp["lang"])
+            textlist.append(tmp["text"])
+    else:
+        for tmp in lang_texts:
+            if tmp["lang"] == "en":
+                langlist.append(tmp["lang"])
+            else:
+                # 因无法区别中日韩文汉字,以用户输入为准
+                langlist.append(language)
+            textlist.append(tmp["text"])
+    segments = []
+    for i in range(len(textlist)):
+        phones, word2ph, norm_text = clean_text_inf(textlist[i], langlist[i], version)
+        segments.append((phones, word2ph, norm_text, langlist[i]))
+    return segments
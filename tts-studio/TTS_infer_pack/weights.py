@@ -0,0 +1,156 @@
+"""
+SoVITS/GPT 权重文件: 原格式 (.pth/.ckpt, torch pickle, {"weight": state_dict, "config": ..., ...})
+与转换后的 safetensors 格式 (<名称>.safetensors 存权重 + <名称>.json 存 config 等其余字段)
+
+    checkpoint = open_checkpoint("tts-model/merge.pth")  # 旁边有有效的转换结果时自动改用 safetensors
+    hps = checkpoint.metadata["config"]
+    checkpoint.shape("enc_p.text_embedding.weight")
+    checkpoint.load_into(model, strict=False)             # 逐个张量从 mmap 拷入模型 (可直接是GPU上的半精度模型)
+
+safetensors 文件以 mmap 读取, 不先把整个 pickle 反序列化到内存, 加载时峰值内存约为模型本身加一个张量;
+safetensors 为可选依赖, 未安装时只能加载原格式 (原格式在 torch 支持时也以 mmap 读取)
+转换: python convert_safetensors.py tts-model/merge.pth tts-model/merge.ckpt
+"""
+import json
+import os
+
+import torch
+
+SAFETENSORS_SUFFIX = ".safetensors"
+SIDECAR_FORMAT = "gpt-sovits-safetensors/1"
+
+
+def safetensors_available() -> bool:
+    try:
+        import safetensors  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def converted_paths(path: str):
+    """原格式文件对应的 (safetensors 路径, json 路径), 与原文件同目录同名"""
+    stem = os.path.splitext(path)[0]
+    return stem + SAFETENSORS_SUFFIX, stem + ".json"
+
+
+def _source_stamp(path: str):
+    stat = os.stat(path)
+    return [os.path.basename(path), stat.st_size, stat.st_mtime]
+
+
+def _read_sidecar(json_path: str) -> dict:
+    with open(json_path, "r", encoding="utf-8") as f:
+        sidecar = json.load(f)
+    if sidecar.get("format") != SIDECAR_FORMAT:
+        raise ValueError(f"不是 convert_safetensors.py 生成的配置文件: {json_path}")
+    return sidecar
+
+
+def _load_pickle(path: str) -> dict:
+    try:
+        # torch>=2.1 可对 zip 格式的权重文件 mmap, 张量按需从页缓存读取
+        return torch.load(path, map_location="cpu", weights_only=False, mmap=True)
+    except (TypeError, RuntimeError):
+        # 旧版 torch 不支持 mmap 参数, 或文件为旧的非 zip 格式
+        return torch.load(path, map_location="cpu", weights_only=False)
+
+
+class Checkpoint:
+    """一个权重文件: metadata 为除权重外的全部字段 (config, info 等)"""
+
+    def __init__(self, path: str, metadata: dict, weights: dict = None, safetensors_path: str = None):
+        self.path = path
+        self.metadata = metadata
+        self._weights = weights  # 原格式: 完整的 state_dict
+        self._safetensors_path = safetensors_path
+
+    @property
+    def format(self) -> str:
+        return "safetensors" if self._safetensors_path is not None else "pickle"
+
+    def _open(self):
+        from safetensors import safe_open
+
+        return safe_open(self._safetensors_path, framework="pt", device="cpu")
+
+    def shape(self, name: str):
+        if self._weights is not None:
+            return tuple(self._weights[name].shape)
+        with self._open() as f:
+            return tuple(f.get_slice(name).get_shape())
+
+    def load_into(self, module: torch.nn.Module, strict: bool = True):
+        """
+        把权重拷入 module 现有的参数/缓冲区 (按目标的设备与精度转换), 返回 (missing_keys, unexpected_keys);
+        strict 为 True 时有缺失或多余的键则抛出 RuntimeError
+        """
+        if self._weights is not None:
+            return module.load_state_dict(self._weights, strict=strict)
+        targets = module.state_dict(keep_vars=True)
+        with self._open() as f, torch.no_grad():
+            names = set(f.keys())
+            missing = [name for name in targets if name not in names]
+            unexpected = [name for name in names if name not in targets]
+            if strict and (missing or unexpected):
+                raise RuntimeError(f"权重与模型不匹配: 缺少 {missing[:10]}, 多余 {unexpected[:10]}")
+            for name, target in targets.items():
+                if name in names:
+                    tensor = f.get_tensor(name)
+                    if tensor.shape != target.shape:
+                        raise RuntimeError(f"{name} 形状不匹配: 权重 {tuple(tensor.shape)}, 模型 {tuple(target.shape)}")
+                    target.copy_(tensor)
+        return missing, unexpected
+
+
+def open_checkpoint(path: str, prefer_converted: bool = True) -> Checkpoint:
+    """
+    打开权重文件; path 可以是原格式, 也可以是转换后的 .safetensors
+    prefer_converted 为 True 时, 原格式旁有与其对应 (大小/mtime 一致) 的转换结果且已安装 safetensors 时改用后者
+    """
+    if path.endswith(SAFETENSORS_SUFFIX):
+        json_path = converted_paths(path)[1]
+        return Checkpoint(path, _read_sidecar(json_path)["metadata"], safetensors_path=path)
+    if prefer_converted and safetensors_available():
+        safetensors_path, json_path = converted_paths(path)
+        if os.path.exists(safetensors_path) and os.path.exists(json_path):
+            try:
+                sidecar = _read_sidecar(json_path)
+                if sidecar.get("source") == _source_stamp(path):
+                    return Checkpoint(path, sidecar["metadata"], safetensors_path=safetensors_path)
+            except (OSError, ValueError):
+                pass
+    data = _load_pickle(path)
+    metadata = {key: value for key, value in data.items() if key != "weight"}
+    return Checkpoint(path, metadata, weights=data["weight"])
+
+
+def convert_checkpoint(path: str) -> tuple:
+    """原格式 -> <名称>.safetensors + <名称>.json, 返回两者路径; 权重保持原有精度"""
+    from safetensors.torch import save_file
+
+    data = torch.load(path, map_location="cpu", weights_only=False)
+    weights = {}
+    seen = set()
+    for name, tensor in data["weight"].items():
+        tensor = tensor.detach().contiguous()
+        # safetensors 不允许共享存储的张量, 重复的复制一份
+        ptr = (tensor.data_ptr(), tensor.numel())
+        if tensor.numel() > 0 and ptr in seen:
+            tensor = tensor.clone()
+        seen.add(ptr)
+        weights[name] = tensor
+    safetensors_path, json_path = converted_paths(path)
+    sidecar = {
+        "format": SIDECAR_FORMAT,
+        "source": _source_stamp(path),
+        "metadata": {key: value for key, value in data.items() if key != "weight"},
+    }
+    tmp_path = safetensors_path + ".tmp"
+    save_file(weights, tmp_path)
+    os.replace(tmp_path, safetensors_path)
+    tmp_path = json_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(sidecar, f, ensure_ascii=False, indent=2, default=str)
+    os.replace(tmp_path, json_path)
+    return safetensors_path, json_path
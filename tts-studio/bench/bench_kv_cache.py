@@ -0,0 +1,93 @@
+"""
+T2S KV cache 微基准: 对比 torch.cat 逐步增长的 kv cache 与预分配的静态 kv cache
+
+用法 (在 tts-studio 目录下):
+    python bench/bench_kv_cache.py
+    python bench/bench_kv_cache.py --lengths 200 500 1000 --prompt_len 300 --threads 4
+
+随机初始化的 T2S 模型 (结构与 s1bert25hz 一致), 只测解码循环本身, 不需要权重文件
+"""
+import argparse
+import json
+import os
+import sys
+from time import perf_counter
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import torch
+
+from AR.models.t2s_model import Text2SemanticDecoder
+
+T2S_CONFIG = {
+    "model": {
+        "hidden_dim": 512,
+        "embedding_dim": 512,
+        "head": 16,
+        "n_layer": 24,
+        "vocab_size": 1025,
+        "phoneme_vocab_size": 732,
+        "dropout": 0,
+        "EOS": 1024,
+    }
+}
+
+
+def run_decode(model, n_tokens, prompt_len, static_kv_cache):
+    transformer = model.t2s_transformer
+    dim = model.model_dim
+    xy_pos = torch.randn(1, prompt_len, dim)
+    attn_mask = torch.zeros((prompt_len, prompt_len), dtype=torch.bool)
+    step_pos = torch.randn(1, 1, dim)
+
+    t0 = perf_counter()
+    if static_kv_cache:
+        _, k_cache, v_cache = transformer.process_prompt_static(xy_pos, attn_mask, prompt_len + n_tokens)
+    else:
+        _, k_cache, v_cache = transformer.process_prompt(xy_pos, attn_mask)
+    t1 = perf_counter()
+    for idx in range(n_tokens):
+        if static_kv_cache:
+            _, k_cache, v_cache = transformer.decode_next_token_static(step_pos, k_cache, v_cache, prompt_len + idx)
+        else:
+            _, k_cache, v_cache = transformer.decode_next_token(step_pos, k_cache, v_cache)
+    t2 = perf_counter()
+    return t1 - t0, t2 - t1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="T2S KV cache microbenchmark")
+    parser.add_argument("--lengths", type=int, nargs="+", default=[200, 500, 1000], help="生成的token数")
+    parser.add_argument("--prompt_len", type=int, default=300, help="文本+参考音频token长度")
+    parser.add_argument("--repeat", type=int, default=3, help="每组重复次数, 取最好成绩")
+    parser.add_argument("--threads", type=int, default=0, help="torch线程数, 0为默认")
+    parser.add_argument("--output", type=str, default="", help="结果json输出路径")
+    args = parser.parse_args()
+
+    if args.threads > 0:
+        torch.set_num_threads(args.threads)
+    torch.manual_seed(0)
+    model = Text2SemanticDecoder(T2S_CONFIG).eval()
+
+    results = []
+    with torch.no_grad():
+        # 预热, 避免把TorchScript编译时间算进去
+        run_decode(model, 8, args.prompt_len, False)
+        run_decode(model, 8, args.prompt_len, True)
+        for n_tokens in args.lengths:
+            row = {"tokens": n_tokens, "prompt_len": args.prompt_len}
+            for name, static in (("cat", False), ("static", True)):
+                best = min(run_decode(model, n_tokens, args.prompt_len, static)[1] for _ in range(args.repeat))
+                row[f"{name}_tokens_per_sec"] = round(n_tokens / best, 2)
+            row["speedup"] = round(row["static_tokens_per_sec"] / row["cat_tokens_per_sec"], 3)
+            results.append(row)
+            print(f"{n_tokens:>5} tokens | cat {row['cat_tokens_per_sec']:>8.2f} tok/s | "
+                  f"static {row['static_tokens_per_sec']:>8.2f} tok/s | x{row['speedup']}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"device": "cpu", "threads": torch.get_num_threads(), "results": results}, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""
+int8 动态量化基准: 同一组固定句子分别用 fp32 与 int8 (T2S + bert) 合成, 报告实时率与音质差异
+
+用法 (在 tts-studio 目录下):
+    python bench/bench_quantize.py -s tts-model/merge.pth -g tts-model/merge.ckpt \\
+        -dr tts-model/ref.wav -dt "参考音频的文本。" -dl zh --threads 4 --output quantize.json
+
+在进程内导入 tts_api (只加载模型, 不启动HTTP服务), CPU全精度推理; 先跑 fp32, 再原地量化后跑 int8
+采样固定为 top_k=1 并在每句前重置随机种子, 使两次合成可比较;
+音质差异为 log-mel 频谱经 DTW 对齐后的平均绝对差 (mel_distance), 以及两者的时长比
+"""
+import argparse
+import json
+import os
+import sys
+from time import perf_counter
+
+import numpy as np
+
+SENTENCES = [
+    ("今天的天气真不错，我们一起去公园散步吧。", "zh"),
+    ("这个问题有点复杂，让我想一想再回答你。", "zh"),
+    ("我刚刚看完了那部电影，结局真的太感人了！", "zh"),
+    ("The quick brown fox jumps over the lazy dog.", "en"),
+    ("Let me check the weather forecast for tomorrow.", "en"),
+    ("我最喜欢的游戏是Minecraft，你玩过吗？", "zh"),
+]
+
+
+def load_tts_api(args):
+    """以命令行参数的形式导入 tts_api, 模块级代码在后台线程加载 bert/cnhubert/SoVITS/GPT"""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    os.chdir(root)
+    sys.path.insert(0, root)
+    sys.argv = [
+        "tts_api.py", "-s", args.sovits_path, "-g", args.gpt_path,
+        "-dr", args.refer_path, "-dt", args.refer_text, "-dl", args.refer_language,
+        "-d", "cpu", "-fp", "-sm", "close", "-mt", "pcm_s16le",
+        "--audio_cache_dir", "", "--frontend_cache_size", "0", "--refer_cache_size", "0",
+    ]
+    import tts_api
+    # 模型在 tts_api 的启动线程中加载
+    tts_api.startup.wait()
+    return tts_api
+
+
+def synthesize(tts_api, args, text, language, seed):
+    import torch
+
+    torch.manual_seed(seed)
+    t0 = perf_counter()
+    pcm = b"".join(tts_api.get_tts_wav(args.refer_path, args.refer_text, args.refer_language, text, language,
+                                       top_k=1, top_p=1, temperature=1, media_type="pcm_s16le"))
+    elapsed = perf_counter() - t0
+    return np.frombuffer(pcm, dtype=np.int16).astype(np.float32) / 32768, elapsed
+
+
+def log_mel(audio, sr):
+    import librosa
+
+    mel = librosa.feature.melspectrogram(y=audio, sr=sr, n_fft=1024, hop_length=256, n_mels=80)
+    return np.log(np.maximum(mel, 1e-5))
+
+
+def mel_distance(reference, candidate, sr):
+    """DTW 对齐后逐帧 log-mel 的平均绝对差, 时长不同 (token序列不同) 时也可比较"""
+    import librosa
+
+    ref_mel, cand_mel = log_mel(reference, sr), log_mel(candidate, sr)
+    _, path = librosa.sequence.dtw(X=ref_mel, Y=cand_mel, metric="euclidean")
+    return float(np.mean(np.abs(ref_mel[:, path[:, 0]] - cand_mel[:, path[:, 1]])))
+
+
+def run(tts_api, args, sr):
+    results = []
+    for i, (text, language) in enumerate(SENTENCES):
+        best = None
+        for _ in range(args.repeat):
+            audio, elapsed = synthesize(tts_api, args, text, language, args.seed + i)
+            best = elapsed if best is None else min(best, elapsed)
+        results.append({"audio": audio, "seconds": best, "rtf": best / max(len(audio) / sr, 1e-6)})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="int8 dynamic quantization benchmark")
+    parser.add_argument("-s", "--sovits_path", type=str, required=True, help="SoVITS模型路径")
+    parser.add_argument("-g", "--gpt_path", type=str, required=True, help="GPT模型路径")
+    parser.add_argument("-dr", "--refer_path", type=str, required=True, help="参考音频路径")
+    parser.add_argument("-dt", "--refer_text", type=str, required=True, help="参考音频文本")
+    parser.add_argument("-dl", "--refer_language", type=str, default="zh", help="参考音频语种")
+    parser.add_argument("--threads", type=int, default=0, help="torch线程数, 0为默认")
+    parser.add_argument("--repeat", type=int, default=2, help="每句重复次数, 取最好成绩")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子")
+    parser.add_argument("--output", type=str, default="", help="结果json输出路径")
+    args = parser.parse_args()
+
+    tts_api = load_tts_api(args)
+    import torch
+
+    from TTS_infer_pack.quantize import quantize_bert, quantize_t2s
+
+    if args.threads > 0:
+        torch.set_num_threads(args.threads)
+    sr = tts_api.model_pool.active.model.hps.data.sampling_rate
+
+    fp32 = run(tts_api, args, sr)
+    tts_api.bert_encoder.model = quantize_bert(tts_api.bert_encoder.model, tts_api.bert_path, tts_api.logger)
+    quantize_t2s(tts_api.model_pool.active.model.t2s_model.model, args.gpt_path, tts_api.logger)
+    int8 = run(tts_api, args, sr)
+
+    rows = []
+    for (text, language), ref, cand in zip(SENTENCES, fp32, int8):
+        row = {
+            "text": text,
+            "language": language,
+            "fp32_rtf": round(ref["rtf"], 4),
+            "int8_rtf": round(cand["rtf"], 4),
+            "speedup": round(ref["seconds"] / cand["seconds"], 3),
+            "duration_ratio": round(len(cand["audio"]) / max(len(ref["audio"]), 1), 3),
+            "mel_distance": round(mel_distance(ref["audio"], cand["audio"], sr), 4),
+        }
+        rows.append(row)
+        print(f"fp32 RTF {row['fp32_rtf']:.3f} | int8 RTF {row['int8_rtf']:.3f} | x{row['speedup']:<6} | "
+              f"mel {row['mel_distance']:.3f} | len x{row['duration_ratio']} | {text}")
+
+    summary = {
+        "fp32_rtf": round(float(np.mean([row["fp32_rtf"] for row in rows])), 4),
+        "int8_rtf": round(float(np.mean([row["int8_rtf"] for row in rows])), 4),
+        "mel_distance": round(float(np.mean([row["mel_distance"] for row in rows])), 4),
+    }
+    print(f"平均: fp32 RTF {summary['fp32_rtf']}, int8 RTF {summary['int8_rtf']}, mel {summary['mel_distance']}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"threads": torch.get_num_threads(), "summary": summary, "results": rows},
+                      f, ensure_ascii=False, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+"""
+TTS 端到端基准: 用固定的多语种语料 (bench/corpus.json) 测量实时率, 延迟分位数, 首包耗时与各阶段耗时
+
+用法 (在 tts-studio 目录下):
+    # 进程内: 导入 tts_api (只加载模型, 不启动HTTP服务), 直接调用 get_tts_wav
+    python bench/bench_tts.py inprocess -dr tts-model/ref.wav -dt "参考音频的文本。" -dl zh --output before.json
+    python bench/bench_tts.py inprocess -dr ... -dt ... -dl zh --tts_args "--quantize int8" --output after.json
+
+    # 进程外: 请求已启动的 tts_api 服务
+    python bench/bench_tts.py http --url http://127.0.0.1:9880 --concurrency 2 --output http.json
+
+进程内模式额外给出各阶段耗时 (tts_api 的 SpanRecorder, 与 /metrics 的 tts_stage_seconds 相同):
+参考音频 (refer, 其中 cnhubert 为 refer_ssl), 文本前端 (frontend), bert, T2S prompt 处理 (t2s_prompt),
+T2S 逐token解码 (t2s_decode, 及 tokens/s), SoVITS 解码 (sovits), 音频编码 (encode)
+默认关闭前端/参考音频/合成音频缓存, 每次请求都走完整流程; --keep_caches 保留缓存
+结果为 json (含当前 git commit), 可在不同提交之间对比
+"""
+import argparse
+import json
+import os
+import shlex
+import subprocess
+import sys
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CORPUS_PATH = os.path.join(ROOT, "bench", "corpus.json")
+
+
+def load_corpus(path, languages=None):
+    with open(path, "r", encoding="utf-8") as f:
+        corpus = json.load(f)
+    if languages:
+        corpus = [item for item in corpus if item["language"] in languages]
+    return corpus
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def percentiles(values):
+    if not values:
+        return {}
+    return {
+        "mean": round(float(np.mean(values)), 4),
+        "p50": round(float(np.percentile(values, 50)), 4),
+        "p95": round(float(np.percentile(values, 95)), 4),
+        "max": round(float(np.max(values)), 4),
+    }
+
+
+def load_tts_api(args):
+    """以命令行参数的形式导入 tts_api, 模块级代码会加载 bert/cnhubert/SoVITS/GPT"""
+    os.chdir(ROOT)
+    sys.path.insert(0, ROOT)
+    argv = ["tts_api.py", "-dr", args.refer_path, "-dt", args.refer_text, "-dl", args.refer_language,
+            "-sm", args.stream_mode, "-mt", "pcm_s16le"]
+    if args.sovits_path:
+        argv += ["-s", args.sovits_path]
+    if args.gpt_path:
+        argv += ["-g", args.gpt_path]
+    if args.device:
+        argv += ["-d", args.device]
+    if not args.keep_caches:
+        argv += ["--audio_cache_dir", "", "--frontend_cache_size", "0", "--refer_cache_size", "0"]
+    sys.argv = argv + shlex.split(args.tts_args)
+    import tts_api
+    # 模型在 tts_api 的启动线程中加载
+    tts_api.startup.wait()
+    return tts_api
+
+
+def run_inprocess(args, corpus):
+    tts_api = load_tts_api(args)
+    import torch
+
+    from TTS_infer_pack.spans import SpanRecorder
+
+    sr = tts_api.model_pool.active.model.hps.data.sampling_rate
+
+    def synthesize(item):
+        spans = SpanRecorder()
+        t0 = perf_counter()
+        ttfb = None
+        audio_bytes = 0
+        for chunk in tts_api.get_tts_wav(args.refer_path, args.refer_text, args.refer_language,
+                                         item["text"], item["language"], top_k=args.top_k, top_p=args.top_p,
+                                         temperature=args.temperature, batch_size=args.batch_size,
+                                         media_type="pcm_s16le", spans=spans):
+            if chunk and ttfb is None:
+                ttfb = perf_counter() - t0
+            audio_bytes += len(chunk)
+        latency = perf_counter() - t0
+        duration = audio_bytes / 2 / sr
+        tokens_per_sec = spans.tokens_per_sec()
+        return {
+            "id": item["id"],
+            "language": item["language"],
+            "latency": round(latency, 4),
+            "ttfb": round(ttfb if ttfb is not None else latency, 4),
+            "audio_seconds": round(duration, 3),
+            "rtf": round(latency / max(duration, 1e-6), 4),
+            "tokens": spans.tokens,
+            "tokens_per_sec": round(tokens_per_sec, 2) if tokens_per_sec else None,
+            "stages": spans.as_dict(),
+        }
+
+    for item in corpus[:args.warmup]:
+        synthesize(item)
+    results = []
+    for _ in range(args.repeat):
+        for item in corpus:
+            row = synthesize(item)
+            results.append(row)
+            print(f"{row['id']:<12} RTF {row['rtf']:.3f} | {row['latency']:.3f}s | TTFB {row['ttfb']:.3f}s | "
+                  f"{row['tokens_per_sec'] or 0:.1f} tok/s")
+    config = {
+        "device": str(tts_api.device),
+        "is_half": tts_api.is_half,
+        "backend": getattr(tts_api, "backend", "torch"),
+        "stream_mode": tts_api.stream_mode,
+        "sampling_rate": sr,
+        "threads": torch.get_num_threads(),
+        "tts_args": args.tts_args,
+    }
+    return config, results
+
+
+def run_http(args, corpus):
+    url = args.url.rstrip("/") + "/"
+
+    def request(item):
+        payload = {
+            "text": item["text"],
+            "text_language": item["language"],
+            "top_k": args.top_k,
+            "top_p": args.top_p,
+            "temperature": args.temperature,
+            "media_type": "pcm_s16le",
+        }
+        if args.refer_path:
+            payload.update(refer_wav_path=args.refer_path, prompt_text=args.refer_text,
+                           prompt_language=args.refer_language)
+        if args.voice_id:
+            payload["voice_id"] = args.voice_id
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        req = urllib.request.Request(url, data=data, headers={"Content-Type": "application/json"})
+        t0 = perf_counter()
+        ttfb = None
+        audio_bytes = 0
+        with urllib.request.urlopen(req, timeout=args.timeout) as resp:
+            sr = int(resp.headers.get("X-Sample-Rate", 32000))
+            server_ttfb = resp.headers.get("X-TTFB-Ms")
+            while True:
+                chunk = resp.read1(65536)
+                if not chunk:
+                    break
+                if ttfb is None:
+                    ttfb = perf_counter() - t0
+                audio_bytes += len(chunk)
+        latency = perf_counter() - t0
+        duration = audio_bytes / 2 / sr
+        return {
+            "id": item["id"],
+            "language": item["language"],
+            "latency": round(latency, 4),
+            "ttfb": round(ttfb if ttfb is not None else latency, 4),
+            "server_ttfb": round(float(server_ttfb) / 1000, 4) if server_ttfb else None,
+            "audio_seconds": round(duration, 3),
+            "rtf": round(latency / max(duration, 1e-6), 4),
+        }
+
+    for item in corpus[:args.warmup]:
+        request(item)
+    jobs = [item for _ in range(args.repeat) for item in corpus]
+    t0 = perf_counter()
+    with ThreadPoolExecutor(max_workers=max(args.concurrency, 1)) as pool:
+        results = []
+        for row in pool.map(request, jobs):
+            results.append(row)
+            print(f"{row['id']:<12} RTF {row['rtf']:.3f} | {row['latency']:.3f}s | TTFB {row['ttfb']:.3f}s")
+    wall = perf_counter() - t0
+    config = {"url": args.url, "concurrency": args.concurrency, "wall_seconds": round(wall, 3),
+              "requests_per_sec": round(len(jobs) / wall, 3)}
+    return config, results
+
+
+def summarize(results):
+    summary = {
+        "requests": len(results),
+        "audio_seconds": round(sum(row["audio_seconds"] for row in results), 3),
+        "rtf": percentiles([row["rtf"] for row in results]),
+        "latency": percentiles([row["latency"] for row in results]),
+        "ttfb": percentiles([row["ttfb"] for row in results]),
+    }
+    total_latency = sum(row["latency"] for row in results)
+    summary["overall_rtf"] = round(total_latency / max(summary["audio_seconds"], 1e-6), 4)
+    if results and "stages" in results[0]:
+        stage_names = sorted({stage for row in results for stage in row["stages"]})
+        summary["stages"] = {stage: percentiles([row["stages"].get(stage, 0.0) for row in results])
+                             for stage in stage_names}
+        tokens = sum(row["tokens"] for row in results)
+        decode_seconds = sum(row["stages"].get("t2s_decode", 0.0) for row in results)
+        summary["tokens"] = tokens
+        summary["tokens_per_sec"] = round(tokens / decode_seconds, 2) if decode_seconds else None
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="TTS benchmark")
+    parser.add_argument("mode", choices=["inprocess", "http"], help="进程内调用 get_tts_wav / 请求HTTP服务")
+    parser.add_argument("--corpus", type=str, default=CORPUS_PATH, help="语料json")
+    parser.add_argument("--languages", type=str, nargs="*", default=None, help="只测这些语种")
+    parser.add_argument("-dr", "--refer_path", type=str, default="", help="参考音频路径, http模式可为空(用服务端默认)")
+    parser.add_argument("-dt", "--refer_text", type=str, default="", help="参考音频文本")
+    parser.add_argument("-dl", "--refer_language", type=str, default="zh", help="参考音频语种")
+    parser.add_argument("--top_k", type=int, default=15)
+    parser.add_argument("--top_p", type=float, default=1.0)
+    parser.add_argument("--temperature", type=float, default=1.0)
+    parser.add_argument("--repeat", type=int, default=1, help="语料重复轮数")
+    parser.add_argument("--warmup", type=int, default=1, help="正式计时前预热的句数")
+    parser.add_argument("--output", type=str, default="", help="结果json输出路径")
+    # 进程内
+    parser.add_argument("-s", "--sovits_path", type=str, default="", help="SoVITS模型路径, 默认同 tts_api")
+    parser.add_argument("-g", "--gpt_path", type=str, default="", help="GPT模型路径, 默认同 tts_api")
+    parser.add_argument("-d", "--device", type=str, default="", help="cuda / cpu, 默认同 tts_api")
+    parser.add_argument("-sm", "--stream_mode", type=str, default="normal", help="close / normal / chunk")
+    parser.add_argument("-bs", "--batch_size", type=int, default=1)
+    parser.add_argument("--keep_caches", action="store_true", help="保留 tts_api 的前端/参考音频/合成音频缓存")
+    parser.add_argument("--tts_args", type=str, default="", help="额外传给 tts_api 的参数, 如 \"--quantize int8\"")
+    # 进程外
+    parser.add_argument("--url", type=str, default="http://127.0.0.1:9880", help="tts_api 服务地址")
+    parser.add_argument("--voice_id", type=str, default="", help="请求的 voice_id")
+    parser.add_argument("--concurrency", type=int, default=1, help="并发请求数")
+    parser.add_argument("--timeout", type=float, default=300, help="单个请求超时(秒)")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus, args.languages)
+    if args.mode == "inprocess":
+        if not args.refer_path or not args.refer_text:
+            parser.error("inprocess 模式需要 -dr/-dt 指定参考音频")
+        config, results = run_inprocess(args, corpus)
+    else:
+        config, results = run_http(args, corpus)
+
+    summary = summarize(results)
+    print(json.dumps(summary, ensure_ascii=False, indent=4))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"mode": args.mode, "commit": git_commit(), "config": config,
+                       "summary": summary, "results": results}, f, ensure_ascii=False, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+"""
+ONNX 导出一致性校验: 固定随机种子的输入分别跑 PyTorch 与 onnxruntime, 比较各个图的输出
+
+用法 (在 tts-studio 目录下, 先运行 onnx_export.py 导出):
+    python bench/onnx_parity.py -s tts-model/merge.pth -g tts-model/merge.ckpt
+    python bench/onnx_parity.py -s tts-model/merge.pth -g tts-model/merge.ckpt --onnx_dir onnx/merge --threads 4
+
+校验项:
+    encoder / fsdec / sdec   与导出所用的 PyTorch 模块 (t2s_model_onnx) 比较 x, k, v, y_emb, logits
+    vits                     noise_scale=0 时与导出模块及 module.models.SynthesizerTrn.decode (tts_api 所用) 比较音频
+    sampling                 相同指数噪声下, 主机侧采样与 AR.models.utils.sample 选出的token及用于EOS判断的argmax是否一致
+    e2e.token_match          top_k=1 时 OnnxVoiceModel.infer_panel 与 tts_api 所用 Text2SemanticDecoder.infer_panel
+                             完整解码出的语义token逐位一致的比例 (按较长的一方计)
+    e2e.audio                上述 torch 解码结果分别经 onnxruntime 与 SynthesizerTrn.decode 合成的音频误差
+任一项超过容差 (误差大于 atol, 或token一致比例低于 --token_match) 时以非0状态退出, 同时输出每个图 torch/onnxruntime 的耗时
+"""
+import argparse
+import json
+import os
+import sys
+from time import perf_counter
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import torch
+
+from AR.models.t2s_lightning_module import Text2SemanticLightningModule
+from AR.models.utils import sample
+from module.models import SynthesizerTrn
+from onnx_export import VitsModel, default_output_dir, example_inputs, load_t2s
+from TTS_infer_pack.onnx_backend import OnnxVoiceModel, sample_token
+
+
+class FixedNoise:
+    """让主机侧采样使用给定的指数噪声, 与 torch 采样逐token比较"""
+
+    def __init__(self, q):
+        self.q = q
+
+    def exponential(self, size=None):
+        return self.q
+
+
+def max_abs(a, b):
+    return float(np.max(np.abs(np.asarray(a, dtype=np.float32) - np.asarray(b, dtype=np.float32))))
+
+
+def best_time(fn, repeat):
+    best = None
+    for _ in range(repeat):
+        t0 = perf_counter()
+        fn()
+        elapsed = perf_counter() - t0
+        best = elapsed if best is None else min(best, elapsed)
+    return round(best * 1000, 3)
+
+
+def load_reference_vits(sovits_path, hps):
+    """tts_api 使用的 SynthesizerTrn (module.models), 全精度CPU"""
+    dict_s2 = torch.load(sovits_path, map_location="cpu", weights_only=False)
+    vq_model = SynthesizerTrn(
+        hps.data.filter_length // 2 + 1,
+        hps.train.segment_size // hps.data.hop_length,
+        n_speakers=hps.data.n_speakers,
+        **vars(hps.model)
+    )
+    vq_model.eval()
+    vq_model.load_state_dict(dict_s2["weight"], strict=False)
+    return vq_model
+
+
+def load_reference_t2s(gpt_path):
+    """tts_api 使用的 Text2SemanticDecoder (AR.models.t2s_model), 全精度CPU"""
+    dict_s1 = torch.load(gpt_path, map_location="cpu", weights_only=False)
+    t2s_model = Text2SemanticLightningModule(dict_s1["config"], "****", is_train=False)
+    t2s_model.load_state_dict(dict_s1["weight"])
+    t2s_model.eval()
+    return t2s_model.model
+
+
+def token_match_ratio(a, b):
+    """逐位一致的token数 / 较长序列的长度"""
+    a, b = np.asarray(a).reshape(-1), np.asarray(b).reshape(-1)
+    length = max(len(a), len(b))
+    if length == 0:
+        return 1.0
+    n = min(len(a), len(b))
+    return float(np.sum(a[:n] == b[:n])) / length
+
+
+def check_sampling(vocab_size, trials, seed):
+    generator = torch.Generator().manual_seed(seed)
+    mismatches = 0
+    for trial in range(trials):
+        logits = torch.randn(vocab_size, generator=generator) * 3
+        previous = torch.randint(0, vocab_size, (1, 50), generator=generator)
+        top_k, top_p, temperature = [(5, 1.0, 1.0), (15, 0.8, 0.6), (20, 0.6, 1.2)][trial % 3]
+        q = torch.empty(vocab_size).exponential_(1, generator=generator)
+        penalized = logits.clone()  # sample 原地做重复惩罚, infer_panel 用其 argmax 判断EOS
+        probs = sample(penalized, previous, top_k=top_k, top_p=top_p, temperature=temperature,
+                       repetition_penalty=1.35)[1]
+        expected = int(torch.argmax(probs / q))
+        token, argmax = sample_token(logits.numpy(), previous[0].numpy(), top_k, top_p, temperature, 1.35,
+                                     FixedNoise(q.numpy()))
+        mismatches += int(token != expected or argmax != int(torch.argmax(penalized)))
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ONNX export parity check")
+    parser.add_argument("-s", "--sovits_path", type=str, required=True, help="SoVITS模型路径")
+    parser.add_argument("-g", "--gpt_path", type=str, required=True, help="GPT模型路径")
+    parser.add_argument("--onnx_dir", type=str, default="", help="onnx_export.py 的输出目录, 默认 onnx/<SoVITS文件名>")
+    parser.add_argument("--seeds", type=int, nargs="+", default=[0, 1, 2], help="输入的随机种子")
+    parser.add_argument("--steps", type=int, default=8, help="逐步解码比较的步数")
+    parser.add_argument("--atol", type=float, default=1e-3, help="T2S 各输出的最大绝对误差")
+    parser.add_argument("--audio_atol", type=float, default=1e-2, help="音频的最大绝对误差")
+    parser.add_argument("--sampling_trials", type=int, default=300, help="采样一致性比较的次数")
+    parser.add_argument("--token_match", type=float, default=0.95, help="完整解码时语义token一致比例的下限")
+    parser.add_argument("--e2e_tokens", type=int, default=200, help="完整解码的最大token数 (early_stop_num)")
+    parser.add_argument("--threads", type=int, default=0, help="torch/onnxruntime 线程数, 0为默认")
+    parser.add_argument("--repeat", type=int, default=3, help="计时重复次数, 取最好成绩")
+    parser.add_argument("--output", type=str, default="", help="结果json输出路径")
+    args = parser.parse_args()
+
+    if args.threads > 0:
+        torch.set_num_threads(args.threads)
+    onnx_dir = args.onnx_dir or default_output_dir(args.sovits_path)
+    onnx_model = OnnxVoiceModel(onnx_dir, args.threads)
+    t2s, _ = load_t2s(args.gpt_path)
+    vits = VitsModel(args.sovits_path)
+    reference_vits = load_reference_vits(args.sovits_path, vits.hps)
+    reference_t2s = load_reference_t2s(args.gpt_path)
+
+    errors = {}
+    timings = {}
+    token_matches = {}
+
+    def record(name, value):
+        errors[name] = max(errors.get(name, 0.0), value)
+
+    with torch.no_grad():
+        for seed in args.seeds:
+            inputs = example_inputs(vits.hps, seed=seed)
+            np_inputs = {name: tensor.numpy() for name, tensor in inputs.items()}
+
+            x = t2s.onnx_encoder(inputs["phoneme_ids"], inputs["bert"])
+            ort_x = onnx_model.encoder.run(None, {"phoneme_ids": np_inputs["phoneme_ids"], "bert": np_inputs["bert"]})[0]
+            record("encoder.x", max_abs(x, ort_x))
+
+            # 两边都喂 torch 的 x, 逐图隔离误差
+            y, k, v, y_emb, x_example, logits = t2s.first_stage_decoder(x, inputs["prompts"])
+            _, ort_k, ort_v, ort_y_emb, _, ort_logits = onnx_model.fsdec.run(
+                None, {"x": x.numpy(), "prompts": np_inputs["prompts"]})
+            record("fsdec.k", max_abs(k, ort_k))
+            record("fsdec.v", max_abs(v, ort_v))
+            record("fsdec.y_emb", max_abs(y_emb, ort_y_emb))
+            record("fsdec.logits", max_abs(logits, ort_logits))
+
+            for _ in range(args.steps):
+                ort_y, ort_k, ort_v, ort_y_emb, ort_logits, _ = onnx_model.sdec.run(None, {
+                    "iy": y.numpy(), "ik": k.numpy(), "iv": v.numpy(), "iy_emb": y_emb.numpy(),
+                    "ix_example": x_example.numpy()})
+                y, k, v, y_emb, logits, _ = t2s.stage_decoder(y, k, v, y_emb, x_example)
+                record("sdec.k", max_abs(k, ort_k))
+                record("sdec.v", max_abs(v, ort_v))
+                record("sdec.y_emb", max_abs(y_emb, ort_y_emb))
+                record("sdec.logits", max_abs(logits, ort_logits))
+
+            noise_scale = torch.tensor([0.0])
+            audio = vits(inputs["text_seq"], inputs["pred_semantic"], inputs["refer"], noise_scale)
+            ort_audio = onnx_model.decode(np_inputs["pred_semantic"], np_inputs["text_seq"], np_inputs["refer"], 0.0)
+            reference_audio = reference_vits.decode(inputs["pred_semantic"], inputs["text_seq"], inputs["refer"],
+                                                    noise_scale=0.0)[0, 0]
+            record("vits.audio", max_abs(audio, ort_audio))
+            record("vits.audio_vs_models", max_abs(reference_audio, ort_audio))
+
+            # 完整解码: top_k=1 时两边都是确定的, 只有数值误差会让序列分叉
+            pred, idx = reference_t2s.infer_panel(
+                inputs["phoneme_ids"], torch.tensor([inputs["phoneme_ids"].shape[1]]), inputs["prompts"],
+                inputs["bert"], top_k=1, top_p=1, temperature=1, early_stop_num=args.e2e_tokens)
+            tokens = pred[:, -idx:] if idx > 0 else pred[:, :0]
+            ort_pred, ort_idx = onnx_model.infer_panel(
+                np_inputs["phoneme_ids"], np_inputs["bert"], np_inputs["prompts"], top_k=1, top_p=1,
+                temperature=1, early_stop_num=args.e2e_tokens)
+            ort_tokens = ort_pred[:, -ort_idx:] if ort_idx > 0 else ort_pred[:, :0]
+            token_matches[seed] = token_match_ratio(tokens.numpy(), ort_tokens)
+            if tokens.shape[1] > 0:
+                semantic = tokens.long().unsqueeze(0)
+                reference_audio = reference_vits.decode(semantic, inputs["text_seq"], inputs["refer"],
+                                                        noise_scale=0.0)[0, 0]
+                ort_audio = onnx_model.decode(semantic.numpy(), np_inputs["text_seq"], np_inputs["refer"], 0.0)
+                record("e2e.audio", max_abs(reference_audio, ort_audio))
+
+        inputs = example_inputs(vits.hps, seed=args.seeds[0])
+        np_inputs = {name: tensor.numpy() for name, tensor in inputs.items()}
+        x = t2s.onnx_encoder(inputs["phoneme_ids"], inputs["bert"])
+        y, k, v, y_emb, x_example, _ = t2s.first_stage_decoder(x, inputs["prompts"])
+        step_feed = {"iy": y.numpy(), "ik": k.numpy(), "iv": v.numpy(), "iy_emb": y_emb.numpy(),
+                     "ix_example": x_example.numpy()}
+        timings["sdec_ms"] = {
+            "torch": best_time(lambda: t2s.stage_decoder(y, k, v, y_emb, x_example), args.repeat),
+            "onnxruntime": best_time(lambda: onnx_model.sdec.run(None, step_feed), args.repeat),
+        }
+        timings["vits_ms"] = {
+            "torch": best_time(lambda: reference_vits.decode(inputs["pred_semantic"], inputs["text_seq"],
+                                                             inputs["refer"]), args.repeat),
+            "onnxruntime": best_time(lambda: onnx_model.decode(np_inputs["pred_semantic"], np_inputs["text_seq"],
+                                                               np_inputs["refer"]), args.repeat),
+        }
+
+    sampling_mismatches = check_sampling(t2s.vocab_size, args.sampling_trials, args.seeds[0])
+
+    failed = []
+    for name, value in errors.items():
+        tolerance = args.audio_atol if name.endswith("audio") or name.startswith("vits.") else args.atol
+        ok = value <= tolerance
+        if not ok:
+            failed.append(name)
+        print(f"{name:<22} max abs err {value:.3e} (tol {tolerance:.0e}) {'ok' if ok else 'FAIL'}")
+    print(f"{'sampling':<22} {sampling_mismatches}/{args.sampling_trials} mismatches "
+          f"{'ok' if sampling_mismatches == 0 else 'FAIL'}")
+    if sampling_mismatches:
+        failed.append("sampling")
+    for seed, ratio in token_matches.items():
+        ok = ratio >= args.token_match
+        if not ok:
+            failed.append(f"e2e.token_match[{seed}]")
+        print(f"{f'e2e.token_match[{seed}]':<22} {ratio:.3f} (min {args.token_match}) {'ok' if ok else 'FAIL'}")
+    for name, row in timings.items():
+        print(f"{name:<22} torch {row['torch']:>9.3f} ms | onnxruntime {row['onnxruntime']:>9.3f} ms")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({
+                "onnx_dir": onnx_dir,
+                "seeds": args.seeds,
+                "threads": torch.get_num_threads(),
+                "max_abs_errors": errors,
+                "sampling_mismatches": sampling_mismatches,
+                "token_match": token_matches,
+                "timings": timings,
+                "failed": failed,
+            }, f, indent=4)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
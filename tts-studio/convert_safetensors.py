@@ -0,0 +1,63 @@
+"""
+把 SoVITS (.pth) / GPT (.ckpt) 权重转换为 safetensors + json 配置, 供 tts_api.py 以 mmap 加载
+
+用法 (在 tts-studio 目录下, 需安装 safetensors):
+    python convert_safetensors.py tts-model/merge.pth tts-model/merge.ckpt
+
+每个文件在同目录下生成 <名称>.safetensors (权重, 保持原精度) 与 <名称>.json (config 等其余字段及源文件大小/mtime);
+tts_api 仍按原路径指定模型即可, 源文件未变化时自动改用转换结果, 源文件更新后需重新转换
+转换后会用两种格式各加载一次并逐个张量比较
+"""
+import argparse
+import os
+import sys
+
+import torch
+
+now_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(now_dir)
+
+from TTS_infer_pack.weights import convert_checkpoint, safetensors_available
+
+
+def verify(path, safetensors_path):
+    """原格式与转换结果的权重逐个比较, 返回不一致的键"""
+    from safetensors import safe_open
+
+    original = torch.load(path, map_location="cpu", weights_only=False)["weight"]
+    mismatched = []
+    with safe_open(safetensors_path, framework="pt", device="cpu") as f:
+        names = set(f.keys())
+        for name, tensor in original.items():
+            if name not in names or not torch.equal(f.get_tensor(name), tensor):
+                mismatched.append(name)
+    return mismatched
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert GPT-SoVITS checkpoints to safetensors")
+    parser.add_argument("paths", nargs="+", help="SoVITS .pth / GPT .ckpt 路径")
+    parser.add_argument("--no_verify", action="store_true", default=False, help="转换后不比较权重")
+    args = parser.parse_args()
+
+    if not safetensors_available():
+        print("未安装 safetensors: pip install safetensors")
+        sys.exit(1)
+
+    failed = False
+    for path in args.paths:
+        safetensors_path, json_path = convert_checkpoint(path)
+        size_mb = os.path.getsize(safetensors_path) / 1024 / 1024
+        print(f"{path} -> {safetensors_path} ({size_mb:.1f}MB), {json_path}")
+        if not args.no_verify:
+            mismatched = verify(path, safetensors_path)
+            if mismatched:
+                failed = True
+                print(f"  权重不一致: {mismatched[:10]}")
+            else:
+                print("  校验通过")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -984,27 +984,30 @@ class SynthesizerTrn(nn.Module):
         return o, y_mask, (z, z_p, m_p, logs_p)
 
     @torch.no_grad()
-    def decode(self, codes, text, refer, noise_scale=0.5,speed=1):
-        def get_ge(refer):
-            ge = None
-            if refer is not None:
-                refer_lengths = torch.LongTensor([refer.size(2)]).to(refer.device)
-                refer_mask = torch.unsqueeze(
-                    commons.sequence_mask(refer_lengths, refer.size(2)), 1
-                ).to(refer.dtype)
-                if (self.version == "v1"):
-                    ge = self.ref_enc(refer * refer_mask, refer_mask)
-                else:
-                    ge = self.ref_enc(refer[:, :704] * refer_mask, refer_mask)
-            return ge
-        if(type(refer)==list):
-            ges=[]
-            for _refer in refer:
-                ge=get_ge(_refer)
-                ges.append(ge)
-            ge=torch.stack(ges,0).mean(0)
-        else:
-            ge=get_ge(refer)
+    def get_ge(self, refer):
+        """
+        参考音频频谱 refer [1, F, T] 的音色向量 ge [1, gin_channels, 1]; refer 为列表时取平均, 为 None 时返回 None
+        ge 只与参考音频有关, 可预先算好传给 decode
+        """
+        if type(refer) == list:
+            ges = [self.get_ge(_refer) for _refer in refer]
+            return torch.stack(ges, 0).mean(0)
+        ge = None
+        if refer is not None:
+            refer_lengths = torch.LongTensor([refer.size(2)]).to(refer.device)
+            refer_mask = torch.unsqueeze(
+                commons.sequence_mask(refer_lengths, refer.size(2)), 1
+            ).to(refer.dtype)
+            if (self.version == "v1"):
+                ge = self.ref_enc(refer * refer_mask, refer_mask)
+            else:
+                ge = self.ref_enc(refer[:, :704] * refer_mask, refer_mask)
+        return ge
+
+    @torch.no_grad()
+    def decode(self, codes, text, refer, noise_scale=0.5,speed=1,ge=None):
+        if ge is None:
+            ge = self.get_ge(refer)
 
         y_lengths = torch.LongTensor([codes.size(2) * 2]).to(codes.device)
         text_lengths = torch.LongTensor([text.size(-1)]).to(text.device)
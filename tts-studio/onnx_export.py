@@ -0,0 +1,213 @@
+"""
+把 GPT/SoVITS 模型导出为 ONNX, 供 tts_api.py --backend onnx 在 CPU 上用 onnxruntime 推理
+
+用法 (在 tts-studio 目录下):
+    python onnx_export.py -s tts-model/merge.pth -g tts-model/merge.ckpt
+    python onnx_export.py -s tts-model/merge.pth -g tts-model/merge.ckpt -o onnx/merge --opset 17
+
+输出目录 (默认 onnx/<SoVITS文件名>) 下的文件:
+    t2s_encoder.onnx  文本编码       (phoneme_ids [1, L], bert [1, 1024, L]) -> x
+    t2s_fsdec.onnx    首步解码       (x, prompts) -> (y, k, v, y_emb, x_example, logits)
+    t2s_sdec.onnx     逐步解码       (iy, ik, iv, iy_emb, ix_example) -> (y, k, v, y_emb, logits, samples)
+                      KV cache 作为显式的输入输出, 每步把上一步输出的 k/v/y_emb 原样传回
+    vits.onnx         SoVITS 解码    (text_seq, pred_semantic [1, 1, T], refer, noise_scale) -> audio
+    config.json       采样率, 版本, EOS, max_sec 及源模型路径
+
+图中自带的采样固定为 top_k=模型配置, top_p=1, 推理时改为在主机侧按请求参数从 logits 采样
+"""
+import argparse
+import json
+import os
+import sys
+
+import torch
+from torch import nn
+
+now_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(now_dir)
+
+from AR.models.t2s_lightning_module_onnx import Text2SemanticLightningModule
+from module.models_onnx import SynthesizerTrn
+from TTS_infer_pack.onnx_backend import ONNX_FILES
+
+
+class DictToAttrRecursive(dict):
+    def __init__(self, input_dict):
+        super().__init__(input_dict)
+        for key, value in input_dict.items():
+            if isinstance(value, dict):
+                value = DictToAttrRecursive(value)
+            self[key] = value
+            setattr(self, key, value)
+
+
+def load_t2s(gpt_path):
+    dict_s1 = torch.load(gpt_path, map_location="cpu")
+    config = dict_s1["config"]
+    t2s_model = Text2SemanticLightningModule(config, "****", is_train=False)
+    t2s_model.load_state_dict(dict_s1["weight"])
+    t2s_model.eval()
+    model = t2s_model.model
+    model.top_k = torch.LongTensor([config.get("inference", {}).get("top_k", 15)])
+    model.early_stop_num = torch.LongTensor([50 * config["data"]["max_sec"]])
+    model.init_onnx()
+    return model, config
+
+
+class VitsModel(nn.Module):
+    """SoVITS 解码部分 (不含 enc_q), 输出单声道音频 [samples]"""
+
+    def __init__(self, sovits_path):
+        super().__init__()
+        dict_s2 = torch.load(sovits_path, map_location="cpu", weights_only=False)
+        hps = DictToAttrRecursive(dict_s2["config"])
+        hps.model.semantic_frame_rate = "25hz"
+        if dict_s2["weight"]["enc_p.text_embedding.weight"].shape[0] == 322:
+            hps.model.version = "v1"
+        else:
+            hps.model.version = "v2"
+        self.hps = hps
+        self.vq_model = SynthesizerTrn(
+            hps.data.filter_length // 2 + 1,
+            hps.train.segment_size // hps.data.hop_length,
+            n_speakers=hps.data.n_speakers,
+            **vars(hps.model)
+        )
+        self.vq_model.eval()
+        self.vq_model.load_state_dict(dict_s2["weight"], strict=False)
+
+    def forward(self, text_seq, pred_semantic, refer, noise_scale):
+        return self.vq_model(pred_semantic, text_seq, refer, noise_scale=noise_scale)[0, 0]
+
+
+def example_inputs(hps, seed=0, text_len=40, prompt_len=60, semantic_len=80, refer_len=120):
+    """固定随机种子的示例输入, 导出与一致性校验 (bench/onnx_parity.py) 共用"""
+    generator = torch.Generator().manual_seed(seed)
+    # 取 v1/v2 符号表都合法的音素id
+    phoneme_ids = torch.randint(0, 300, (1, text_len), generator=generator)
+    bert = torch.randn((1, 1024, text_len), generator=generator)
+    prompts = torch.randint(0, 1024, (1, prompt_len), generator=generator)
+    text_seq = torch.randint(0, 300, (1, text_len // 2), generator=generator)
+    pred_semantic = torch.randint(0, 1024, (1, 1, semantic_len), generator=generator)
+    refer = torch.rand((1, hps.data.filter_length // 2 + 1, refer_len), generator=generator)
+    return {
+        "phoneme_ids": phoneme_ids,
+        "bert": bert,
+        "prompts": prompts,
+        "text_seq": text_seq,
+        "pred_semantic": pred_semantic,
+        "refer": refer,
+    }
+
+
+def export(sovits_path, gpt_path, output_dir, opset=17):
+    os.makedirs(output_dir, exist_ok=True)
+    t2s, config = load_t2s(gpt_path)
+    vits = VitsModel(sovits_path)
+    inputs = example_inputs(vits.hps)
+
+    with torch.no_grad():
+        torch.onnx.export(
+            t2s.onnx_encoder,
+            (inputs["phoneme_ids"], inputs["bert"]),
+            os.path.join(output_dir, ONNX_FILES["encoder"]),
+            input_names=["phoneme_ids", "bert"],
+            output_names=["x"],
+            dynamic_axes={
+                "phoneme_ids": {1: "text_length"},
+                "bert": {2: "text_length"},
+                "x": {1: "text_length"},
+            },
+            opset_version=opset,
+        )
+        x = t2s.onnx_encoder(inputs["phoneme_ids"], inputs["bert"])
+
+        torch.onnx.export(
+            t2s.first_stage_decoder,
+            (x, inputs["prompts"]),
+            os.path.join(output_dir, ONNX_FILES["fsdec"]),
+            input_names=["x", "prompts"],
+            output_names=["y", "k", "v", "y_emb", "x_example", "logits"],
+            dynamic_axes={
+                "x": {1: "text_length"},
+                "prompts": {1: "prompt_length"},
+                "y": {1: "y_length"},
+                "k": {1: "kv_length"},
+                "v": {1: "kv_length"},
+                "y_emb": {1: "prompt_length"},
+                "x_example": {1: "text_length"},
+            },
+            opset_version=opset,
+        )
+        y, k, v, y_emb, x_example, _ = t2s.first_stage_decoder(x, inputs["prompts"])
+
+        torch.onnx.export(
+            t2s.stage_decoder,
+            (y, k, v, y_emb, x_example),
+            os.path.join(output_dir, ONNX_FILES["sdec"]),
+            input_names=["iy", "ik", "iv", "iy_emb", "ix_example"],
+            output_names=["y", "k", "v", "y_emb", "logits", "samples"],
+            dynamic_axes={
+                "iy": {1: "iy_length"},
+                "ik": {1: "ik_length"},
+                "iv": {1: "iv_length"},
+                "iy_emb": {1: "iy_emb_length"},
+                "ix_example": {1: "ix_example_length"},
+                "y": {1: "y_length"},
+                "k": {1: "k_length"},
+                "v": {1: "v_length"},
+                "y_emb": {1: "y_emb_length"},
+            },
+            opset_version=opset,
+        )
+
+        torch.onnx.export(
+            vits,
+            (inputs["text_seq"], inputs["pred_semantic"], inputs["refer"], torch.tensor([0.5])),
+            os.path.join(output_dir, ONNX_FILES["vits"]),
+            input_names=["text_seq", "pred_semantic", "refer", "noise_scale"],
+            output_names=["audio"],
+            dynamic_axes={
+                "text_seq": {1: "text_length"},
+                "pred_semantic": {2: "pred_length"},
+                "refer": {2: "refer_length"},
+                "audio": {0: "audio_length"},
+            },
+            opset_version=opset,
+        )
+
+    meta = {
+        "sovits_path": os.path.abspath(sovits_path),
+        "gpt_path": os.path.abspath(gpt_path),
+        "version": vits.hps.model.version,
+        "sampling_rate": vits.hps.data.sampling_rate,
+        "eos": t2s.EOS,
+        "num_layers": t2s.num_layers,
+        "hz": 50,
+        "max_sec": config["data"]["max_sec"],
+        "opset": opset,
+    }
+    with open(os.path.join(output_dir, "config.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    return meta
+
+
+def default_output_dir(sovits_path):
+    return os.path.join("onnx", os.path.splitext(os.path.basename(sovits_path))[0])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="GPT-SoVITS ONNX 导出")
+    parser.add_argument("-s", "--sovits_path", type=str, required=True, help="SoVITS模型路径")
+    parser.add_argument("-g", "--gpt_path", type=str, required=True, help="GPT模型路径")
+    parser.add_argument("-o", "--output_dir", type=str, default="", help="输出目录, 默认 onnx/<SoVITS文件名>")
+    parser.add_argument("--opset", type=int, default=17, help="ONNX opset 版本")
+    args = parser.parse_args()
+
+    output_dir = args.output_dir or default_output_dir(args.sovits_path)
+    meta = export(args.sovits_path, args.gpt_path, output_dir, args.opset)
+    print(f"已导出到 {output_dir}: sovits版本 {meta['version']}, 采样率 {meta['sampling_rate']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,16 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from TTS_infer_pack import metrics  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def metrics_registry(monkeypatch):
+    """调度器等组件构造时向全局 REGISTRY 注册指标 (重名报错), 每个测试换一个新的"""
+    registry = metrics.MetricsRegistry()
+    monkeypatch.setattr(metrics, "REGISTRY", registry)
+    return registry
@@ -0,0 +1,56 @@
+import os
+
+from TTS_infer_pack.audio_cache import AudioCache, make_key
+
+
+def test_make_key_ignores_argument_order():
+    assert make_key(text="a", speed=1.0) == make_key(speed=1.0, text="a")
+    assert make_key(text="a", speed=1.0) != make_key(text="a", speed=1.1)
+
+
+def test_put_get_roundtrip_and_stats(tmp_path):
+    cache = AudioCache(str(tmp_path), max_bytes=1000, memory_max_bytes=1000)
+    assert cache.get("k") is None
+    cache.put("k", b"audio")
+    assert "k" in cache
+    assert cache.get("k") == b"audio"
+    stats = cache.stats()
+    assert (stats["entries"], stats["disk_bytes"], stats["hits"], stats["misses"]) == (1, 5, 1, 1)
+
+
+def test_disk_evicts_least_recently_used(tmp_path):
+    cache = AudioCache(str(tmp_path), max_bytes=20, memory_max_bytes=0)
+    cache.put("a", b"x" * 8)
+    cache.put("b", b"y" * 8)
+    assert cache.get("a") == b"x" * 8  # a 变为最近使用
+    cache.put("c", b"z" * 8)
+    assert "b" not in cache
+    assert not os.path.exists(tmp_path / "b.bin")
+    assert cache.get("a") == b"x" * 8
+    assert cache.get("c") == b"z" * 8
+    assert cache.stats()["disk_bytes"] == 16
+
+
+def test_memory_layer_is_bounded_separately(tmp_path):
+    cache = AudioCache(str(tmp_path), max_bytes=100, memory_max_bytes=10)
+    cache.put("a", b"x" * 6)
+    cache.put("b", b"y" * 6)
+    stats = cache.stats()
+    assert (stats["memory_entries"], stats["memory_bytes"], stats["entries"]) == (1, 6, 2)
+    assert cache.get("a") == b"x" * 6  # 从磁盘读回
+
+
+def test_oversized_and_empty_entries_are_not_stored(tmp_path):
+    cache = AudioCache(str(tmp_path), max_bytes=10, memory_max_bytes=10)
+    cache.put("big", b"x" * 11)
+    cache.put("empty", b"")
+    assert "big" not in cache
+    assert "empty" not in cache
+
+
+def test_index_is_rebuilt_from_disk(tmp_path):
+    cache = AudioCache(str(tmp_path), max_bytes=100, memory_max_bytes=100)
+    cache.put("a", b"audio")
+    reopened = AudioCache(str(tmp_path), max_bytes=100, memory_max_bytes=100)
+    assert reopened.get("a") == b"audio"
+    assert reopened.stats()["entries"] == 1
@@ -0,0 +1,80 @@
+import asyncio
+import threading
+import time
+
+from TTS_infer_pack.bert_encoder import BertEncoder
+from TTS_infer_pack.scheduler import InferenceScheduler
+
+
+class FakeTensor:
+    def __init__(self, value):
+        self.value = value
+
+    def to(self, device):
+        return self
+
+    def cpu(self):
+        return self
+
+
+class FakeTokenizer:
+    """与 Hugging Face fast tokenizer 一样, 被另一个线程占用时抛出 RuntimeError: Already borrowed"""
+
+    def __init__(self):
+        self._busy = threading.Lock()
+        self.calls = 0
+
+    def __call__(self, texts, padding, return_tensors):
+        if not self._busy.acquire(blocking=False):
+            raise RuntimeError("Already borrowed")
+        try:
+            time.sleep(0.02)
+            self.calls += 1
+            return {"input_ids": FakeTensor(list(texts))}
+        finally:
+            self._busy.release()
+
+
+class FakeBert:
+    def __init__(self):
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, input_ids, output_hidden_states):
+        with self._lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(0.01)
+        with self._lock:
+            self.active -= 1
+        return {"hidden_states": [FakeTensor(None), FakeTensor(input_ids.value), FakeTensor(None), FakeTensor(None)]}
+
+
+def test_workers_share_one_encoder():
+    tokenizer, model = FakeTokenizer(), FakeBert()
+    encoder = BertEncoder(tokenizer, model, "cpu")
+    both_running = threading.Barrier(2, timeout=5)
+
+    def job_fn(name):
+        def fn(job):
+            both_running.wait()  # 两个工作线程同时开始调用
+            for i in range(5):
+                hidden = encoder.hidden_states([f"{name}{i}"])
+                yield hidden.value[0].encode()
+        return fn
+
+    async def main():
+        scheduler = InferenceScheduler(num_workers=2)
+        scheduler.start()
+        jobs = [scheduler.submit(job_fn(name)) for name in ("a", "b")]
+        return await asyncio.gather(*[collect(job) for job in jobs])
+
+    async def collect(job):
+        return [chunk async for chunk in job.stream()]
+
+    a, b = asyncio.run(main())
+    assert a == [f"a{i}".encode() for i in range(5)]
+    assert b == [f"b{i}".encode() for i in range(5)]
+    assert tokenizer.calls == 10
+    assert model.max_active == 1
@@ -0,0 +1,138 @@
+import asyncio
+
+import pytest
+
+from TTS_infer_pack.coalesce import RequestCoalescer
+
+
+class FakeJob:
+    """与 InferenceJob 接口相同: stream() 按顺序产出音频块, 出错时抛出异常; 由测试通过 feed/finish/fail 驱动"""
+
+    def __init__(self):
+        self.items = asyncio.Queue()
+        self.cancelled = False
+
+    def feed(self, chunk):
+        self.items.put_nowait(("chunk", chunk))
+
+    def finish(self):
+        self.items.put_nowait(("end", None))
+
+    def fail(self, error):
+        self.items.put_nowait(("error", error))
+
+    def cancel(self):
+        self.cancelled = True
+
+    async def stream(self):
+        try:
+            while True:
+                kind, payload = await self.items.get()
+                if kind == "chunk":
+                    yield payload
+                elif kind == "error":
+                    raise payload
+                else:
+                    return
+        finally:
+            self.cancel()
+
+
+def submitter(jobs):
+    def submit():
+        job = FakeJob()
+        jobs.append(job)
+        return job
+    return submit
+
+
+async def collect(stream):
+    return [chunk async for chunk in stream]
+
+
+def test_identical_requests_share_one_job_and_late_subscriber_replays():
+    async def main():
+        coalescer, jobs = RequestCoalescer(), []
+        first, joined_first = coalescer.subscribe("k", submitter(jobs))
+        first_task = asyncio.ensure_future(collect(first))
+        jobs[0].feed(b"a")
+        await asyncio.sleep(0.01)
+        second, joined_second = coalescer.subscribe("k", submitter(jobs))
+        second_task = asyncio.ensure_future(collect(second))
+        jobs[0].feed(b"b")
+        jobs[0].finish()
+        assert await first_task == [b"a", b"b"]
+        assert await second_task == [b"a", b"b"]
+        assert (joined_first, joined_second) == (False, True)
+        assert len(jobs) == 1
+        assert coalescer.coalesced.value() == 1
+        await asyncio.sleep(0)
+        assert coalescer.flights == {}
+
+    asyncio.run(main())
+
+
+def test_different_keys_and_finished_flights_submit_new_jobs():
+    async def main():
+        coalescer, jobs = RequestCoalescer(), []
+        a, _ = coalescer.subscribe("a", submitter(jobs))
+        b, joined = coalescer.subscribe("b", submitter(jobs))
+        assert not joined and len(jobs) == 2
+        for job in jobs:
+            job.finish()
+        await collect(a)
+        await collect(b)
+        await asyncio.sleep(0)
+        _, joined = coalescer.subscribe("a", submitter(jobs))
+        assert not joined and len(jobs) == 3
+        jobs[2].finish()
+
+    asyncio.run(main())
+
+
+def test_job_is_cancelled_only_when_last_subscriber_leaves():
+    async def main():
+        coalescer, jobs = RequestCoalescer(), []
+        first, _ = coalescer.subscribe("k", submitter(jobs))
+        second, _ = coalescer.subscribe("k", submitter(jobs))
+        jobs[0].feed(b"a")
+        assert await first.__anext__() == b"a"
+        assert await second.__anext__() == b"a"
+        await first.aclose()
+        assert not jobs[0].cancelled
+        assert "k" in coalescer.flights
+        await second.aclose()
+        await asyncio.sleep(0)
+        assert jobs[0].cancelled
+        assert coalescer.flights == {}
+
+    asyncio.run(main())
+
+
+def test_error_reaches_every_subscriber():
+    async def main():
+        coalescer, jobs = RequestCoalescer(), []
+        streams = [coalescer.subscribe("k", submitter(jobs))[0] for _ in range(2)]
+        tasks = [asyncio.ensure_future(collect(stream)) for stream in streams]
+        jobs[0].fail(RuntimeError("boom"))
+        for task in tasks:
+            with pytest.raises(RuntimeError, match="boom"):
+                await task
+
+    asyncio.run(main())
+
+
+def test_submit_error_propagates_without_leaving_a_flight():
+    class Full(Exception):
+        pass
+
+    def submit():
+        raise Full()
+
+    async def main():
+        coalescer = RequestCoalescer()
+        with pytest.raises(Full):
+            coalescer.subscribe("k", submit)
+        assert coalescer.flights == {}
+
+    asyncio.run(main())
@@ -0,0 +1,55 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from TTS_infer_pack.crossfade import ChunkCrossfader  # noqa: E402
+
+
+def stream(signal, windows, samples_per_token, overlap):
+    """按 stream_decode 的方式切窗: windows 为各窗口结束时的token数, 每个窗口向前带 overlap 个token"""
+    crossfader = ChunkCrossfader()
+    emitted = 0
+    out = []
+    for i, total in enumerate(windows):
+        is_last = i == len(windows) - 1
+        start = max(emitted - overlap, 0)
+        audio = signal[start * samples_per_token:total * samples_per_token]
+        context = (emitted - start) * samples_per_token
+        emitted = total
+        out.append(crossfader.push(audio, context, 0 if is_last else samples_per_token))
+    assert crossfader.flush() is None
+    return out
+
+
+def test_consistent_windows_reassemble_the_signal():
+    signal = np.sin(np.arange(400, dtype=np.float32) / 7)
+    chunks = stream(signal, [8, 16, 24, 40], samples_per_token=10, overlap=3)
+    np.testing.assert_allclose(np.concatenate(chunks), signal, atol=1e-6)
+
+
+def test_boundary_is_linear_crossfade():
+    crossfader = ChunkCrossfader()
+    first = crossfader.push(np.ones(50, dtype=np.float32), 0, 10)
+    assert len(first) == 40
+    second = crossfader.push(np.zeros(60, dtype=np.float32), 10, 0)
+    # 上一段尾部 (1) 与新窗口上下文 (0) 混合: 线性从1降到0, 之后是新窗口的正文
+    np.testing.assert_allclose(second[:10], 1 - np.linspace(0, 1, 10), atol=1e-6)
+    assert len(second) == 10 + 50
+    assert not second[10:].any()
+
+
+def test_tail_longer_than_context_is_kept_before_fade():
+    crossfader = ChunkCrossfader()
+    crossfader.push(np.ones(30, dtype=np.float32), 0, 10)
+    out = crossfader.push(np.zeros(24, dtype=np.float32), 4, 0)
+    # 尾部10个采样只有最后4个与上下文混合
+    np.testing.assert_allclose(out[:6], 1)
+    np.testing.assert_allclose(out[6:10], 1 - np.linspace(0, 1, 4), atol=1e-6)
+    assert len(out) == 6 + 4 + 20
+
+
+def test_flush_returns_pending_tail_once():
+    crossfader = ChunkCrossfader()
+    crossfader.push(np.arange(20, dtype=np.float32), 0, 5)
+    np.testing.assert_array_equal(crossfader.flush(), np.arange(15, 20, dtype=np.float32))
+    assert crossfader.flush() is None
@@ -0,0 +1,93 @@
+import threading
+
+from TTS_infer_pack.model_pool import ModelPool
+
+
+A, B, C = ("a.pth", "a.ckpt"), ("b.pth", "b.ckpt"), ("c.pth", "c.ckpt")
+BAD = ("bad.pth", "bad.ckpt")
+
+
+class FakeModel:
+    def __init__(self, key, size):
+        self.key = key
+        self.size = size
+
+
+def make_pool(sizes, capacity=10, memory_budget=0, released=None):
+    def on_release():
+        if released is not None:
+            released.release()
+
+    return ModelPool(lambda key: FakeModel(key, sizes[key]), capacity=capacity, memory_budget=memory_budget,
+                     size_fn=lambda model: model.size, on_release=on_release)
+
+
+def resident(pool):
+    """常驻模型的键, 按最近使用排序"""
+    return [tuple(slot["key"]) for slot in pool.status()["resident"]]
+
+
+def test_memory_budget_evicts_least_recently_used():
+    pool = make_pool({A: 40, B: 40, C: 40}, memory_budget=100)
+    pool.activate(A, background=False)
+    pool.get(B)
+    pool.get(C)
+    # A 为当前模型不淘汰, 超出预算时淘汰最久未用的 B
+    assert resident(pool) == [A, C]
+    assert pool.resident_bytes() == 80
+
+
+def test_active_and_new_model_are_kept_even_over_budget():
+    pool = make_pool({A: 80, B: 80}, memory_budget=100)
+    pool.activate(A, background=False)
+    pool.get(B)
+    assert sorted(resident(pool)) == [A, B]
+    pool.activate(B, background=False)
+    assert resident(pool) == [B]
+    assert pool.active.key == B
+
+
+def test_capacity_limits_resident_models():
+    pool = make_pool({A: 1, B: 1, C: 1}, capacity=2)
+    pool.activate(A, background=False)
+    pool.get(B)
+    pool.get(A)
+    pool.get(C)
+    assert resident(pool) == [A, C]
+
+
+def test_evicted_model_is_released_after_draining():
+    released = threading.Semaphore(0)
+    pool = make_pool({A: 60, B: 60, C: 60}, memory_budget=130, released=released)
+    pool.activate(A, background=False)
+    slot_b = pool.get(B)
+    with slot_b.use():
+        pool.get(C)
+        assert B not in resident(pool)
+        assert not released.acquire(timeout=0.1)  # 仍有请求在用 B
+    assert released.acquire(timeout=5)
+
+
+def test_background_activate_calls_callback_with_new_slot():
+    pool = make_pool({A: 1, B: 1})
+    pool.activate(A, background=False)
+    switched = []
+    done = pool.activate(B, callback=lambda slot: switched.append((slot.key, pool.active.key)))
+    assert done.wait(5)
+    assert switched == [(B, B)]
+
+
+def test_failed_load_keeps_active_model_and_skips_callback():
+    def loader(key):
+        if key == BAD:
+            raise RuntimeError("broken weights")
+        return FakeModel(key, 1)
+
+    pool = ModelPool(loader)
+    pool.activate(A, background=False)
+    switched = []
+    done = pool.activate(BAD, callback=switched.append)
+    assert done.wait(5)
+    assert pool.active.key == A
+    assert switched == []
+    assert "broken weights" in pool.last_error(BAD)
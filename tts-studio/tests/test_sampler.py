@@ -0,0 +1,51 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+
+from AR.models.sampler import BatchedSampler, fused_probs  # noqa: E402
+from AR.models.utils import logits_to_probs  # noqa: E402
+
+VOCAB = 64
+
+
+@pytest.mark.parametrize("top_k,top_p,temperature", [(5, 1.0, 1.0), (15, 0.8, 0.6), (20, 0.6, 1.2)])
+def test_fused_probs_matches_logits_to_probs_per_row(top_k, top_p, temperature):
+    generator = torch.Generator().manual_seed(0)
+    logits = torch.randn(3, VOCAB, generator=generator) * 3
+    previous = torch.randint(0, VOCAB, (3, 20), generator=generator)
+    seen = torch.zeros(3, VOCAB, dtype=torch.bool).scatter_(1, previous, True)
+
+    probs, argmax = fused_probs(logits, seen, top_k, top_p, temperature, 1.35)
+    for row in range(3):
+        penalized = logits[row].clone()  # logits_to_probs 原地做重复惩罚
+        expected = logits_to_probs(penalized, previous[row], temperature=temperature, top_k=top_k, top_p=top_p,
+                                   repetition_penalty=1.35)
+        torch.testing.assert_close(probs[row], expected)
+        assert int(argmax[row]) == int(torch.argmax(penalized))
+
+
+def test_greedy_sampling_applies_repetition_penalty_to_sampled_tokens():
+    y = torch.tensor([[3]])
+    sampler = BatchedSampler(y, VOCAB, top_k=1, top_p=1.0, temperature=1.0)
+    logits = torch.zeros(1, VOCAB)
+    logits[0, 3] = 1.2  # 已出现: 1.2 / 1.35 < 0.9
+    logits[0, 5] = 1.0
+    logits[0, 7] = 0.9
+    samples, argmax = sampler(logits)
+    assert samples.dtype == torch.int32 and samples.shape == (1, 1)
+    assert int(samples) == 5 and int(argmax[0]) == 5
+    # 5 被采样后也受重复惩罚: 1.0 / 1.35 < 0.9
+    samples, _ = sampler(logits)
+    assert int(samples) == 7
+
+
+def test_first_step_without_eos_column():
+    sampler = BatchedSampler(torch.zeros(2, 0, dtype=torch.long), VOCAB, top_k=1, top_p=1.0, temperature=1.0)
+    logits = torch.full((2, VOCAB), -1.0)
+    logits[:, VOCAB - 1] = 10.0  # EOS 列
+    logits[0, 1] = 1.0
+    logits[1, 2] = 1.0
+    samples, argmax = sampler(logits[:, :-1])
+    assert samples.view(-1).tolist() == [1, 2]
+    assert argmax.tolist() == [1, 2]
+    assert sampler.seen[0, 1] and sampler.seen[1, 2] and not sampler.seen[:, VOCAB - 1].any()
@@ -0,0 +1,193 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from TTS_infer_pack.pipeline import prefetch
+from TTS_infer_pack.scheduler import BACKGROUND, INTERACTIVE, InferenceScheduler, SchedulerFull
+
+
+async def collect(job):
+    return [chunk async for chunk in job.stream()]
+
+
+async def wait_event(event):
+    assert await asyncio.get_running_loop().run_in_executor(None, event.wait, 5)
+
+
+def wait_until(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise AssertionError("timeout")
+        time.sleep(0.01)
+
+
+def test_streams_chunks_and_errors():
+    def ok(job):
+        yield b"a"
+        yield b"b"
+
+    def broken(job):
+        yield b"a"
+        raise RuntimeError("boom")
+
+    async def main():
+        scheduler = InferenceScheduler(num_workers=1)
+        scheduler.start()
+        assert await collect(scheduler.submit(ok)) == [b"a", b"b"]
+        with pytest.raises(RuntimeError, match="boom"):
+            await collect(scheduler.submit(broken))
+        return scheduler
+
+    scheduler = asyncio.run(main())
+    # 工作线程在结果送回事件循环之后才计数
+    wait_until(lambda: scheduler.jobs.value(status="ok") == 1 and scheduler.jobs.value(status="error") == 1)
+
+
+def test_rejects_when_queue_is_full_and_unknown_priority():
+    async def main():
+        scheduler = InferenceScheduler(num_workers=1, max_queue=2)  # 不启动工作线程, 任务留在队列中
+        scheduler.submit(lambda job: iter(()))
+        scheduler.submit(lambda job: iter(()), priority=BACKGROUND)
+        with pytest.raises(SchedulerFull):
+            scheduler.submit(lambda job: iter(()))
+        with pytest.raises(ValueError):
+            scheduler.submit(lambda job: iter(()), priority="urgent")
+        assert scheduler.qsize() == 2
+
+    asyncio.run(main())
+
+
+def test_interactive_jobs_are_dequeued_before_background():
+    order = []
+    started, release = threading.Event(), threading.Event()
+
+    def blocker(job):
+        started.set()
+        release.wait(5)
+        yield b""
+
+    def named(name):
+        def fn(job):
+            order.append(name)
+            yield b""
+        return fn
+
+    async def main():
+        scheduler = InferenceScheduler(num_workers=1)
+        scheduler.start()
+        first = scheduler.submit(blocker)
+        await wait_event(started)
+        jobs = [scheduler.submit(named("bg"), priority=BACKGROUND), scheduler.submit(named("fg"))]
+        release.set()
+        for job in [first] + jobs:
+            await collect(job)
+        assert order == ["fg", "bg"]
+
+    asyncio.run(main())
+
+
+def run_preemption(preemption):
+    order = []
+    started, release = threading.Event(), threading.Event()
+
+    def background(job):
+        for i in range(3):
+            order.append(f"bg{i}")
+            if i == 0:
+                started.set()
+                release.wait(5)
+            yield b"bg"
+
+    def interactive(job):
+        order.append("fg")
+        yield b"fg"
+
+    async def main():
+        scheduler = InferenceScheduler(num_workers=1, preemption=preemption)
+        scheduler.start()
+        bg = scheduler.submit(background, priority=BACKGROUND)
+        bg_task = asyncio.ensure_future(collect(bg))
+        await wait_event(started)
+        fg = scheduler.submit(interactive)
+        release.set()
+        assert await collect(fg) == [b"fg"]
+        assert await bg_task == [b"bg"] * 3
+        return scheduler, bg
+
+    scheduler, bg = asyncio.run(main())
+    return order, scheduler, bg
+
+
+def test_background_job_yields_at_checkpoint():
+    order, scheduler, bg = run_preemption(True)
+    # 第一句结束后的检查点让出, interactive 任务在同一工作线程中先执行
+    assert order == ["bg0", "fg", "bg1", "bg2"]
+    assert scheduler.preemptions.value() == 1
+    assert bg.preempted_seconds > 0
+    assert bg.resumed.is_set()
+
+
+def test_no_preemption_when_disabled():
+    order, scheduler, _ = run_preemption(False)
+    assert order == ["bg0", "bg1", "bg2", "fg"]
+    assert scheduler.preemptions.value() == 0
+
+
+def test_pipeline_thread_pauses_while_job_is_preempted():
+    produced, urgent = [], {}
+    started = threading.Event()
+
+    def background(job):
+        def tokens():
+            for i in range(8):
+                job.checkpoint()
+                produced.append(time.perf_counter())
+                if i == 0:
+                    started.set()
+                time.sleep(0.02)
+                yield i
+        for i in prefetch(tokens(), 1):
+            yield bytes([i])
+
+    def interactive(job):
+        urgent["start"] = time.perf_counter()
+        time.sleep(0.3)
+        urgent["end"] = time.perf_counter()
+        yield b"fg"
+
+    async def main():
+        scheduler = InferenceScheduler(num_workers=1)
+        scheduler.start()
+        bg = scheduler.submit(background, priority=BACKGROUND)
+        bg_task = asyncio.ensure_future(collect(bg))
+        await wait_event(started)
+        await collect(scheduler.submit(interactive))
+        assert await bg_task == [bytes([i]) for i in range(8)]
+
+    asyncio.run(main())
+    # 让出期间后台线程最多跑完已越过检查点的一句, 不再继续解码
+    during = [t for t in produced if urgent["start"] < t < urgent["end"]]
+    assert len(during) <= 1
+
+
+def test_closing_the_stream_cancels_the_job():
+    def endless(job):
+        while True:
+            time.sleep(0.01)
+            yield b"x"
+
+    async def main():
+        scheduler = InferenceScheduler(num_workers=1)
+        scheduler.start()
+        job = scheduler.submit(endless)
+        stream = job.stream()
+        assert await stream.__anext__() == b"x"
+        await stream.aclose()
+        assert job.cancelled
+        return scheduler
+
+    scheduler = asyncio.run(main())
+    wait_until(lambda: scheduler.jobs.value(status="cancelled") == 1)
@@ -0,0 +1,64 @@
+from AR.models.watchdog import DecodeWatchdog
+
+
+def run(watch, tokens):
+    """逐个喂入token, 返回 (触发时的token数, 原因); 未触发时为 (len(tokens), None)"""
+    for i, token in enumerate(tokens):
+        reason = watch.step(token)
+        if reason is not None:
+            return i + 1, reason
+    return len(tokens), None
+
+
+def test_token_cap_scales_with_phonemes():
+    watchdog = DecodeWatchdog(tokens_per_phoneme=4, min_tokens=10, max_period=0)
+    assert watchdog.max_tokens(2) == 10
+    assert watchdog.max_tokens(30) == 120
+    assert run(watchdog.watch(30), range(1000)) == (120, "max_tokens")
+
+
+def test_detects_loop_and_reports_repeated_tokens():
+    watchdog = DecodeWatchdog(tokens_per_phoneme=0, max_period=10, loop_repeats=3, min_loop_tokens=12)
+    watch = watchdog.watch(10)
+    period = [7, 8, 9, 10, 11]
+    count, reason = run(watch, list(range(100, 120)) + period * 10)
+    assert reason == "loop"
+    # 重复段达到 max(3 个周期, 12 个token) 时触发, 丢弃一个周期之外的部分
+    assert count == 20 + 15
+    assert watch.loop_tokens == 10
+
+
+def test_varied_tokens_do_not_trigger():
+    watchdog = DecodeWatchdog(tokens_per_phoneme=0, max_period=20, loop_repeats=3, min_loop_tokens=10)
+    tokens = [(i * 37 + i // 7) % 1024 for i in range(500)]
+    assert run(watchdog.watch(10), tokens) == (500, None)
+
+
+def test_short_repetition_below_min_loop_tokens_is_allowed():
+    watchdog = DecodeWatchdog(tokens_per_phoneme=0, max_period=10, loop_repeats=3, min_loop_tokens=50)
+    assert run(watchdog.watch(10), [1, 2] * 10 + list(range(3, 40))) == (57, None)
+
+
+def test_disabled_watchdog():
+    watchdog = DecodeWatchdog(tokens_per_phoneme=0, max_period=0)
+    assert not watchdog.enabled
+    assert watchdog.max_tokens(100) is None
+    assert run(watchdog.watch(100), [5] * 300) == (300, None)
+
+
+def test_held_token_needs_min_repeat_tokens():
+    watchdog = DecodeWatchdog(tokens_per_phoneme=0, max_period=10, loop_repeats=3, min_loop_tokens=12,
+                              min_repeat_tokens=100)
+    # 停顿/拖长音: 同一token连续出现, 任何周期下都算重复, 但不足 min_repeat_tokens 时不结束
+    tokens = list(range(100, 110)) + [5] * 99 + list(range(200, 210))
+    assert run(watchdog.watch(10), tokens) == (len(tokens), None)
+    watch = watchdog.watch(10)
+    assert run(watch, list(range(100, 110)) + [5] * 150) == (110, "loop")
+    assert watch.loop_tokens == 99
+
+
+def test_loop_containing_repeated_tokens_still_detected():
+    watchdog = DecodeWatchdog(tokens_per_phoneme=0, max_period=10, loop_repeats=3, min_loop_tokens=12,
+                              min_repeat_tokens=100)
+    # 周期内有相邻相同token的真实循环 (周期3) 不受 min_repeat_tokens 影响
+    assert run(watchdog.watch(10), list(range(100, 110)) + [7, 7, 8] * 20) == (10 + 12, "loop")
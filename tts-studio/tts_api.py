@@ -7,6 +7,8 @@
 
 `-s` - `SoVITS模型路径, 可在 config.py 中指定`
 `-g` - `GPT模型路径, 可在 config.py 中指定`
+`-s`/`-g` 也可以是 convert_safetensors.py 转换后的 .safetensors 文件; 原格式文件旁有对应的转换结果时自动改用 (需安装 safetensors),
+以 mmap 读取并逐个张量拷入模型, 降低加载/切换模型时的峰值内存
 
 调用请求缺少参考音频时使用
 `-dr` - `默认参考音频路径`
@@ -18,10 +20,45 @@
 `-p` - `绑定端口, 默认9880, 可在 config.py 中指定`
 `-fp` - `覆盖 config.py 使用全精度`
 `-hp` - `覆盖 config.py 使用半精度`
-`-sm` - `流式返回模式, 默认不启用, "close","c", "normal","n", "keepalive","k"`
-·-mt` - `返回的音频编码格式, 流式默认ogg, 非流式默认wav, "wav", "ogg", "aac"`
+`-sm` - `流式返回模式, 默认不启用, "close","c", "normal","n", "chunk", "keepalive","k"`
+`--chunk_size` - `chunk模式每个窗口的语义token数, 默认24`
+`--chunk_overlap` - `chunk模式窗口之间重叠的语义token数, 默认4`
+·-mt` - `返回的音频编码格式, 流式默认ogg, 非流式默认wav, "wav", "ogg", "aac", "pcm_s16le"`
 ·-cp` - `文本切分符号设定, 默认为空, 以",.，。"字符串的方式传入`
 
+`-bs` - `多句批量解码的句数, 默认1, 请求中的batch_size优先`
+
+`-w` - `推理工作线程数, 默认1`
+`--pipeline` - `逐句两级流水线: 后台线程先行解码下一句的语义token, 同时当前句做SoVITS解码与编码, 多句时降低总延迟`
+`--pipeline_depth` - `流水线中最多提前解码的句数, 默认2`
+两个阶段在不同线程中重叠执行, tts_stage_seconds 各阶段耗时之和可能大于请求耗时; chunk 流式模式不使用
+`--warmup` - `模型加载后预热合成的短语, 可多个, 语种自动识别, 默认 "你好。"; 用到的语种模块在此时加载, 其余语种在第一次请求时加载`
+启动时 bert, cnhubert, SoVITS/GPT 并行加载, 各阶段耗时写入日志, 就绪状态见 /ready
+`--frontend_workers` - `文本前端进程数, 默认0在推理线程中计算; 大于0时文本清洗/g2p (g2pw, jieba, LangSegment 等) 在独立进程中执行,
+                       多句请求在第一句解码的同时处理其余句子; 每个进程各自加载文本模块 (含g2pw模型)`
+`--frontend_languages` - `前端进程启动时预热的语种, 逗号分隔 (zh/en/ja/ko/yue), 默认 "zh,en"; 预热完才算启动完成, 其余语种在第一次用到时加载`
+`-q` - `推理请求队列长度, 默认16, 队列满时返回503`
+`--no_preempt` - `关闭抢占; 默认 background 请求在句子边界让出工作线程, 先合成排队的 interactive 请求`
+`--no_coalesce` - `关闭相同请求合并; 默认参数完全相同的请求在前一个合成期间到达时共用同一次推理的输出`
+`--max_models` - `常驻的SoVITS/GPT模型组数, 默认2`
+`--model_memory` - `常驻模型的内存预算(MB), 默认0不限制`
+
+`--backend` - `推理后端, "torch","onnx", 默认torch`
+`--onnx_dir` - `onnx_export.py 导出的模型根目录, 默认onnx`
+`--onnx_threads` - `onnxruntime 算子内线程数, 默认0按CPU核数`
+`--onnx_inter_threads` - `onnxruntime 算子间线程数, 默认1`
+onnx 后端需先导出: ` python onnx_export.py -s tts-model/merge.pth -g tts-model/merge.ckpt `,
+T2S逐步解码与SoVITS解码由 onnxruntime 在CPU上执行, 采样仍按请求的 top_k/top_p/temperature 进行;
+不支持 speed (speed 不为1的请求返回400) 与 chunk 流式模式, 一致性校验见 bench/onnx_parity.py
+
+`--quantize` - `"int8": CPU全精度推理时T2S与bert的线性层使用int8动态量化, 量化结果缓存在权重文件旁 (*.int8),
+               质量与速度对比见 bench/bench_quantize.py`
+
+`--decode_tokens_per_phoneme` - `T2S每个音素 (参考文本+目标文本) 最多生成的语义token数, 默认0为不限制, 建议12`
+`--decode_loop_period` - `T2S循环检测的最大周期 (token数), 默认0为不检测, 建议40`
+解码看门狗默认关闭; 开启后模型不输出EOS时提前结束该句, 循环时丢弃重复段 (同一token连续重复约5秒以上才算循环),
+被看门狗结束的句子记录警告日志, 结束原因见 /metrics 的 tts_decode_stops_total
+
 `-hb` - `cnhubert路径`
 `-b` - `bert路径`
 
@@ -86,14 +123,51 @@ POST:
     "top_k": 20,
     "top_p": 0.6,
     "temperature": 0.6,
-    "speed": 1
+    "speed": 1,
+    "batch_size": 4
 }
 ```
 
+batch_size: 切分后的句子每 batch_size 句一起解码, 长回复可一次解码完成
+
+priority: "interactive" (默认, 面向用户的回复) / "background" (批量生成等), interactive 请求优先出队,
+      并在正在合成的 background 请求的下一个句子边界插队执行; 预热 (/prewarm) 固定为 background
+
+aux_refer_wav_paths: 辅助参考音频路径列表 (仅POST), 音色向量取主参考音频与辅助参考音频的平均,
+      prompt_semantic 与参考文本仍只用主参考音频; 平均后的音色向量按路径缓存, onnx 后端不支持
+
 RESP:
 成功: 直接返回 wav 音频流， http code 200
 失败: 返回包含错误信息的 json, http code 400
 
+cache: 为 true 时读写合成音频缓存 (键为文本/参考音频/采样参数/模型权重的哈希), 命中时响应头 X-Cache: HIT
+      采样有随机性, 默认不使用缓存, 适合问候语/工具状态提示等固定短句
+
+media_type: 覆盖本次请求的音频编码格式, "wav", "ogg", "aac", "pcm_s16le"
+      pcm_s16le 为无文件头的16位小端单声道PCM, 采样率见响应头 X-Sample-Rate, 适合本机播放
+      同一请求的所有音频块属于一条连续的流 (ogg为同一个逻辑流, aac为同一个ffmpeg进程的输出)
+
+voice_id: voices_config.json 中音色的下标或 name; 未指定参考音频时使用该音色的参考音频,
+      音色声明了 sovits_path / gpt_path 时用对应模型合成 (首次使用时加载, 之后常驻), 不影响其他请求
+```json
+{
+    "name": "邪牛",
+    "path": "tts-model/evil/01.wav",
+    "text": "Could you protect me from my crocodiles?",
+    "language": "en",
+    "sovits_path": "tts-model/evil.pth",
+    "gpt_path": "tts-model/evil.ckpt"
+}
+```
+
+流式模式说明:
+normal: 每句合成完成后返回一段音频
+wav 流式返回时先发送长度字段为 0xFFFFFFFF (长度未知) 的文件头, 之后逐句发送PCM, 客户端收到文件头即可开始播放
+chunk: 每生成 chunk_size 个语义token即解码一段 (窗口重叠并交叉淡化), 首包只需一个窗口的时间
+响应头 `X-TTFB-Ms` 为服务端生成第一段音频的耗时(毫秒), 可用于提前开始口型同步
+参数完全相同的请求在前一个仍在合成时到达, 会合并到该次推理 (响应头 `X-Coalesced: 1`), 先收到已生成的音频再同步接收后续部分;
+其中一个客户端断开不影响其他客户端, 全部断开后才中止推理
+
 
 ### 更换默认参考音频
 
@@ -116,6 +190,68 @@ RESP:
 成功: json, http code 200
 失败: json, 400
 
+更换后会预热参考音频缓存 (prompt_semantic / 参考文本phones,bert / refer频谱)
+缓存统计: GET `http://127.0.0.1:9880/refer_cache`
+文本前端(phones/bert)缓存统计: GET `http://127.0.0.1:9880/frontend_cache`, 条数由 `--frontend_cache_size` 控制
+
+
+### 预热合成音频缓存
+
+endpoint: `/prewarm`
+
+POST:
+```json
+{
+    "phrases": ["你好呀", "好的", "稍等一下"],
+    "text_language": "zh"
+}
+```
+其余参数与推理端一致, 未指定参考音频时使用默认参考音频; 已缓存的短语会跳过
+缓存统计: GET `http://127.0.0.1:9880/audio_cache`
+
+
+### 存活与就绪检查
+
+endpoint: `/live`, `/ready`
+
+HTTP 服务在模型加载前即开始监听; `/live` 只要进程在运行就返回200,
+`/ready` 在 bert/cnhubert/SoVITS/GPT 加载并预热完成后返回200, 之前 (或启动失败时) 返回503,
+响应中包含正在进行的启动阶段与各阶段耗时 (同时见 /metrics 的 tts_startup_phase_seconds); 就绪前其他接口均返回503
+
+### 服务指标
+
+endpoint: `/metrics`
+
+Prometheus 文本格式, 包含排队请求数(tts_queue_depth), 排队等待时间(tts_queue_wait_seconds),
+推理耗时(tts_service_seconds) 等, 后两者按优先级 (priority) 区分; 各优先级排队数 (tts_lane_queue_depth),
+background 请求被抢占的次数 (tts_preemptions_total), 被抢占的时间计入 background 请求的推理耗时
+各阶段耗时 tts_stage_seconds{stage=...}: refer (其中 cnhubert 为 refer_ssl), frontend (文本清洗/g2p), bert,
+t2s_prompt, t2s_decode, sovits, encode; 每个请求记录一次, 同时写入日志
+T2S 统计: 生成的语义token数 (tts_semantic_tokens_total), 因 early_stop_num 截断的句数 (tts_early_stop_total),
+第一步即结束的句数 (tts_bad_zero_prediction_total)
+相同请求合并: 合并到进行中推理的请求数 (tts_coalesced_requests_total), 可合并的进行中推理数 (tts_inflight_flights)
+
+客户端断开连接时, 推理任务会在下一句/下一个窗口处中止
+
+
+### 切换模型
+
+endpoint: `/set_model`
+
+POST:
+```json
+{
+    "gpt_model_path": "GPT_SoVITS/pretrained_models/s1bert25hz-2kh-longer-epoch=68e-step=50232.ckpt",
+    "sovits_model_path": "GPT_SoVITS/pretrained_models/s2G488k.pth",
+    "wait": false
+}
+```
+
+新模型在后台加载并用默认参考音频预热, 完成后才替换当前模型, 期间请求照常由旧模型处理;
+进行中的请求始终使用开始时的模型. 最近用过的模型常驻内存 (`--max_models`), 切回时无需重新加载
+wait 为 true 时等待切换完成再返回, 加载失败返回 500
+模型池状态: GET `http://127.0.0.1:9880/models`
+
 
 ### 命令控制
 
@@ -142,6 +278,8 @@ RESP: 无
 import argparse
 import os,re
 import sys
+from time import perf_counter
+startup_t0 = perf_counter()
 
 # 保存原始stdout和stderr
 original_stdout = sys.stdout
@@ -185,29 +323,47 @@ sys.path.append(now_dir)
 sys.path.append("%s/GPT_SoVITS" % (now_dir))
 
 import signal
-from vendor.LangSegment import LangSegment
+import asyncio
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
 from time import time as ttime
 from fastapi.middleware.cors import CORSMiddleware
 import torch
 import librosa
-import soundfile as sf
 from fastapi import FastAPI, Request, HTTPException
 from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi.responses import Response
 import uvicorn
 from transformers import AutoModelForMaskedLM, AutoTokenizer
 import numpy as np
 from feature_extractor import cnhubert
-from io import BytesIO
 from module.models import SynthesizerTrn
 from AR.models.t2s_lightning_module import Text2SemanticLightningModule
-from text import cleaned_text_to_sequence
-from text.cleaner import clean_text
 from module.mel_processing import spectrogram_torch
 from tools.my_utils import load_audio
 import config as global_config
 import logging
-import subprocess
 import json
+from collections import namedtuple
+from TTS_infer_pack.cache import LRUCache
+from TTS_infer_pack.bert_encoder import BertEncoder
+from TTS_infer_pack.crossfade import ChunkCrossfader
+from TTS_infer_pack.text_frontend import clean_text_segments
+from TTS_infer_pack.frontend_pool import FrontendPool, FrontendWorkerError
+from TTS_infer_pack.audio_encoder import MEDIA_TYPES, create_encoder, content_type, stream_headers
+from TTS_infer_pack.audio_cache import AudioCache, make_key as make_audio_cache_key, weights_fingerprint
+from TTS_infer_pack.metrics import REGISTRY as METRICS_REGISTRY, CONTENT_TYPE as METRICS_CONTENT_TYPE, Counter
+from TTS_infer_pack.spans import SpanRecorder
+from TTS_infer_pack.pipeline import prefetch
+from TTS_infer_pack.model_pool import ModelPool
+from TTS_infer_pack.quantize import quantize_bert, quantize_t2s
+from AR.models.watchdog import DecodeWatchdog
+from TTS_infer_pack.scheduler import InferenceScheduler, SchedulerFull, PRIORITIES, INTERACTIVE, BACKGROUND
+from TTS_infer_pack.coalesce import RequestCoalescer
+from TTS_infer_pack.startup import StartupState
+from TTS_infer_pack.weights import open_checkpoint
 
 
 class DefaultRefer:
@@ -234,13 +390,19 @@ def is_full(*items):  # 任意一项为空返回False
     return True
 
 
-def change_sovits_weights(sovits_path):
-    global vq_model, hps
-    dict_s2 = torch.load(sovits_path, map_location="cpu", weights_only=False)
-    hps = dict_s2["config"]
+# onnx 为 --backend onnx 时的 OnnxVoiceModel, 否则为 None; torch 模型仍需加载, 用于提取参考音频特征
+# fingerprints 为 (SoVITS, GPT) 权重文件的内容哈希, 用作合成音频缓存的键; 未启用音频缓存时为 None
+VoiceModel = namedtuple("VoiceModel", ["sovits_path", "gpt_path", "vq_model", "hps", "version", "t2s_model", "hz", "max_sec", "onnx", "fingerprints"])
+
+
+def load_sovits_weights(sovits_path):
+    # 有转换后的 safetensors 时以 mmap 逐个张量拷入已在推理设备上的模型, 否则读取原格式
+    checkpoint = open_checkpoint(sovits_path)
+    logger.info(f"SoVITS权重格式: {checkpoint.format}")
+    hps = checkpoint.metadata["config"]
     hps = DictToAttrRecursive(hps)
     hps.model.semantic_frame_rate = "25hz"
-    if dict_s2['weight']['enc_p.text_embedding.weight'].shape[0] == 322:
+    if checkpoint.shape('enc_p.text_embedding.weight')[0] == 322:
         hps.model.version = "v1"
     else:
         hps.model.version = "v2"
@@ -259,127 +421,213 @@ def change_sovits_weights(sovits_path):
     else:
         vq_model = vq_model.to(device)
     vq_model.eval()
-    vq_model.load_state_dict(dict_s2["weight"], strict=False)
+    checkpoint.load_into(vq_model, strict=False)
+    return vq_model, hps
 
 
-def change_gpt_weights(gpt_path):
-    global hz, max_sec, t2s_model, config
+def load_gpt_weights(gpt_path):
     hz = 50
-    dict_s1 = torch.load(gpt_path, map_location="cpu")
-    config = dict_s1["config"]
+    checkpoint = open_checkpoint(gpt_path)
+    logger.info(f"GPT权重格式: {checkpoint.format}")
+    config = checkpoint.metadata["config"]
     max_sec = config["data"]["max_sec"]
     t2s_model = Text2SemanticLightningModule(config, "****", is_train=False)
-    t2s_model.load_state_dict(dict_s1["weight"])
     if is_half == True:
         t2s_model = t2s_model.half()
     t2s_model = t2s_model.to(device)
+    # 先转到推理设备与精度再加载, safetensors 权重直接拷入, 不在CPU上保留一份完整的fp32副本
+    checkpoint.load_into(t2s_model)
     t2s_model.eval()
+    if quantize:
+        quantize_t2s(t2s_model.model, gpt_path, logger)
     total = sum([param.nelement() for param in t2s_model.parameters()])
     logger.info("Number of parameter: %.2fM" % (total / 1e6))
+    return t2s_model, hz, max_sec
+
+
+def load_voice_model(key):
+    """模型池的加载函数, key 为 (sovits_path, gpt_path)"""
+    sovits_path, gpt_path = key
+    t0 = ttime()
+    with startup_phase("sovits_gpt"):
+        vq_model, hps = load_sovits_weights(sovits_path)
+        t2s_model, hz, max_sec = load_gpt_weights(gpt_path)
+        onnx_model = load_onnx_weights(sovits_path, gpt_path) if backend == "onnx" else None
+    fingerprints = None
+    if audio_cache is not None:
+        # 读完整个权重文件算哈希, 在加载线程中算好, 不在请求处理 (事件循环) 中计算
+        with startup_phase("weights_hash"):
+            fingerprints = (weights_fingerprint(sovits_path), weights_fingerprint(gpt_path))
+    logger.info(f"模型加载完成: {sovits_path}, {gpt_path} ({(ttime() - t0) * 1000:.0f}ms)")
+    return VoiceModel(sovits_path, gpt_path, vq_model, hps, vq_model.version, t2s_model, hz, max_sec, onnx_model, fingerprints)
+
+
+def load_onnx_weights(sovits_path, gpt_path):
+    """加载 onnx_export.py 导出到 <onnx_dir>/<SoVITS文件名> 的推理图"""
+    from TTS_infer_pack.onnx_backend import OnnxVoiceModel
+
+    onnx_dir = os.path.join(args.onnx_dir, os.path.splitext(os.path.basename(sovits_path))[0])
+    if not os.path.exists(os.path.join(onnx_dir, "config.json")):
+        raise FileNotFoundError(f"未找到ONNX模型 {onnx_dir}, 请先运行: python onnx_export.py -s {sovits_path} -g {gpt_path}")
+    onnx_model = OnnxVoiceModel(onnx_dir, args.onnx_threads, args.onnx_inter_threads)
+    if onnx_model.config["gpt_path"] != os.path.abspath(gpt_path):
+        logger.warning(f"ONNX模型导出自 {onnx_model.config['gpt_path']}, 与当前GPT模型 {gpt_path} 不一致")
+    return onnx_model
+
+
+def warmup_voice_model(model):
+    """
+    用默认参考音频合成 warmup_phrases, 让新模型在接流量前完成首次推理的初始化, 并加载短语用到的语种模块;
+    没有默认参考音频时只预热文本前端 (语种模块与bert)
+    启动时与 bert/cnhubert 并行加载, 预热前等待它们加载完成
+    """
+    encoders_ready.wait()
+    if bert_encoder is None or ssl_model is None:
+        raise RuntimeError("bert/cnhubert 未加载")
+    t0 = ttime()
+    with startup_phase("warmup"):
+        if not default_refer.is_ready():
+            get_phones_and_bert_batch([(phrase, "auto") for phrase in warmup_phrases], model.version)
+            logger.info(f"文本前端预热完成 ({(ttime() - t0) * 1000:.0f}ms)")
+            return
+        for phrase in warmup_phrases:
+            for _ in get_tts_wav_with_model(model, default_refer.path, default_refer.text, default_refer.language, phrase, "auto"):
+                pass
+    logger.info(f"模型预热完成, {len(warmup_phrases)} 句 ({(ttime() - t0) * 1000:.0f}ms)")
+
+
+def voice_model_bytes(model):
+    """模型参数与缓冲区占用的字节数, 作为常驻模型池的内存预算依据"""
+    total = 0
+    for module in (model.vq_model, model.t2s_model):
+        for tensor in list(module.parameters()) + list(module.buffers()):
+            total += tensor.numel() * tensor.element_size()
+    if model.onnx is not None:
+        total += model.onnx.nbytes
+    return total
+
+
+def release_voice_model():
+    if torch.cuda.is_available():
+        torch.cuda.empty_cache()
 
 
 def get_bert_feature(text, word2ph):
-    with torch.no_grad():
-        inputs = tokenizer(text, return_tensors="pt")
-        for i in inputs:
-            inputs[i] = inputs[i].to(device)  #####输入是long不用管精度问题，精度随bert_model
-        res = bert_model(**inputs, output_hidden_states=True)
-        res = torch.cat(res["hidden_states"][-3:-2], -1)[0].cpu()[1:-1]
-    assert len(word2ph) == len(text)
-    phone_level_feature = []
-    for i in range(len(word2ph)):
-        repeat_feature = res[i].repeat(word2ph[i], 1)
-        phone_level_feature.append(repeat_feature)
-    phone_level_feature = torch.cat(phone_level_feature, dim=0)
-    # if(is_half==True):phone_level_feature=phone_level_feature.half()
-    return phone_level_feature.T
-
-
-def clean_text_inf(text, language, version):
-    phones, word2ph, norm_text = clean_text(text, language, version)
-    phones = cleaned_text_to_sequence(phones, version)
-    return phones, word2ph, norm_text
-
-
-def get_bert_inf(phones, word2ph, norm_text, language):
-    language=language.replace("all_","")
-    if language == "zh":
-        bert = get_bert_feature(norm_text, word2ph).to(device)#.to(dtype)
-    else:
-        bert = torch.zeros(
-            (1024, len(phones)),
-            dtype=torch.float16 if is_half == True else torch.float32,
-        ).to(device)
+    return get_bert_features_batched([(text, word2ph)])[0]
 
-    return bert
 
-from text import chinese
-def get_phones_and_bert(text,language,version):
-    if language in {"en", "all_zh", "all_ja", "all_ko", "all_yue"}:
-        language = language.replace("all_","")
-        if language == "en":
-            LangSegment.setfilters(["en"])
-            formattext = " ".join(tmp["text"] for tmp in LangSegment.getTexts(text))
-        else:
-            # 因无法区别中日韩文汉字,以用户输入为准
-            formattext = text
-        while "  " in formattext:
-            formattext = formattext.replace("  ", " ")
-        if language == "zh":
-            if re.search(r'[A-Za-z]', formattext):
-                formattext = re.sub(r'[a-z]', lambda x: x.group(0).upper(), formattext)
-                formattext = chinese.text_normalize(formattext)
-                return get_phones_and_bert(formattext,"zh",version)
-            else:
-                phones, word2ph, norm_text = clean_text_inf(formattext, language, version)
-                bert = get_bert_feature(norm_text, word2ph).to(device)
-        elif language == "yue" and re.search(r'[A-Za-z]', formattext):
-                formattext = re.sub(r'[a-z]', lambda x: x.group(0).upper(), formattext)
-                formattext = chinese.text_normalize(formattext)
-                return get_phones_and_bert(formattext,"yue",version)
-        else:
-            phones, word2ph, norm_text = clean_text_inf(formattext, language, version)
-            bert = torch.zeros(
-                (1024, len(phones)),
-                dtype=torch.float16 if is_half == True else torch.float32,
-            ).to(device)
-    elif language in {"zh", "ja", "ko", "yue", "auto", "auto_yue"}:
-        textlist=[]
-        langlist=[]
-        LangSegment.setfilters(["zh","ja","en","ko"])
-        if language == "auto":
-            for tmp in LangSegment.getTexts(text):
-                langlist.append(tmp["lang"])
-                textlist.append(tmp["text"])
-        elif language == "auto_yue":
-            for tmp in LangSegment.getTexts(text):
-                if tmp["lang"] == "zh":
-                    tmp["lang"] = "yue"
-                langlist.append(tmp["lang"])
-                textlist.append(tmp["text"])
+def get_bert_features_batched(segments, max_batch=32):
+    """
+    多个中文片段的bert特征: segments 为 [(norm_text, word2ph)], 返回 [[1024, 音素数]]
+    按长度排序后分批padding, 每批只跑一次前向, 再按 word2ph 把字级特征展开到音素级
+    分词与前向由 bert_encoder 在锁内执行, 多个推理工作线程可同时调用
+    """
+    features = [None] * len(segments)
+    order = sorted(range(len(segments)), key=lambda i: len(segments[i][0]))
+    with torch.no_grad():
+        for b in range(0, len(order), max_batch):
+            batch = order[b:b + max_batch]
+            hidden = bert_encoder.hidden_states([segments[i][0] for i in batch])
+            for row, i in enumerate(batch):
+                text, word2ph = segments[i]
+                assert len(word2ph) == len(text)
+                char_feature = hidden[row, 1:len(text) + 1]
+                phone_level_feature = char_feature.repeat_interleave(torch.tensor(word2ph), dim=0)
+                features[i] = phone_level_feature.T
+    return features
+
+
+def submit_frontend(items, version):
+    """
+    在前端进程池中先行清洗/g2p: [(text, language)] -> {(text, language, version): Future}
+    已在缓存中的文本不提交; 未启用进程池时返回空字典
+    """
+    futures = {}
+    if frontend_pool is None:
+        return futures
+    for text, language in items:
+        key = (text, language, version)
+        if key not in futures and key not in phones_bert_cache:
+            futures[key] = frontend_pool.submit(text, language, version)
+    return futures
+
+
+def get_text_segments(key, prefetched):
+    """取进程池的清洗/g2p结果, 没有提交或进程出错时在当前线程计算"""
+    future = prefetched.get(key)
+    if future is not None:
+        try:
+            return future.result()
+        except FrontendWorkerError as e:
+            logger.warning(f"前端进程处理失败, 改为在推理线程中计算: {e}")
+    return clean_text_segments(*key)
+
+
+def get_phones_and_bert_batch(items,version,spans=None,prefetched=None):
+    """
+    带缓存的文本前端: [(text, language)] -> [(phones, bert, norm_text)]
+    未命中缓存的文本先清洗/g2p (启用前端进程池时并行提交到各进程), 其中所有中文片段合并成一批跑bert (get_bert_features_batched)
+    bert 以fp16存放在CPU上以节省显存/内存, 取出时转回推理设备与精度; 同时记录首次计算耗时, 用于统计命中节省的时间
+    spans 为请求的 SpanRecorder, 清洗/g2p (含等待进程池) 计入 frontend, bert前向计入 bert
+    prefetched 为 submit_frontend 提前提交的结果
+    """
+    if spans is None:
+        spans = SpanRecorder()
+    dtype = torch.float16 if is_half == True else torch.float32
+    results = [None] * len(items)
+    pending = {}  # key -> 需要计算的 items 下标
+    for i, (text, language) in enumerate(items):
+        key = (text, language, version)
+        if key in pending:
+            pending[key].append(i)
+            continue
+        entry = phones_bert_cache.get(key)
+        if entry is not None:
+            phones, bert, norm_text, cost = entry
+            frontend_saved_seconds.inc(cost)
+            results[i] = (list(phones), bert.to(device=device, dtype=dtype), norm_text)
         else:
-            for tmp in LangSegment.getTexts(text):
-                if tmp["lang"] == "en":
-                    langlist.append(tmp["lang"])
-                else:
-                    # 因无法区别中日韩文汉字,以用户输入为准
-                    langlist.append(language)
-                textlist.append(tmp["text"])
-        phones_list = []
+            pending[key] = [i]
+    if not pending:
+        return results
+
+    t0 = ttime()
+    with spans.span("frontend"):
+        prefetched = {**submit_frontend([key[:2] for key in pending if key not in (prefetched or {})], version),
+                      **(prefetched or {})}
+        segments_list = [get_text_segments(key, prefetched) for key in pending]
+    bert_segments = [(norm_text, word2ph) for segments in segments_list
+                     for phones, word2ph, norm_text, lang in segments if lang == "zh"]
+    with spans.span("bert"):
+        bert_features = iter(get_bert_features_batched(bert_segments))
+    computed = []
+    for segments in segments_list:
         bert_list = []
-        norm_text_list = []
-        for i in range(len(textlist)):
-            lang = langlist[i]
-            phones, word2ph, norm_text = clean_text_inf(textlist[i], lang, version)
-            bert = get_bert_inf(phones, word2ph, norm_text, lang)
-            phones_list.append(phones)
-            norm_text_list.append(norm_text)
-            bert_list.append(bert)
-        bert = torch.cat(bert_list, dim=1)
-        phones = sum(phones_list, [])
-        norm_text = ''.join(norm_text_list)
+        for phones, word2ph, norm_text, lang in segments:
+            if lang == "zh":
+                bert_list.append(next(bert_features).to(dtype))
+            else:
+                bert_list.append(torch.zeros((1024, len(phones)), dtype=dtype))
+        phones = sum([segment[0] for segment in segments], [])
+        norm_text = "".join([segment[2] for segment in segments])
+        computed.append((phones, torch.cat(bert_list, dim=1), norm_text))
+    cost = (ttime() - t0) / len(pending)
+
+    for (key, indices), (phones, bert, norm_text) in zip(pending.items(), computed):
+        phones_bert_cache.put(key, (list(phones), bert.to(torch.float16), norm_text, cost))
+        for i in indices:
+            results[i] = (list(phones), bert.to(device), norm_text)
+    return results
+
 
-    return phones,bert.to(torch.float16 if is_half == True else torch.float32),norm_text
+def get_phones_and_bert(text,language,version):
+    return get_phones_and_bert_batch([(text, language)], version)[0]
+
+
+def log_frontend_cache_stats():
+    stats = phones_bert_cache.stats()
+    logger.info(f"文本前端缓存: 命中率 {stats['hit_rate']:.1%} ({stats['hits']}/{stats['hits'] + stats['misses']}), "
+                f"累计节省 {frontend_saved_seconds.value() * 1000:.0f}ms")
 
 
 class DictToAttrRecursive(dict):
@@ -420,104 +668,6 @@ def get_spepc(hps, filename):
     return spec
 
 
-def pack_audio(audio_bytes, data, rate):
-    if media_type == "ogg":
-        audio_bytes = pack_ogg(audio_bytes, data, rate)
-    elif media_type == "aac":
-        audio_bytes = pack_aac(audio_bytes, data, rate)
-    else:
-        # wav无法流式, 先暂存raw
-        audio_bytes = pack_raw(audio_bytes, data, rate)
-
-    return audio_bytes
-
-
-def pack_ogg(audio_bytes, data, rate):
-    # Author: AkagawaTsurunaki
-    # Issue:
-    #   Stack overflow probabilistically occurs
-    #   when the function `sf_writef_short` of `libsndfile_64bit.dll` is called
-    #   using the Python library `soundfile`
-    # Note:
-    #   This is an issue related to `libsndfile`, not this project itself.
-    #   It happens when you generate a large audio tensor (about 499804 frames in my PC)
-    #   and try to convert it to an ogg file.
-    # Related:
-    #   https://github.com/RVC-Boss/GPT-SoVITS/issues/1199
-    #   https://github.com/libsndfile/libsndfile/issues/1023
-    #   https://github.com/bastibe/python-soundfile/issues/396
-    # Suggestion:
-    #   Or split the whole audio data into smaller audio segment to avoid stack overflow?
-
-    def handle_pack_ogg():
-        with sf.SoundFile(audio_bytes, mode='w', samplerate=rate, channels=1, format='ogg') as audio_file:
-            audio_file.write(data)
-
-    import threading
-    # See: https://docs.python.org/3/library/threading.html
-    # The stack size of this thread is at least 32768
-    # If stack overflow error still occurs, just modify the `stack_size`.
-    # stack_size = n * 4096, where n should be a positive integer.
-    # Here we chose n = 4096.
-    stack_size = 4096 * 4096
-    try:
-        threading.stack_size(stack_size)
-        pack_ogg_thread = threading.Thread(target=handle_pack_ogg)
-        pack_ogg_thread.start()
-        pack_ogg_thread.join()
-    except RuntimeError as e:
-        # If changing the thread stack size is unsupported, a RuntimeError is raised.
-        print("RuntimeError: {}".format(e))
-        print("Changing the thread stack size is unsupported.")
-    except ValueError as e:
-        # If the specified stack size is invalid, a ValueError is raised and the stack size is unmodified.
-        print("ValueError: {}".format(e))
-        print("The specified stack size is invalid.")
-
-    return audio_bytes
-
-
-def pack_raw(audio_bytes, data, rate):
-    audio_bytes.write(data.tobytes())
-
-    return audio_bytes
-
-
-def pack_wav(audio_bytes, rate):
-    data = np.frombuffer(audio_bytes.getvalue(),dtype=np.int16)
-    wav_bytes = BytesIO()
-    sf.write(wav_bytes, data, rate, format='wav')
-
-    return wav_bytes
-
-
-def pack_aac(audio_bytes, data, rate):
-    process = subprocess.Popen([
-        'ffmpeg',
-        '-f', 's16le',  # 输入16位有符号小端整数PCM
-        '-ar', str(rate),  # 设置采样率
-        '-ac', '1',  # 单声道
-        '-i', 'pipe:0',  # 从管道读取输入
-        '-c:a', 'aac',  # 音频编码器为AAC
-        '-b:a', '192k',  # 比特率
-        '-vn',  # 不包含视频
-        '-f', 'adts',  # 输出AAC数据流格式
-        'pipe:1'  # 将输出写入管道
-    ], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    out, _ = process.communicate(input=data.tobytes())
-    audio_bytes.write(out)
-
-    return audio_bytes
-
-
-def read_clean_buffer(audio_bytes):
-    audio_chunk = audio_bytes.getvalue()
-    audio_bytes.truncate(0)
-    audio_bytes.seek(0)
-
-    return audio_bytes, audio_chunk
-
-
 def cut_text(text, punc):
     punc_list = [p for p in punc if p in {",", ".", ";", "?", "!", "、", "，", "。", "？", "！", "；", "：", "…"}]
     if len(punc_list) > 0:
@@ -540,11 +690,26 @@ def only_punc(text):
     return not any(t.isalnum() or t.isalpha() for t in text)
 
 
-def get_tts_wav(ref_wav_path, prompt_text, prompt_language, text, text_language, top_k= 20, top_p = 0.6, temperature = 0.6, speed = 1):
-    t0 = ttime()
-    prompt_text = prompt_text.strip("\n")
-    prompt_language, text = prompt_language, text.strip("\n")
-    zero_wav = np.zeros(int(hps.data.sampling_rate * 0.3), dtype=np.float16 if is_half == True else np.float32)
+ReferFeatures = namedtuple("ReferFeatures", ["prompt_semantic", "phones1", "bert1", "norm_text1", "refer", "ge"])
+
+
+def get_refer_features(model, ref_wav_path, prompt_text, prompt_language, prompt_frontend=None, spans=None):
+    """
+    参考音频相关的全部特征: prompt_semantic, 参考文本的phones/bert, refer频谱, 以及音色向量ge (onnx 后端为 None)
+    按 (路径, mtime, 参考文本, 语种, SoVITS模型, 版本, 精度) 缓存, 参考音频不变时无需重复计算
+    prompt_language 需为 dict_language 映射后的值; prompt_frontend 为已算好的参考文本 (phones, bert, norm_text)
+    spans 不为 None 时 cnhubert 前向计入 refer_ssl
+    """
+    if spans is None:
+        spans = SpanRecorder()
+    version = model.version
+    key = (os.path.abspath(ref_wav_path), os.path.getmtime(ref_wav_path), prompt_text, prompt_language,
+           model.sovits_path, version, is_half)
+    feats = refer_cache.get(key)
+    if feats is not None:
+        return feats
+
+    zero_wav = np.zeros(int(model.hps.data.sampling_rate * 0.3), dtype=np.float16 if is_half == True else np.float32)
     with torch.no_grad():
         wav16k, sr = librosa.load(ref_wav_path, sr=16000)
         wav16k = torch.from_numpy(wav16k)
@@ -556,71 +721,331 @@ def get_tts_wav(ref_wav_path, prompt_text, prompt_language, text, text_language,
             wav16k = wav16k.to(device)
             zero_wav_torch = zero_wav_torch.to(device)
         wav16k = torch.cat([wav16k, zero_wav_torch])
-        ssl_content = ssl_model.model(wav16k.unsqueeze(0))["last_hidden_state"].transpose(1, 2)  # .float()
-        codes = vq_model.extract_latent(ssl_content)
-        prompt_semantic = codes[0, 0]
-    t1 = ttime()
-    version = vq_model.version
-    os.environ['version'] = version
-    prompt_language = dict_language[prompt_language.lower()]
-    text_language = dict_language[text_language.lower()]
-    phones1, bert1, norm_text1 = get_phones_and_bert(prompt_text, prompt_language, version)
-    texts = text.split("\n")
-    audio_bytes = BytesIO()
-
-    for text in texts:
-        # 简单防止纯符号引发参考音频泄露
-        if only_punc(text):
+        with spans.span("refer_ssl"):
+            ssl_content = ssl_model.model(wav16k.unsqueeze(0))["last_hidden_state"].transpose(1, 2)  # .float()
+            codes = model.vq_model.extract_latent(ssl_content)
+            prompt_semantic = codes[0, 0]
+    if prompt_frontend is None:
+        prompt_frontend = get_phones_and_bert_batch([(prompt_text, prompt_language)], version, spans)[0]
+    phones1, bert1, norm_text1 = prompt_frontend
+    refer = get_refer_spec(model, ref_wav_path)
+    # 音色向量只取决于参考音频, 算一次后每句解码直接使用, 不再重复跑 ref_enc
+    ge = model.vq_model.get_ge(refer) if model.onnx is None else None
+
+    feats = ReferFeatures(prompt_semantic, phones1, bert1, norm_text1, refer, ge)
+    refer_cache.put(key, feats)
+    return feats
+
+
+def get_refer_spec(model, ref_wav_path):
+    refer = get_spepc(model.hps, ref_wav_path)
+    if (is_half == True):
+        return refer.half().to(device)
+    return refer.to(device)
+
+
+def get_averaged_ge(model, ref_wav_path, refer, aux_refer_paths):
+    """
+    主参考音频 (频谱 refer) 与辅助参考音频的平均音色向量, 按 (SoVITS模型, 精度, 全部路径与mtime) 缓存在 refer_cache
+    """
+    paths = [ref_wav_path] + list(aux_refer_paths)
+    key = ("ge", model.sovits_path, model.version, is_half,
+           tuple((os.path.abspath(path), os.path.getmtime(path)) for path in paths))
+    ge = refer_cache.get(key)
+    if ge is None:
+        refers = [refer] + [get_refer_spec(model, path) for path in aux_refer_paths]
+        ge = model.vq_model.get_ge(refers)
+        refer_cache.put(key, ge)
+    return ge
+
+
+def warm_refer_cache(ref_wav_path, prompt_text, prompt_language, slot=None):
+    """用 slot 的模型 (默认为当前模型) 预热参考音频缓存, 失败时只记录日志, 不影响切换结果"""
+    try:
+        t0 = ttime()
+        with (slot or model_pool.active).use() as model:
+            get_refer_features(model, ref_wav_path, prompt_text.strip("\n"), dict_language[prompt_language.lower()])
+        logger.info(f"参考音频缓存已预热: {ref_wav_path} ({(ttime() - t0) * 1000:.0f}ms)")
+    except Exception as e:
+        logger.warning(f"参考音频缓存预热失败: {e}")
+
+
+def prepare_t2s_input(phones2, bert2, phones1, bert1):
+    """单句的T2S输入: 返回 (参考文本+目标文本的phoneme ids [L], bert [1024, L])"""
+    all_phoneme_ids = torch.LongTensor(phones1 + phones2).to(device)
+    bert = torch.cat([bert1, bert2], 1).to(device)
+    return all_phoneme_ids, bert
+
+
+def stream_decode(vq_model, token_chunks, phones2, refer, speed, overlap, spans=None, ge=None):
+    """
+    按语义token窗口逐段解码: 每个窗口向前带 overlap 个token作为上下文, 上下文对应的音频丢弃,
+    相邻两段在边界处交叉淡化 (每段保留约一个token长度的尾部, 与下一段的上下文尾部混合)
+    token_chunks 为 infer_panel_generator 的输出, yield float音频片段; SoVITS 解码计入 spans 的 sovits
+    ge 为预先算好的音色向量, 为 None 时每段都从 refer 计算
+    """
+    if spans is None:
+        spans = SpanRecorder()
+    text_ids = torch.LongTensor(phones2).to(device).unsqueeze(0)
+    tokens = None
+    emitted = 0  # 已输出音频对应的token数
+    crossfader = ChunkCrossfader()
+    for new_tokens, is_last in token_chunks:
+        tokens = new_tokens if tokens is None else torch.cat([tokens, new_tokens], 1)
+        total = tokens.shape[1]
+        if total == emitted:
+            tail = crossfader.flush() if is_last else None
+            if tail is not None:
+                yield tail
             continue
+        start = max(emitted - overlap, 0)
+        with spans.span("sovits"):
+            audio = vq_model.decode(tokens[:, start:total].unsqueeze(0), text_ids, refer, speed=speed, ge=ge)\
+                .detach().cpu().numpy()[0, 0]
+        samples_per_token = audio.shape[0] / (total - start)
+        context = int(round((emitted - start) * samples_per_token))
+        emitted = total
+        yield crossfader.push(audio, context, 0 if is_last else int(samples_per_token))
+
+
+class PrefetchedTargets:
+    """
+    各句的 (phones2, bert2), 可按下标/切片访问: 前 head 句立即可用;
+    其余句子的清洗/g2p 已提交到前端进程池, 与前面句子的解码重叠, 第一次访问到时才等待结果并一起跑bert
+    """
+
+    def __init__(self, head, resolve_rest, count):
+        self._items = list(head)
+        self._resolve_rest = resolve_rest
+        self._count = count
+
+    def _resolve(self, need):
+        if need > len(self._items) and self._resolve_rest is not None:
+            self._items.extend(self._resolve_rest())
+            self._resolve_rest = None
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            self._resolve(self._count if index.stop is None or index.stop < 0 else index.stop)
+        else:
+            self._resolve(self._count if index < 0 else index + 1)
+        return self._items[index]
+
+    def __iter__(self):
+        for i in range(self._count):
+            yield self[i]
+
+
+def get_semantic_tokens(model, targets, prompt_semantic, phones1, bert1, top_k, top_p, temperature, batch_size=1, job=None, spans=None):
+    """
+    逐句生成语义token, targets 为各句的 (phones2, bert2), 按句子顺序 yield (phones2, pred_semantic)
+    batch_size > 1 时每 batch_size 句一起走 infer_panel_batched, 减少解码循环次数; onnx 后端逐句解码
+    每次解码的耗时/token数/结束原因记入 spans
+    """
+    if spans is None:
+        spans = SpanRecorder()
+    prompt = prompt_semantic.unsqueeze(0).to(device)
+    batch_size = max(int(batch_size), 1) if model.onnx is None else 1
+    for i in range(0, len(targets), batch_size):
+        if job is not None:
+            job.checkpoint()
+        batch_targets = targets[i:i + batch_size]
+        phones2_list = []
+        all_phoneme_list = []
+        bert_list = []
+        for phones2, bert2 in batch_targets:
+            all_phoneme_ids, bert = prepare_t2s_input(phones2, bert2, phones1, bert1)
+            phones2_list.append(phones2)
+            all_phoneme_list.append(all_phoneme_ids)
+            bert_list.append(bert)
 
-        audio_opt = []
-        phones2, bert2, norm_text2 = get_phones_and_bert(text, text_language, version)
-        bert = torch.cat([bert1, bert2], 1)
-
-        all_phoneme_ids = torch.LongTensor(phones1 + phones2).to(device).unsqueeze(0)
-        bert = bert.to(device).unsqueeze(0)
-        all_phoneme_len = torch.tensor([all_phoneme_ids.shape[-1]]).to(device)
-        prompt = prompt_semantic.unsqueeze(0).to(device)
-        t2 = ttime()
+        decode_info = {}
         with torch.no_grad():
-            # pred_semantic = t2s_model.model.infer(
-            pred_semantic, idx = t2s_model.model.infer_panel(
-                all_phoneme_ids,
-                all_phoneme_len,
-                prompt,
-                bert,
-                # prompt_phone_len=ph_offset,
-                top_k = top_k,
-                top_p = top_p,
-                temperature = temperature,
-                early_stop_num=hz * max_sec)
-        t3 = ttime()
-        # print(pred_semantic.shape,idx)
-        pred_semantic = pred_semantic[:, -idx:].unsqueeze(0)  # .unsqueeze(0)#mq要多unsqueeze一次
-        refer = get_spepc(hps, ref_wav_path)  # .to(device)
-        if (is_half == True):
-            refer = refer.half().to(device)
-        else:
-            refer = refer.to(device)
-        # audio = vq_model.decode(pred_semantic, all_phoneme_ids, refer).detach().cpu().numpy()[0, 0]
-        audio = \
-            vq_model.decode(pred_semantic, torch.LongTensor(phones2).to(device).unsqueeze(0),
-                            refer,speed=speed).detach().cpu().numpy()[
-                0, 0]  ###试试重建不带上prompt部分
-        audio_opt.append(audio)
-        audio_opt.append(zero_wav)
-        t4 = ttime()
-        audio_bytes = pack_audio(audio_bytes,(np.concatenate(audio_opt, 0) * 32768).astype(np.int16),hps.data.sampling_rate)
-    # logger.info("%.3f\t%.3f\t%.3f\t%.3f" % (t1 - t0, t2 - t1, t3 - t2, t4 - t3))
-        if stream_mode == "normal":
-            audio_bytes, audio_chunk = read_clean_buffer(audio_bytes)
+            if model.onnx is not None:
+                pred_semantic, idx = model.onnx.infer_panel(
+                    all_phoneme_list[0].unsqueeze(0).cpu().numpy(),
+                    bert_list[0].unsqueeze(0).float().cpu().numpy(),
+                    prompt.long().cpu().numpy(),
+                    top_k = top_k,
+                    top_p = top_p,
+                    temperature = temperature,
+                    early_stop_num=model.hz * model.max_sec,
+                    decode_info=decode_info,
+                    watchdog=decode_watchdog)
+                pred_semantic_list, idx_list = [torch.from_numpy(pred_semantic)], [idx]
+            elif len(batch_targets) == 1:
+                # pred_semantic = t2s_model.model.infer(
+                pred_semantic, idx = model.t2s_model.model.infer_panel(
+                    all_phoneme_list[0].unsqueeze(0),
+                    torch.tensor([all_phoneme_list[0].shape[-1]]).to(device),
+                    prompt,
+                    bert_list[0].unsqueeze(0),
+                    # prompt_phone_len=ph_offset,
+                    top_k = top_k,
+                    top_p = top_p,
+                    temperature = temperature,
+                    early_stop_num=model.hz * model.max_sec,
+                    decode_info=decode_info,
+                    watchdog=decode_watchdog)
+                pred_semantic_list, idx_list = [pred_semantic], [idx]
+            else:
+                pred_semantic_list, idx_list = model.t2s_model.model.infer_panel_batched(
+                    all_phoneme_list,
+                    torch.tensor([item.shape[-1] for item in all_phoneme_list]).to(device),
+                    prompt,
+                    bert_list,
+                    top_k = top_k,
+                    top_p = top_p,
+                    temperature = temperature,
+                    early_stop_num=model.hz * model.max_sec,
+                    decode_info=decode_info,
+                    watchdog=decode_watchdog)
+        spans.add_decode(decode_info)
+
+        for phones2, pred_semantic, idx in zip(phones2_list, pred_semantic_list, idx_list):
+            # print(pred_semantic.shape,idx)
+            pred_semantic = pred_semantic[:, -idx:].unsqueeze(0)  # .unsqueeze(0)#mq要多unsqueeze一次
+            yield phones2, pred_semantic
+
+
+def get_tts_wav(ref_wav_path, prompt_text, prompt_language, text, text_language, top_k= 20, top_p = 0.6, temperature = 0.6, speed = 1, batch_size = 1, job = None, slot = None, media_type = None, spans = None, aux_refer_paths = None):
+    """
+    slot 为 model_pool 中的模型, 默认使用当前模型; 合成期间持有该模型, 切换模型不影响进行中的请求
+    spans 为记录各阶段耗时的 SpanRecorder, 默认每个请求新建; 请求结束 (含取消) 时写入 /metrics
+    aux_refer_paths 为辅助参考音频, 音色向量取与主参考音频的平均
+    """
+    if slot is None:
+        slot = model_pool.active
+    if spans is None:
+        spans = SpanRecorder()
+    try:
+        with slot.use() as model:
+            yield from get_tts_wav_with_model(model, ref_wav_path, prompt_text, prompt_language, text, text_language,
+                                              top_k, top_p, temperature, speed, batch_size, job, media_type, spans,
+                                              aux_refer_paths)
+    finally:
+        spans.observe()
+        logger.info(f"各阶段耗时: {spans.summary()}")
+        watchdog_stops = spans.watchdog_stops()
+        if watchdog_stops:
+            logger.warning(f"T2S解码看门狗提前结束了 {len(watchdog_stops)} 句 ({', '.join(watchdog_stops)}), 音频可能被截断: {text[:50]}")
+
+
+def get_tts_wav_with_model(model, ref_wav_path, prompt_text, prompt_language, text, text_language, top_k= 20, top_p = 0.6, temperature = 0.6, speed = 1, batch_size = 1, job = None, media_type = None, spans = None, aux_refer_paths = None):
+    vq_model, hps, t2s_model = model.vq_model, model.hps, model.t2s_model
+    if media_type is None:
+        media_type = default_media_type
+    if spans is None:
+        spans = SpanRecorder()
+    prompt_text = prompt_text.strip("\n")
+    prompt_language, text = prompt_language, text.strip("\n")
+    zero_wav = np.zeros(int(hps.data.sampling_rate * 0.3), dtype=np.float16 if is_half == True else np.float32)
+    prompt_language = dict_language[prompt_language.lower()]
+    text_language = dict_language[text_language.lower()]
+    # 文本前端显式传入版本, 不写 os.environ: 多个推理线程可能同时使用不同版本的模型
+    version = model.version
+    # 简单防止纯符号引发参考音频泄露
+    texts = [text for text in text.split("\n") if not only_punc(text)]
+    items = [(text, text_language) for text in texts]
+    if frontend_pool is not None and len(items) > 1:
+        # 第一组句子 (chunk 模式为一句, 否则为一个batch) 先过文本前端, 其余句子的清洗/g2p 在前端进程池中
+        # 与前面句子的解码同时进行, 解码到时再一起跑bert
+        head = 1 if stream_mode == "chunk" or model.onnx is not None else max(int(batch_size), 1)
+        prefetched = submit_frontend(items[head:], version)
+        frontend = get_phones_and_bert_batch([(prompt_text, prompt_language)] + items[:head], version, spans)
+        targets = PrefetchedTargets(
+            [(phones2, bert2) for phones2, bert2, norm_text2 in frontend[1:]],
+            lambda: [(phones2, bert2) for phones2, bert2, norm_text2 in
+                     get_phones_and_bert_batch(items[head:], version, spans, prefetched)],
+            len(items))
+    else:
+        # 参考文本与全部目标句子一起过文本前端, 中文片段合并为一次bert前向
+        frontend = get_phones_and_bert_batch([(prompt_text, prompt_language)] + items, version, spans)
+        targets = [(phones2, bert2) for phones2, bert2, norm_text2 in frontend[1:]]
+    with spans.span("refer"):
+        prompt_semantic, phones1, bert1, norm_text1, refer, ge = get_refer_features(model, ref_wav_path, prompt_text, prompt_language, frontend[0], spans)
+        if aux_refer_paths and ge is not None:
+            ge = get_averaged_ge(model, ref_wav_path, refer, aux_refer_paths)
+    # 整个请求共用一个编码器, 输出为一条连续的音频流
+    encoder = create_encoder(media_type, hps.data.sampling_rate, streaming=stream_mode != "close")
+    try:
+        if stream_mode == "chunk":
+            # 逐句逐窗口输出, 第一个窗口解码完即可返回音频
+            for phones2, bert2 in targets:
+                all_phoneme_ids, bert = prepare_t2s_input(phones2, bert2, phones1, bert1)
+                decode_info = {}
+                # infer_panel_generator 自带 no_grad, 生成器可能在不同线程中恢复执行
+                token_chunks = t2s_model.model.infer_panel_generator(
+                    all_phoneme_ids.unsqueeze(0),
+                    torch.tensor([all_phoneme_ids.shape[-1]]).to(device),
+                    prompt_semantic.unsqueeze(0).to(device),
+                    bert.unsqueeze(0),
+                    top_k = top_k,
+                    top_p = top_p,
+                    temperature = temperature,
+                    early_stop_num=model.hz * model.max_sec,
+                    chunk_length=chunk_size,
+                    decode_info=decode_info,
+                    watchdog=decode_watchdog)
+                for audio in stream_decode(vq_model, token_chunks, phones2, refer, speed, chunk_overlap, spans, ge):
+                    if job is not None:
+                        job.checkpoint()
+                    with spans.span("encode"):
+                        audio_chunk = encoder.write((audio * 32768).astype(np.int16))
+                    if audio_chunk:
+                        yield audio_chunk
+                spans.add_decode(decode_info)
+                with spans.span("encode"):
+                    audio_chunk = encoder.write((zero_wav * 32768).astype(np.int16))
+                if audio_chunk:
+                    yield audio_chunk
+            log_frontend_cache_stats()
+            with spans.span("encode"):
+                audio_chunk = encoder.close()
             yield audio_chunk
+            return
+
+        audio_chunks = []
+        token_stream = get_semantic_tokens(model, targets, prompt_semantic, phones1, bert1,
+                                           top_k, top_p, temperature, batch_size, job, spans)
+        if pipeline and len(targets) > 1:
+            # 后台线程先行解码后续句子的语义token, 当前线程做 SoVITS 解码与编码
+            token_stream = prefetch(token_stream, args.pipeline_depth, "t2s-pipeline")
+        for phones2, pred_semantic in token_stream:
+            if job is not None:
+                job.checkpoint()
+            audio_opt = []
+            # audio = vq_model.decode(pred_semantic, all_phoneme_ids, refer).detach().cpu().numpy()[0, 0]
+            with spans.span("sovits"):
+                if model.onnx is not None:
+                    # 导出的图按 speed=1 固定, onnx 后端不支持语速调节 (handle 对 speed != 1 的请求返回400)
+                    audio = model.onnx.decode(pred_semantic.numpy(), np.array([phones2], dtype=np.int64),
+                                              refer.float().cpu().numpy())
+                else:
+                    audio = \
+                        vq_model.decode(pred_semantic, torch.LongTensor(phones2).to(device).unsqueeze(0),
+                                        refer,speed=speed,ge=ge).detach().cpu().numpy()[
+                            0, 0]  ###试试重建不带上prompt部分
+            audio_opt.append(audio)
+            audio_opt.append(zero_wav)
+            with spans.span("encode"):
+                audio_chunk = encoder.write((np.concatenate(audio_opt, 0) * 32768).astype(np.int16))
+            if stream_mode == "normal":
+                if audio_chunk:
+                    yield audio_chunk
+            else:
+                audio_chunks.append(audio_chunk)
 
-    if not stream_mode == "normal":
-        if media_type == "wav":
-            audio_bytes = pack_wav(audio_bytes,hps.data.sampling_rate)
-        yield audio_bytes.getvalue()
-
+        log_frontend_cache_stats()
+        with spans.span("encode"):
+            audio_chunks.append(encoder.close())
+        yield b"".join(audio_chunks)
+    finally:
+        # 中途取消或出错时释放编码器 (ffmpeg进程等), 正常结束时为空操作
+        encoder.abort()
 
 
 def handle_control(command):
@@ -631,7 +1056,7 @@ def handle_control(command):
         exit(0)
 
 
-def handle_change(path, text, language):
+async def handle_change(path, text, language, warm=True):
     if is_empty(path, text, language):
         return JSONResponse({"code": 400, "message": '缺少任意一项以下参数: "path", "text", "language"'}, status_code=400)
 
@@ -646,34 +1071,357 @@ def handle_change(path, text, language):
     logger.info(f"当前默认参考音频文本: {default_refer.text}")
     logger.info(f"当前默认参考音频语种: {default_refer.language}")
     logger.info(f"is_ready: {default_refer.is_ready()}")
+    if warm and default_refer.is_ready():
+        # 参考音频特征提取 (cnhubert, refer编码) 在线程池中执行, 不阻塞事件循环
+        await asyncio.get_running_loop().run_in_executor(
+            None, warm_refer_cache, default_refer.path, default_refer.text, default_refer.language)
 
 
     return JSONResponse({"code": 0, "message": "Success"}, status_code=200)
 
 
-def handle(refer_wav_path, prompt_text, prompt_language, text, text_language, cut_punc, top_k, top_p, temperature, speed):
-    if (
-            refer_wav_path == "" or refer_wav_path is None
-            or prompt_text == "" or prompt_text is None
-            or prompt_language == "" or prompt_language is None
-    ):
-        refer_wav_path, prompt_text, prompt_language = (
-            default_refer.path,
-            default_refer.text,
-            default_refer.language,
-        )
-        if not default_refer.is_ready():
-            return JSONResponse({"code": 400, "message": "未指定参考音频且接口无预设"}, status_code=400)
+def to_bool(value) -> bool:
+    if isinstance(value, str):
+        return value.strip().lower() in ("1", "true", "yes", "on")
+    return bool(value)
+
+
+def get_audio_cache_key(slot, refer_wav_path, prompt_text, prompt_language, text, text_language, top_k, top_p, temperature, speed, media_type, aux_refer_paths=None):
+    """合成音频缓存的键: 文本, 参考音频, 采样参数, 模型权重哈希 (加载模型时算好) 与输出格式"""
+    sovits_fingerprint, gpt_fingerprint = slot.model.fingerprints
+    return make_audio_cache_key(
+        text=text,
+        text_language=text_language,
+        refer_wav_path=os.path.abspath(refer_wav_path),
+        refer_mtime=os.path.getmtime(refer_wav_path),
+        aux_refers=[[os.path.abspath(path), os.path.getmtime(path)] for path in aux_refer_paths or []],
+        prompt_text=prompt_text,
+        prompt_language=prompt_language,
+        top_k=top_k,
+        top_p=top_p,
+        temperature=temperature,
+        speed=speed,
+        sovits=sovits_fingerprint,
+        gpt=gpt_fingerprint,
+        media_type=media_type,
+        stream_mode=stream_mode,
+        backend=backend,
+        quantize=quantize,
+        decode_watchdog=(args.decode_tokens_per_phoneme, args.decode_loop_period) if decode_watchdog else None,
+    )
+
+
+def get_request_key(slot, refer_wav_path, prompt_text, prompt_language, text, text_language, top_k, top_p, temperature, speed, batch_size, media_type, aux_refer_paths, priority):
+    """
+    相同请求合并的键: 全部请求参数与所用模型; 只在请求进行期间使用, 模型按路径区分即可, 不计算权重哈希
+    优先级不同的请求不合并, interactive 请求不会等在 background 任务后面
+    """
+    return make_audio_cache_key(
+        text=text,
+        text_language=text_language,
+        refer_wav_path=os.path.abspath(refer_wav_path),
+        refer_mtime=os.path.getmtime(refer_wav_path),
+        aux_refers=[[os.path.abspath(path), os.path.getmtime(path)] for path in aux_refer_paths or []],
+        prompt_text=prompt_text,
+        prompt_language=prompt_language,
+        top_k=top_k,
+        top_p=top_p,
+        temperature=temperature,
+        speed=speed,
+        batch_size=batch_size,
+        media_type=media_type,
+        priority=priority,
+        model=slot.key,
+    )
+
+
+def find_voice(voice_id):
+    """按 voices_config 中的下标或 name 查找音色"""
+    if isinstance(voice_id, int) or (isinstance(voice_id, str) and voice_id.isdigit()):
+        index = int(voice_id)
+        return voices_config[index] if 0 <= index < len(voices_config) else None
+    for voice in voices_config:
+        if voice.get("name") == voice_id:
+            return voice
+    return None
+
+
+def get_voice_model_key(voice):
+    """音色对应的 (sovits_path, gpt_path), 未声明的一项沿用当前模型"""
+    active_sovits_path, active_gpt_path = model_pool.active.key
+    return voice.get("sovits_path") or active_sovits_path, voice.get("gpt_path") or active_gpt_path
+
+
+async def get_voice_slot(voice):
+    """音色所用模型在池中的 slot; 模型未常驻时在线程池中加载, 不阻塞事件循环"""
+    if voice is None:
+        return model_pool.active
+    key = get_voice_model_key(voice)
+    if key == model_pool.active.key:
+        return model_pool.active
+    return await asyncio.get_running_loop().run_in_executor(None, model_pool.get, key)
+
+
+def resolve_refer(refer_wav_path, prompt_text, prompt_language, voice_id):
+    """
+    请求实际使用的音色与参考音频: 参考音频三项未给全时, 指定了音色用音色的参考音频, 否则用默认参考音频
+    返回 ((voice, refer_wav_path, prompt_text, prompt_language), None), 参数无效时返回 (None, 400响应)
+    """
+    voice = None
+    if voice_id is not None and voice_id != "":
+        voice = find_voice(voice_id)
+        if voice is None:
+            return None, JSONResponse({"code": 400, "message": "无效的语音ID"}, status_code=400)
+    if not is_full(refer_wav_path, prompt_text, prompt_language):
+        if voice is not None:
+            refer_wav_path, prompt_text, prompt_language = voice.get("path"), voice.get("text"), voice.get("language")
+            if not is_full(refer_wav_path, prompt_text, prompt_language):
+                return None, JSONResponse({"code": 400, "message": f"音色 {voice_id} 缺少参考音频配置 (path/text/language)"}, status_code=400)
+        elif default_refer.is_ready():
+            refer_wav_path, prompt_text, prompt_language = default_refer.path, default_refer.text, default_refer.language
+        else:
+            return None, JSONResponse({"code": 400, "message": "未指定参考音频且接口无预设"}, status_code=400)
+    # 请求合并与音频缓存的键含参考音频的 mtime, 先确认文件存在
+    if not isinstance(refer_wav_path, str) or not os.path.isfile(refer_wav_path):
+        return None, JSONResponse({"code": 400, "message": f"参考音频不存在: {refer_wav_path}"}, status_code=400)
+    return (voice, refer_wav_path, prompt_text, prompt_language), None
+
+
+async def first_chunk_or_disconnect(chunks, request=None, poll_interval=0.5):
+    """
+    取音频流的第一段, 返回 (first_chunk, disconnected); 流为空时 first_chunk 为 None, 推理出错时抛出原异常
+    等待期间 (排队+首句推理) 定期检查客户端是否已断开; 断开或本协程被取消时取消取块, 流随之取消推理任务
+    """
+    task = asyncio.ensure_future(chunks.__anext__())
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=poll_interval)
+            if done:
+                break
+            if request is not None and await request.is_disconnected():
+                return None, True
+        try:
+            return task.result(), False
+        except StopAsyncIteration:
+            return None, False
+    finally:
+        if not task.done():
+            task.cancel()
+            await asyncio.wait({task})
+
+
+async def handle(refer_wav_path, prompt_text, prompt_language, text, text_language, cut_punc, top_k, top_p, temperature, speed, batch_size=None, cache=False, voice_id=None, media_type=None, aux_refer_wav_paths=None, priority=None, request=None):
+    if media_type is None or media_type == "":
+        media_type = default_media_type
+    elif media_type not in MEDIA_TYPES:
+        return JSONResponse({"code": 400, "message": f"不支持的音频格式: {media_type}"}, status_code=400)
+    if priority is None or priority == "":
+        priority = INTERACTIVE
+    elif priority not in PRIORITIES:
+        return JSONResponse({"code": 400, "message": f"不支持的优先级: {priority}"}, status_code=400)
+    if isinstance(aux_refer_wav_paths, str):
+        aux_refer_wav_paths = [aux_refer_wav_paths]
+    aux_refer_wav_paths = [path for path in aux_refer_wav_paths or [] if path]
+    if backend == "onnx" and float(speed) != 1:
+        return JSONResponse({"code": 400, "message": "onnx 后端不支持语速调节, speed 需为1"}, status_code=400)
+    if aux_refer_wav_paths:
+        if backend == "onnx":
+            return JSONResponse({"code": 400, "message": "onnx 后端不支持辅助参考音频"}, status_code=400)
+        missing = [path for path in aux_refer_wav_paths if not os.path.exists(path)]
+        if missing:
+            return JSONResponse({"code": 400, "message": f"辅助参考音频不存在: {', '.join(missing)}"}, status_code=400)
+    refer, error = resolve_refer(refer_wav_path, prompt_text, prompt_language, voice_id)
+    if error is not None:
+        return error
+    voice, refer_wav_path, prompt_text, prompt_language = refer
+
+    # 整个请求固定使用同一组模型: 指定了音色时用音色声明的模型, 否则用此刻的当前模型
+    try:
+        slot = await get_voice_slot(voice)
+    except Exception as e:
+        return JSONResponse({"code": 500, "message": f"音色模型加载失败: {e}"}, status_code=500)
 
     if cut_punc == None:
         text = cut_text(text,default_cut_punc)
     else:
         text = cut_text(text,cut_punc)
 
-    return StreamingResponse(get_tts_wav(refer_wav_path, prompt_text, prompt_language, text, text_language, top_k, top_p, temperature, speed), media_type="audio/"+media_type)
+    if batch_size is None:
+        batch_size = default_batch_size
+
+    audio_headers = stream_headers(media_type, slot.model.hps.data.sampling_rate)
+
+    # 采样带随机性, 只有请求显式带 cache=true 时才读写合成音频缓存
+    cache_key = None
+    if to_bool(cache) and audio_cache is not None:
+        cache_key = get_audio_cache_key(slot, refer_wav_path, prompt_text, prompt_language, text, text_language, top_k, top_p, temperature, speed, media_type, aux_refer_wav_paths)
+        # 磁盘缓存的读写在线程池中执行, 不阻塞事件循环
+        cached_audio = await asyncio.get_running_loop().run_in_executor(None, audio_cache.get, cache_key)
+        if cached_audio is not None:
+            return Response(cached_audio, media_type=content_type(media_type),
+                            headers={**audio_headers, "X-TTFB-Ms": "0.0", "X-Cache": "HIT"})
+
+    def synthesize(job):
+        return get_tts_wav(refer_wav_path, prompt_text, prompt_language, text, text_language, top_k, top_p, temperature, speed, batch_size, job, slot, media_type,
+                           aux_refer_paths=aux_refer_wav_paths)
+
+    t0 = ttime()
+    coalesced = False
+    try:
+        if coalescer is not None:
+            # 与进行中的相同请求合并, 共用一次推理的输出
+            request_key = get_request_key(slot, refer_wav_path, prompt_text, prompt_language, text, text_language, top_k, top_p, temperature, speed, batch_size, media_type, aux_refer_wav_paths, priority)
+            chunks, coalesced = coalescer.subscribe(request_key, lambda: scheduler.submit(synthesize, priority=priority))
+        else:
+            chunks = scheduler.submit(synthesize, priority=priority).stream()
+    except SchedulerFull:
+        return JSONResponse({"code": 503, "message": "推理队列已满, 请稍后重试"}, status_code=503)
+
+    # 先取出第一段音频再返回响应, 以便在响应头中给出首包耗时 (X-TTFB-Ms, 含排队时间);
+    # 此时还没有 StreamingResponse 接管流, 出错, 客户端断开或请求被取消时在这里关闭流并取消推理
+    try:
+        first_chunk, disconnected = await first_chunk_or_disconnect(chunks, request)
+    except Exception as e:
+        await chunks.aclose()
+        return JSONResponse({"code": 500, "message": f"合成失败: {type(e).__name__}: {e}"}, status_code=500)
+    except BaseException:
+        await chunks.aclose()
+        raise
+    if disconnected:
+        await chunks.aclose()
+        logger.info("客户端在首包前断开, 已取消合成")
+        return Response(status_code=499)
+    ttfb_ms = (ttime() - t0) * 1000
+
+    async def streaming():
+        # 客户端断开时该生成器被关闭, job.stream 随之取消推理任务
+        collected = []
+        try:
+            if first_chunk is not None:
+                collected.append(first_chunk)
+                yield first_chunk
+            async for chunk in chunks:
+                collected.append(chunk)
+                yield chunk
+            # 完整合成结束才写入缓存
+            if cache_key is not None:
+                await asyncio.get_running_loop().run_in_executor(None, audio_cache.put, cache_key, b"".join(collected))
+        finally:
+            await chunks.aclose()
+
+    headers = {**audio_headers, "X-TTFB-Ms": f"{ttfb_ms:.1f}"}
+    if cache_key is not None:
+        headers["X-Cache"] = "MISS"
+    if coalesced:
+        headers["X-Coalesced"] = "1"
+    return StreamingResponse(streaming(), media_type=content_type(media_type), headers=headers)
+
+
+async def prewarm(phrases, refer_wav_path, prompt_text, prompt_language, text_language, cut_punc, top_k, top_p, temperature, speed, voice_id=None):
+    """逐句合成并写入音频缓存, 已缓存的短语跳过"""
+    if audio_cache is None:
+        return JSONResponse({"code": 400, "message": "未启用合成音频缓存"}, status_code=400)
+    if backend == "onnx" and float(speed) != 1:
+        return JSONResponse({"code": 400, "message": "onnx 后端不支持语速调节, speed 需为1"}, status_code=400)
+    refer, error = resolve_refer(refer_wav_path, prompt_text, prompt_language, voice_id)
+    if error is not None:
+        return error
+    voice, refer_wav_path, prompt_text, prompt_language = refer
+
+    # 整个请求固定使用同一组模型: 指定了音色时用音色声明的模型, 否则用此刻的当前模型
+    try:
+        slot = await get_voice_slot(voice)
+    except Exception as e:
+        return JSONResponse({"code": 500, "message": f"音色模型加载失败: {e}"}, status_code=500)
+
+    media_type = default_media_type
+    result = {"cached": 0, "generated": 0, "failed": 0}
+    for phrase in phrases:
+        text = cut_text(phrase, default_cut_punc if cut_punc is None else cut_punc)
+        cache_key = get_audio_cache_key(slot, refer_wav_path, prompt_text, prompt_language, text, text_language, top_k, top_p, temperature, speed, media_type)
+        if cache_key in audio_cache:
+            result["cached"] += 1
+            continue
+
+        def synthesize(job, text=text):
+            return get_tts_wav(refer_wav_path, prompt_text, prompt_language, text, text_language, top_k, top_p, temperature, speed, default_batch_size, job, slot)
+
+        try:
+            job = scheduler.submit(synthesize, priority=BACKGROUND)
+            audio = b"".join([chunk async for chunk in job.stream()])
+        except Exception as e:
+            logger.warning(f"预热失败: {phrase} ({e})")
+            result["failed"] += 1
+            continue
+        await asyncio.get_running_loop().run_in_executor(None, audio_cache.put, cache_key, audio)
+        result["generated"] += 1
+    return JSONResponse({"code": 0, "message": "Success", **result}, status_code=200)
+
+
+
 
+def startup_phase(name):
+    """启动期间计入启动阶段耗时, 就绪后 (切换模型等) 不再记录"""
+    return startup.phase(name) if not startup.ready else nullcontext()
 
 
+def load_bert():
+    global bert_encoder
+    with startup.phase("bert"):
+        tokenizer = AutoTokenizer.from_pretrained(bert_path)
+        model = AutoModelForMaskedLM.from_pretrained(bert_path)
+        model = model.half().to(device) if is_half else model.to(device)
+        if quantize:
+            model = quantize_bert(model, bert_path, logger)
+        bert_encoder = BertEncoder(tokenizer, model, device)
+
+
+def load_cnhubert():
+    global ssl_model
+    with startup.phase("cnhubert"):
+        cnhubert.cnhubert_base_path = cnhubert_base_path
+        model = cnhubert.get_model()
+        ssl_model = model.half().to(device) if is_half else model.to(device)
+
+
+def start_frontend_pool():
+    """文本前端进程池: 清洗/g2p 在独立进程中执行, 不与推理线程争抢GIL; 主进程退出时工作进程读到 stdin 结束后自行退出"""
+    global frontend_pool
+    with startup.phase("frontend_pool"):
+        languages = [language.strip() for language in args.frontend_languages.split(",") if language.strip()]
+        pool = FrontendPool(args.frontend_workers, now_dir, logger, languages)
+        pool.wait_ready()
+    frontend_pool = pool
+    logger.info(f"文本前端进程池: {pool.size} 个进程, 已预热 {', '.join(pool.languages) or '无'}")
+
+
+def load_models():
+    """
+    启动线程: bert, cnhubert, SoVITS/GPT 与前端进程池在线程中并行加载 (torch 加载权重时释放GIL),
+    模型预热等 bert/cnhubert 加载完成后进行; 全部完成后标记就绪, 失败时退出进程
+    """
+    try:
+        with ThreadPoolExecutor(4, thread_name_prefix="tts-startup") as executor:
+            encoders = [executor.submit(load_bert), executor.submit(load_cnhubert)]
+            if args.frontend_workers > 0:
+                encoders.append(executor.submit(start_frontend_pool))
+            voice = executor.submit(model_pool.activate, (sovits_path, gpt_path), False)
+            try:
+                for future in encoders:
+                    future.result()
+            finally:
+                encoders_ready.set()
+            voice.result()
+        if default_refer.is_ready():
+            with startup.phase("refer"):
+                warm_refer_cache(default_refer.path, default_refer.text, default_refer.language)
+        startup.set_ready()
+    except Exception as e:
+        traceback.print_exc()
+        startup.set_failed(e)
+        if __name__ == "__main__":
+            os.kill(os.getpid(), signal.SIGTERM)
+
 
 # --------------------------------
 # 初始化部分
@@ -725,12 +1473,38 @@ parser.add_argument("-fp", "--full_precision", action="store_true", default=Fals
 parser.add_argument("-hp", "--half_precision", action="store_true", default=False, help="覆盖config.is_half为True, 使用半精度")
 # bool值的用法为 `python ./api.py -fp ...`
 # 此时 full_precision==True, half_precision==False
-parser.add_argument("-sm", "--stream_mode", type=str, default="close", help="流式返回模式, close / normal / keepalive")
-parser.add_argument("-mt", "--media_type", type=str, default="wav", help="音频编码格式, wav / ogg / aac")
+parser.add_argument("-sm", "--stream_mode", type=str, default="close", help="流式返回模式, close / normal / chunk / keepalive")
+parser.add_argument("--chunk_size", type=int, default=24, help="chunk流式模式下每个窗口的语义token数 (25个约1秒)")
+parser.add_argument("--chunk_overlap", type=int, default=4, help="chunk流式模式下窗口向前重叠的语义token数")
+parser.add_argument("-mt", "--media_type", type=str, default="", help="音频编码格式, wav / ogg / aac / pcm_s16le, 流式默认ogg, 非流式默认wav")
 parser.add_argument("-cp", "--cut_punc", type=str, default="", help="文本切分符号设定, 符号范围,.;?!、，。？！；：…")
 # 切割常用分句符为 `python ./api.py -cp ".?!。？！"`
 parser.add_argument("-hb", "--hubert_path", type=str, default=g_config.cnhubert_path, help="覆盖config.cnhubert_path")
 parser.add_argument("-b", "--bert_path", type=str, default=g_config.bert_path, help="覆盖config.bert_path")
+parser.add_argument("-bs", "--batch_size", type=int, default=1, help="多句一起解码的句数, 请求可用batch_size覆盖")
+parser.add_argument("-w", "--workers", type=int, default=1, help="推理工作线程数")
+parser.add_argument("--pipeline", action="store_true", default=False, help="T2S解码与SoVITS解码两级流水线并行")
+parser.add_argument("--pipeline_depth", type=int, default=2, help="流水线中最多提前解码的句数")
+parser.add_argument("--no_coalesce", action="store_true", default=False, help="不合并参数相同的并发请求, 每个请求单独推理")
+parser.add_argument("--no_preempt", action="store_true", default=False, help="background 请求不在句子边界让出给 interactive 请求")
+parser.add_argument("-q", "--queue_size", type=int, default=16, help="推理请求队列长度, 队列满时返回503")
+parser.add_argument("--audio_cache_dir", type=str, default="cache/audio", help="合成音频缓存目录, 为空则不启用")
+parser.add_argument("--audio_cache_size", type=int, default=512, help="合成音频磁盘缓存上限(MB)")
+parser.add_argument("--audio_cache_memory", type=int, default=64, help="合成音频内存缓存上限(MB)")
+parser.add_argument("--warmup", type=str, nargs="*", default=[], help="模型加载后预热合成的短语 (语种自动识别), 默认 \"你好。\"")
+parser.add_argument("--frontend_workers", type=int, default=0, help="文本前端 (清洗/g2p) 进程数, 0为在推理线程中计算")
+parser.add_argument("--frontend_languages", type=str, default="zh,en", help="文本前端进程启动时预热的语种, 逗号分隔 (zh/en/ja/ko/yue)")
+parser.add_argument("--frontend_cache_size", type=int, default=512, help="文本前端(phones/bert)缓存条数, 0为不缓存")
+parser.add_argument("--max_models", type=int, default=2, help="常驻内存的 SoVITS/GPT 模型组数, 切换到常驻模型无需重新加载")
+parser.add_argument("--model_memory", type=int, default=0, help="常驻模型的内存预算(MB), 超出时淘汰最久未用的模型, 0为不限制")
+parser.add_argument("--refer_cache_size", type=int, default=8, help="参考音频特征缓存条数, 0为不缓存")
+parser.add_argument("--backend", type=str, default="torch", help="T2S解码与SoVITS解码的推理后端, torch / onnx")
+parser.add_argument("--onnx_dir", type=str, default="onnx", help="onnx_export.py 的输出根目录, 按SoVITS文件名查找子目录")
+parser.add_argument("--onnx_threads", type=int, default=0, help="onnxruntime 单个算子的线程数, 0为按CPU核数")
+parser.add_argument("--onnx_inter_threads", type=int, default=1, help="onnxruntime 图中并行分支的线程数")
+parser.add_argument("--quantize", type=str, default="", help="int8: CPU全精度推理时对T2S与bert的线性层做动态量化")
+parser.add_argument("--decode_tokens_per_phoneme", type=float, default=0, help="T2S每个音素最多生成的语义token数, 0为不限制 (建议12)")
+parser.add_argument("--decode_loop_period", type=int, default=0, help="T2S循环检测的最大周期, 0为不检测 (建议40)")
 
 args = parser.parse_args()
 sovits_path = args.sovits_path
@@ -741,6 +1515,7 @@ host = args.bind_addr
 cnhubert_base_path = args.hubert_path
 bert_path = args.bert_path
 default_cut_punc = args.cut_punc
+default_batch_size = args.batch_size
 
 # 应用参数配置
 default_refer = DefaultRefer(args.default_refer_path, args.default_refer_text, args.default_refer_language)
@@ -772,36 +1547,102 @@ if args.full_precision and args.half_precision:
     is_half = g_config.is_half  # 炒饭fallback
 logger.info(f"半精: {is_half}")
 
+# int8 动态量化, 只用于CPU全精度推理
+quantize = args.quantize.lower() == "int8"
+if quantize and (is_half or device != "cpu"):
+    logger.warning("int8 动态量化只支持CPU全精度推理 (-d cpu -fp), 已忽略 --quantize")
+    quantize = False
+elif quantize:
+    logger.info("T2S与bert使用int8动态量化")
+
+# T2S 解码看门狗: 按音素数限制token数, 检测循环; 会截断音频, 默认关闭
+decode_watchdog = DecodeWatchdog(tokens_per_phoneme=max(args.decode_tokens_per_phoneme, 0),
+                                 max_period=max(args.decode_loop_period, 0))
+if decode_watchdog.enabled:
+    logger.info(f"T2S解码看门狗已开启: 每音素最多 {decode_watchdog.tokens_per_phoneme or '不限'} token, "
+                f"循环检测周期 {decode_watchdog.max_period or '不检测'}")
+else:
+    decode_watchdog = None
+
 # 流式返回模式
 if args.stream_mode.lower() in ["normal","n"]:
     stream_mode = "normal"
     logger.info("流式返回已开启")
+elif args.stream_mode.lower() == "chunk":
+    stream_mode = "chunk"
+    logger.info(f"低延迟流式返回已开启, 窗口 {args.chunk_size} token, 重叠 {args.chunk_overlap} token")
 else:
     stream_mode = "close"
 
+# 推理后端
+backend = "onnx" if args.backend.lower() == "onnx" else "torch"
+if backend == "onnx":
+    logger.info(f"推理后端: onnxruntime (CPU), 线程 {args.onnx_threads or '自动'}/{args.onnx_inter_threads}")
+    if stream_mode == "chunk":
+        stream_mode = "normal"
+        logger.warning("onnx 后端不支持 chunk 流式模式, 改为 normal")
+chunk_size = max(args.chunk_size, 1)
+chunk_overlap = max(args.chunk_overlap, 1)
+
+# T2S/SoVITS 两级流水线, chunk 模式本身已逐窗口交替解码, 不使用
+pipeline = args.pipeline
+if pipeline and stream_mode == "chunk":
+    pipeline = False
+    logger.warning("chunk 流式模式不使用两级流水线, 已忽略 --pipeline")
+elif pipeline:
+    logger.info(f"T2S/SoVITS 两级流水线已开启, 最多提前 {max(args.pipeline_depth, 1)} 句")
+
 # 音频编码格式
-if args.media_type.lower() in ["aac","ogg"]:
-    media_type = args.media_type.lower()
+if args.media_type.lower() in MEDIA_TYPES:
+    default_media_type = args.media_type.lower()
 elif stream_mode == "close":
-    media_type = "wav"
+    default_media_type = "wav"
 else:
-    media_type = "ogg"
-logger.info(f"编码格式: {media_type}")
-
-# 初始化模型
-cnhubert.cnhubert_base_path = cnhubert_base_path
-tokenizer = AutoTokenizer.from_pretrained(bert_path)
-bert_model = AutoModelForMaskedLM.from_pretrained(bert_path)
-ssl_model = cnhubert.get_model()
-if is_half:
-    bert_model = bert_model.half().to(device)
-    ssl_model = ssl_model.half().to(device)
+    default_media_type = "ogg"
+logger.info(f"编码格式: {default_media_type}")
+
+# 预热短语: 每组模型加载后先合成一遍
+warmup_phrases = [phrase for phrase in args.warmup if phrase.strip()] or ["你好。"]
+
+# 启动状态: HTTP 服务先开始监听, 模型在 tts-startup 线程中加载, 预热完成前 /ready 返回503
+startup = StartupState(logger, startup_t0)
+startup.add("imports", perf_counter() - startup_t0)
+bert_encoder = None  # tokenizer 与 bert_model, 分词与前向在锁内串行
+ssl_model = None
+frontend_pool = None
+encoders_ready = threading.Event()  # bert/cnhubert 加载结束 (成功或失败)
+
+# 文本前端缓存, 参考文本与重复出现的句子不再重复分词/g2p/跑bert
+phones_bert_cache = LRUCache(args.frontend_cache_size)
+frontend_saved_seconds = Counter("tts_frontend_cache_saved_seconds_total", "文本前端缓存命中节省的计算时间")
+
+# 参考音频特征缓存
+refer_cache = LRUCache(args.refer_cache_size)
+
+# 常驻模型池: 最多保留 max_models 组 SoVITS/GPT 模型 (且总大小不超过 model_memory), 切换时后台加载预热后再替换当前模型
+# cnhubert 与 bert 为全局共享, 不随音色重复加载
+model_pool = ModelPool(load_voice_model, args.max_models, warmup=warmup_voice_model,
+                       on_release=release_voice_model, logger=logger,
+                       memory_budget=args.model_memory * 1024 * 1024, size_fn=voice_model_bytes)
+
+# 合成音频缓存, 请求带 cache=true 时使用
+if args.audio_cache_dir:
+    audio_cache = AudioCache(args.audio_cache_dir, args.audio_cache_size * 1024 * 1024, args.audio_cache_memory * 1024 * 1024)
+    logger.info(f"合成音频缓存: {args.audio_cache_dir}, 已有 {audio_cache.stats()['entries']} 条")
 else:
-    bert_model = bert_model.to(device)
-    ssl_model = ssl_model.to(device)
-change_sovits_weights(sovits_path)
-change_gpt_weights(gpt_path)
+    audio_cache = None
+
+# 推理调度: 请求进入有界队列, 由工作线程执行; SoVITS/GPT/cnhubert 在no_grad推理下只读, 各线程共用,
+# 非线程安全的部分 (bert 的 fast tokenizer, LangSegment 与 g2p 模块的全局状态) 在锁内串行
+scheduler = InferenceScheduler(args.workers, args.queue_size, preemption=not args.no_preempt)
+scheduler.start()
+logger.info(f"推理工作线程: {scheduler.num_workers}, 队列长度: {args.queue_size}")
+
+# 相同请求合并: 进行中的请求与新到的相同请求共用一次推理
+coalescer = None if args.no_coalesce else RequestCoalescer()
 
+# 模型在后台加载, 不阻塞 HTTP 服务开始监听
+threading.Thread(target=load_models, name="tts-startup", daemon=True).start()
 
 
 
@@ -818,6 +1659,27 @@ app.add_middleware(
     allow_headers=["*"],  # 允许的请求头
 )
 
+# 启动完成前只开放存活/就绪检查与指标, 其余接口返回503
+STARTUP_PATHS = {"/live", "/ready", "/metrics"}
+
+
+class ReadyGate:
+    """纯ASGI中间件, 不包装流式响应 (客户端断开时的取消照常传到推理任务)"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and not startup.ready and scope["path"] not in STARTUP_PATHS:
+            message = "服务启动失败" if startup.error else "服务启动中"
+            response = JSONResponse({"code": 503, "message": message, **startup.status()}, status_code=503)
+            await response(scope, receive, send)
+            return
+        await self.app(scope, receive, send)
+
+
+app.add_middleware(ReadyGate)
+
 # 添加语音配置文件路径
 VOICES_CONFIG_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "voices_config.json")
 
@@ -844,22 +1706,103 @@ async def select_voice_get(id: int):
         return JSONResponse({"code": 400, "message": "无效的语音ID"}, status_code=400)
 
     voice = voices_config[id]
-    return handle_change(voice.get("path"), voice.get("text"), voice.get("language"))
+    if not (voice.get("sovits_path") or voice.get("gpt_path")):
+        return await handle_change(voice.get("path"), voice.get("text"), voice.get("language"))
+
+    # 音色声明了自己的模型时, 在后台切换当前模型; 参考音频缓存按模型区分, 切换完成后再用新模型预热
+    response = await handle_change(voice.get("path"), voice.get("text"), voice.get("language"), warm=False)
+    refer = (default_refer.path, default_refer.text, default_refer.language) if default_refer.is_ready() else None
+
+    def warm(slot):
+        if refer is not None:
+            warm_refer_cache(*refer, slot=slot)
+
+    model_pool.activate(get_voice_model_key(voice), callback=warm)
+    return response
+
+
+@app.get("/live")
+async def live():
+    """存活检查: 进程在运行即返回200, 不表示模型已加载"""
+    return {"code": 0, "message": "alive"}
+
+
+@app.get("/ready")
+async def ready():
+    """就绪检查: 模型加载预热完成返回200, 启动中或启动失败返回503; 附各启动阶段耗时"""
+    return JSONResponse(startup.status(), status_code=200 if startup.ready else 503)
+
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus 格式的服务指标: 队列深度, 排队等待时间, 推理耗时等"""
+    return Response(METRICS_REGISTRY.render(), media_type=METRICS_CONTENT_TYPE)
+
+
+@app.get("/refer_cache")
+async def refer_cache_stats():
+    """参考音频特征缓存的命中/未命中统计"""
+    return refer_cache.stats()
+
+
+@app.get("/frontend_cache")
+async def frontend_cache_stats():
+    """文本前端(phones/bert)缓存的命中统计与累计节省时间"""
+    return {**phones_bert_cache.stats(), "saved_ms": round(frontend_saved_seconds.value() * 1000, 1)}
+
+
+@app.get("/audio_cache")
+async def audio_cache_stats():
+    """合成音频缓存统计"""
+    if audio_cache is None:
+        return JSONResponse({"code": 400, "message": "未启用合成音频缓存"}, status_code=400)
+    return audio_cache.stats()
+
+
+@app.post("/prewarm")
+async def prewarm_endpoint(request: Request):
+    json_post_raw = await request.json()
+    return await prewarm(
+        json_post_raw.get("phrases") or [],
+        json_post_raw.get("refer_wav_path"),
+        json_post_raw.get("prompt_text"),
+        json_post_raw.get("prompt_language"),
+        json_post_raw.get("text_language"),
+        json_post_raw.get("cut_punc"),
+        json_post_raw.get("top_k", 10),
+        json_post_raw.get("top_p", 1.0),
+        json_post_raw.get("temperature", 1.0),
+        json_post_raw.get("speed", 1.0),
+        json_post_raw.get("voice_id")
+    )
 
 
 @app.post("/set_model")
 async def set_model(request: Request):
     json_post_raw = await request.json()
-    global gpt_path
-    gpt_path=json_post_raw.get("gpt_model_path")
-    global sovits_path
-    sovits_path=json_post_raw.get("sovits_model_path")
+    active_sovits_path, active_gpt_path = model_pool.active.key
+    gpt_path = json_post_raw.get("gpt_model_path") or active_gpt_path
+    sovits_path = json_post_raw.get("sovits_model_path") or active_sovits_path
+    for path in (gpt_path, sovits_path):
+        if not os.path.exists(path):
+            return JSONResponse({"code": 400, "message": f"模型文件不存在: {path}"}, status_code=400)
     logger.info("gptpath"+gpt_path+";vitspath"+sovits_path)
-    change_sovits_weights(sovits_path)
-    change_gpt_weights(gpt_path)
+    # 新模型在后台加载预热, 期间请求继续由当前模型处理; wait=true 时等切换完成再返回
+    done = model_pool.activate((sovits_path, gpt_path))
+    if to_bool(json_post_raw.get("wait", False)):
+        await asyncio.get_running_loop().run_in_executor(None, done.wait)
+        error = model_pool.last_error((sovits_path, gpt_path))
+        if model_pool.active.key != (sovits_path, gpt_path):
+            return JSONResponse({"code": 500, "message": f"模型加载失败: {error}"}, status_code=500)
     return "ok"
 
 
+@app.get("/models")
+async def models_status():
+    """常驻模型池状态: 当前模型, 常驻模型及其进行中的请求数, 正在加载的模型"""
+    return model_pool.status()
+
+
 @app.post("/control")
 async def control(request: Request):
     json_post_raw = await request.json()
@@ -874,7 +1817,7 @@ async def control(command: str = None):
 @app.post("/change_refer")
 async def change_refer(request: Request):
     json_post_raw = await request.json()
-    return handle_change(
+    return await handle_change(
         json_post_raw.get("refer_wav_path"),
         json_post_raw.get("prompt_text"),
         json_post_raw.get("prompt_language")
@@ -887,13 +1830,13 @@ async def change_refer(
         prompt_text: str = None,
         prompt_language: str = None
 ):
-    return handle_change(refer_wav_path, prompt_text, prompt_language)
+    return await handle_change(refer_wav_path, prompt_text, prompt_language)
 
 
 @app.post("/")
 async def tts_endpoint(request: Request):
     json_post_raw = await request.json()
-    return handle(
+    return await handle(
         json_post_raw.get("refer_wav_path"),
         json_post_raw.get("prompt_text"),
         json_post_raw.get("prompt_language"),
@@ -903,12 +1846,20 @@ async def tts_endpoint(request: Request):
         json_post_raw.get("top_k", 10),
         json_post_raw.get("top_p", 1.0),
         json_post_raw.get("temperature", 1.0),
-        json_post_raw.get("speed", 1.0)
+        json_post_raw.get("speed", 1.0),
+        json_post_raw.get("batch_size"),
+        json_post_raw.get("cache", False),
+        json_post_raw.get("voice_id"),
+        json_post_raw.get("media_type"),
+        json_post_raw.get("aux_refer_wav_paths"),
+        json_post_raw.get("priority"),
+        request
     )
 
 
 @app.get("/")
 async def tts_endpoint(
+        request: Request,
         refer_wav_path: str = None,
         prompt_text: str = None,
         prompt_language: str = None,
@@ -918,9 +1869,14 @@ async def tts_endpoint(
         top_k: int = 10,
         top_p: float = 1.0,
         temperature: float = 1.0,
-        speed: float = 1.0
+        speed: float = 1.0,
+        batch_size: int = None,
+        cache: bool = False,
+        voice_id: str = None,
+        media_type: str = None,
+        priority: str = None
 ):
-    return handle(refer_wav_path, prompt_text, prompt_language, text, text_language, cut_punc, top_k, top_p, temperature, speed)
+    return await handle(refer_wav_path, prompt_text, prompt_language, text, text_language, cut_punc, top_k, top_p, temperature, speed, batch_size, cache, voice_id, media_type, priority=priority, request=request)
 
 
 if __name__ == "__main__":